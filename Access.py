@@ -1,27 +1,162 @@
+import os
+
+# -----------------------------
+# PROVIDER HOSTS (overridable, e.g. to run against benchmarks/mock_providers.py)
+# -----------------------------
+# SPOTS_PROVIDER_URL points every provider at one base URL (http://127.0.0.1:8765);
+# the per-provider variables win over it.
+_PROVIDER_URL = os.environ.get("SPOTS_PROVIDER_URL")
+DAT_IDENTITY_HOST = os.environ.get("SPOTS_DAT_IDENTITY_URL", _PROVIDER_URL or "https://identity.api.dat.com")
+DAT_ANALYTICS_HOST = os.environ.get("SPOTS_DAT_ANALYTICS_URL", _PROVIDER_URL or "https://analytics.api.dat.com")
+GOOGLE_ROUTES_HOST = os.environ.get("SPOTS_GOOGLE_ROUTES_URL", _PROVIDER_URL or "https://routes.googleapis.com")
+GS_API_HOST = os.environ.get("SPOTS_GS_API_URL", _PROVIDER_URL or "https://api.greenscreens.ai")
 
 # -----------------------------
 # DAT API URLs
 # -----------------------------
-org_url = "https://identity.api.dat.com/access/v1/token/organization"
-user_url = "https://identity.api.dat.com/access/v1/token/user"
+org_url = f"{DAT_IDENTITY_HOST}/access/v1/token/organization"
+user_url = f"{DAT_IDENTITY_HOST}/access/v1/token/user"
 
 #DAT RATE, MILES, MCI
-url_spot = "https://analytics.api.dat.com/linehaulrates/v1/lookups"
-url_forecast = "https://analytics.api.dat.com/linehaulrates/v1/forecasts/spot"
-url_MCI = "https://analytics.api.dat.com/marketconditions/v1/marketConditionsIndexes"
+url_spot = f"{DAT_ANALYTICS_HOST}/linehaulrates/v1/lookups"
+url_forecast = f"{DAT_ANALYTICS_HOST}/linehaulrates/v1/forecasts/spot"
+url_MCI = f"{DAT_ANALYTICS_HOST}/marketconditions/v1/marketConditionsIndexes"
 
 # -----------------------------
 # Google Maps API URL
 # -----------------------------
-base_url = "https://routes.googleapis.com/directions/v2:computeRoutes"
+base_url = f"{GOOGLE_ROUTES_HOST}/directions/v2:computeRoutes"
 
 # -----------------------------
 # GREENSCREENS API URL
 # -----------------------------
 
 GS_CLIENT_ID = "directtrafficsolutions"     # client_id
-GS_AUTH_URL = "https://api.greenscreens.ai/v1/auth/token"
-GS_PREDICT_URL = "https://api.greenscreens.ai/v3/prediction/rates"
+GS_AUTH_URL = f"{GS_API_HOST}/v1/auth/token"
+GS_PREDICT_URL = f"{GS_API_HOST}/v3/prediction/rates"
+
+
+
+
+
+# -----------------------------
+# HTTP CONNECTION POOLS
+# -----------------------------
+# One keep-alive pool per provider host, shared by every session in the process
+HTTP_POOL_MAXSIZE = 10          # default connections kept open per host
+HTTP_POOL_BLOCK = False         # True = wait for a free connection instead of opening extra ones
+HTTP_POOL_LIMITS = {            # per-host overrides of HTTP_POOL_MAXSIZE
+    "identity.api.dat.com": 2,
+    "analytics.api.dat.com": 20,
+    "api.greenscreens.ai": 10,
+    "routes.googleapis.com": 10,
+}
+
+
+# -----------------------------
+# HTTP TIMEOUTS, RETRIES AND HEDGING
+# -----------------------------
+HTTP_DEFAULT_TIMEOUT = (3.05, 15)   # (connect, read) seconds for hosts not listed below
+HTTP_TIMEOUTS = {                   # per-host (connect, read) overrides
+    "identity.api.dat.com": (3.05, 10),
+    "analytics.api.dat.com": (3.05, 20),    # batched lookups and 52-week forecasts
+    "api.greenscreens.ai": (3.05, 10),
+    "routes.googleapis.com": (3.05, 10),
+}
+HTTP_MAX_RETRIES = 2            # extra attempts on HTTP_RETRY_STATUSES and connection errors/timeouts
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_BACKOFF_BASE = 0.5         # seconds; retry n waits random(0, base * 2**n) (full jitter)
+HTTP_BACKOFF_MAX = 4.0          # cap on a single backoff, Retry-After included
+HTTP_HEDGE_HOSTS = ()           # hosts that get a duplicate request once a call outlives their p95, e.g. ("analytics.api.dat.com",)
+HTTP_HEDGE_MIN_SAMPLES = 20     # successful calls seen before a host's p95 is trusted
+
+
+# -----------------------------
+# QUOTE DEADLINE
+# -----------------------------
+QUOTE_DEADLINE_SECONDS = 25     # budget for all provider calls of one interactive quote
+QUOTE_OPTIONAL_PROVIDERS = ("gs",)  # skipped (100% DAT) rather than waited for
+QUOTE_OPTIONAL_GRACE = 2.0      # seconds an optional provider may lag behind the required ones
+
+
+# -----------------------------
+# PERFORMANCE METRICS
+# -----------------------------
+PERF_METRICS_PORT = None        # e.g. 9464 to serve Prometheus text at http://127.0.0.1:9464/metrics
+PERF_METRICS_FILE = None        # e.g. "spots_metrics.prom", rewritten after every quote (textfile collector)
+PERF_TRACES_KEPT = 10           # quote traces kept per session for the sidebar perf panel
+
+
+# -----------------------------
+# PROVIDER CASSETTES (record / replay provider traffic)
+# -----------------------------
+CASSETTE_MODE = os.environ.get("SPOTS_CASSETTE_MODE")      # "record", "replay" or None (live calls)
+CASSETTE_PATH = os.environ.get("SPOTS_CASSETTE", "cassettes/providers.jsonl.gz")   # keep out of git
+CASSETTE_LATENCY = os.environ.get("SPOTS_CASSETTE_LATENCY", "recorded")  # replay: "recorded" or "zero"
+CASSETTE_REDACT_FIELDS = (      # never written to a cassette (request/response bodies, query strings)
+    "username", "password", "client_secret", "accessToken", "access_token", "refresh_token",
+)
+CASSETTE_IGNORED_FIELDS = ("pickupDateTime",)  # left out of request matching (change on every call)
+CASSETTE_TIME_FIELDS = ("expiresWhen",)        # absolute expiries, moved forward on replay
+
 
+# -----------------------------
+# DAT TOKEN BROKER
+# -----------------------------
+DAT_TOKEN_REFRESH_MARGIN = 300  # seconds before expiry to refresh in the background
+DAT_TOKEN_DEFAULT_TTL = 1800    # seconds, used when DAT does not return expiresWhen
+DAT_TOKEN_CACHE_PATH = None     # e.g. ".dat_token.json" to survive restarts (keep out of git)
+
+
+# -----------------------------
+# GREENSCREENS TOKEN CACHE
+# -----------------------------
+GS_TOKEN_REFRESH_MARGIN = 60    # seconds before expires_in runs out to re-authenticate
+
+
+# -----------------------------
+# DAT LOOKUP CACHE
+# -----------------------------
+DAT_CACHE_TTL = 900             # seconds a DAT lookup answer is reused for the same lane
+DAT_CACHE_NO_RATES_TTL = 120    # seconds a "No rates available" answer is reused
+DAT_CACHE_MAXSIZE = 2048        # entries kept before least-recently-used eviction
+DAT_FORECAST_CACHE_TTL = 21600  # seconds a 52-week lane forecast is reused (every horizon is served from it)
+DAT_FORECAST_CACHE_MAXSIZE = 512
+
+
+# -----------------------------
+# MCI CACHE
+# -----------------------------
+MCI_ROLLOVER_HOUR_UTC = 10      # hour (UTC) DAT publishes the new PREVIOUS_BUSINESS_DAY scores
 
 
+# -----------------------------
+# GOOGLE ROUTE DISTANCE STORE
+# -----------------------------
+ROUTE_CACHE_PATH = "route_cache.sqlite3"    # per-leg road distances, kept across restarts
+
+
+# -----------------------------
+# QUOTE STORE
+# -----------------------------
+QUOTE_STORE_PATH = "quotes.sqlite3"        # every quote priced, with inputs and provider snapshot (append-only)
+QUOTE_HISTORY_PAGE_SIZE = 10               # quotes per sidebar history page
+
+
+# -----------------------------
+# BULK RFP PRICING
+# -----------------------------
+BULK_DAT_BATCH_SIZE = 25        # lanes per batched DAT lookup request
+BULK_LANE_WORKERS = 8           # lanes priced at the same time
+BULK_PROVIDER_CONCURRENCY = {   # max in-flight calls per provider during a bulk run
+    "dat": 6,
+    "mci": 6,
+    "gs": 4,
+    "google_miles": 4,
+}
+
+# -----------------------------
+# ZIP GAZETTEER (offline ZIP -> city/state/lat/lon/market area)
+# -----------------------------
+ZIP_GAZETTEER_PATH = "zip_gazetteer.bin"    # built with: python utils_geo.py build zips.csv zip_gazetteer.bin
+ROAD_CIRCUITY = 1.2             # road miles per straight-line mile for the distance estimate
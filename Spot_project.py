@@ -1,953 +1,145 @@
 # -----------------------------
 # LIBRARIES
 # -----------------------------
-import requests  # For making API requests (DAT and Google Maps)
 import streamlit as st  # For Streamlit app interface
-from datetime import datetime, timezone
-from collections import defaultdict
-import statistics
-import logging
+import pandas as pd
+import numpy as np
+import time
+import uuid
+from datetime import datetime
 
 # -----------------------------
 # CONNECTIONS / CONFIG IMPORTS
 # -----------------------------
-from Access import user_url, org_url, url_spot, base_url,url_forecast, url_MCI, GS_CLIENT_ID, GS_AUTH_URL, GS_PREDICT_URL
-from utils_parse import parse_location_string_spots,parse_location_string_contract, parse_locations, round_to_nearest_5
+from utils_parse import parse_locations, parse_bulk_lanes, iter_vooma_loads
+from pricing_engine import engine_from_secrets, forecast_months_to_selected, market_snapshot_key, CUSTOMERS, EQUIPMENT_TYPES  # Providers + pricing math, no Streamlit
+from pricing_engine import price_routes_batch, customer_rates
+from utils_perf import start_trace, span, start_metrics_server, write_metrics_file
+from utils_quotes import get_quote_store
+from Access import PERF_METRICS_PORT, PERF_METRICS_FILE, PERF_TRACES_KEPT, QUOTE_STORE_PATH, QUOTE_HISTORY_PAGE_SIZE
+from Access import DAT_CACHE_TTL
+
 
 # -----------------------------
-# Google Maps API Credentials
+# PRICING ENGINE (API credentials from st.secrets)
 # -----------------------------
-API_KEY= st.secrets["API_KEY"]
+@st.cache_resource
+def get_engine():
+    return engine_from_secrets(st.secrets)
 
 
-# -----------------------------
-# DAT API Credentials
-# -----------------------------
-ORG_USERNAME = st.secrets["ORG_USERNAME"]
-ORG_PASSWORD = st.secrets["ORG_PASSWORD"]
-ACCOUNT_USERNAME = st.secrets["ACCOUNT_USERNAME"]
+engine = get_engine()
+quote_store = get_quote_store(QUOTE_STORE_PATH)   # shared by every session, kept across restarts
 
 
-# -----------------------------
-# GREENSCREENS API URL
-# -----------------------------
-GS_CLIENT_SECRET = st.secrets["GS_CLIENT_SECRET"] # client_secret
+@st.cache_resource
+def get_metrics_server(port):
+    return start_metrics_server(port)
 
 
+if PERF_METRICS_PORT:
+    get_metrics_server(PERF_METRICS_PORT)
 
 
 # -----------------------------
-# FUNCTIONS: DAT AUTHENTICATION
+# STATIC ASSETS (read once per process)
 # -----------------------------
-def get_dat_access_token(force_refresh=False):
-    
-    if (
-        not force_refresh
-        and "DAT_BEARER_TOKEN" in st.session_state
-        and "DAT_TOKEN_EXPIRY" in st.session_state
-    ):
-        now = datetime.now(timezone.utc)
-        expiry = st.session_state["DAT_TOKEN_EXPIRY"]
-        if now < expiry:
-            return st.session_state["DAT_BEARER_TOKEN"]  
-
-    
-    try:
-        org_payload = {
-            "username": ORG_USERNAME,
-            "password": ORG_PASSWORD
-        }
-        org_response = requests.post(org_url, json=org_payload)
-        org_response.raise_for_status()
-        org_token = org_response.json()["accessToken"]
-
-        user_payload = {
-            "username": ACCOUNT_USERNAME
-        }
-        user_headers = {
-            "Authorization": f"Bearer {org_token}"
-        }
-        user_response = requests.post(user_url, json=user_payload, headers=user_headers)
-        user_response.raise_for_status()
-        data = user_response.json()
-
-        access_token = data["accessToken"]
-        expires_raw = data.get("expiresWhen")
-
-        
-        if expires_raw:
-            expires_dt = datetime.fromisoformat(expires_raw.replace("Z", "+00:00"))
-        else:
-            expires_dt = datetime.now(timezone.utc)  # fallback inmediato
-
-        
-        st.session_state["DAT_BEARER_TOKEN"] = access_token
-        st.session_state["DAT_TOKEN_EXPIRY"] = expires_dt
-
-        #st.sidebar.success(f"DAT token refreshed\nExpires: {expires_dt.strftime('%Y-%m-%d %H:%M')}")
-
-        return access_token
-
-    except Exception as e:
-        st.sidebar.error(f"Error authenticating with DAT: {e}")
-        return None
-
+@st.cache_resource
+def load_css(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
 
 # -----------------------------
-# STREAMLIT INITIALIZATION
+# DAT AUTH STATUS (checked once per session)
 # -----------------------------
-access_token = get_dat_access_token()
-st.session_state["DAT_BEARER_TOKEN"] = access_token
-
-st.title("Multis Spot or Contract: Pricing Department")
+def check_dat_auth():
+    # The broker keeps the token fresh in the background; only re-check after a failure
+    if st.session_state.get("dat_auth_error", "") is None:
+        return
+    try:
+        engine.dat_tokens.get_token()
+        st.session_state["dat_auth_error"] = None
+    except Exception as e:
+        st.session_state["dat_auth_error"] = f"Error authenticating with DAT: {e}"
 
 
 # -----------------------------
 # SELECT CONTRACT OR SPOT
 # -----------------------------
-
-st.markdown("""
-<style>
-/* Container: pastel gradient + frosted card + shadow */
-[data-testid="stSidebar"] {
-    background: linear-gradient(180deg, #f8fbfd 0%, #e6f6fb 45%, #e8f7f6 100%);
-    padding: 26px 22px;
-    border-right: 1px solid rgba(22, 31, 45, 0.04);
-    box-shadow: 0 10px 30px rgba(14, 30, 60, 0.06);
-    backdrop-filter: blur(6px);
-    color: #0f1724;
-}
-
-/* Headings and titles */
-[data-testid="stSidebar"] h1,
-[data-testid="stSidebar"] h2,
-[data-testid="stSidebar"] h3 {
-    color: #073763 !important;  /* deep blue accent */
-    font-weight: 700;
-    margin-bottom: 12px;
-}
-
-/* Section headers (markdown ###) */
-[data-testid="stSidebar"] .css-1d391kg { color: #073763 !important; } /* fallback for some versions */
-
-/* Labels and small text */
-[data-testid="stSidebar"] label,
-[data-testid="stSidebar"] p,
-[data-testid="stSidebar"] .stMarkdown {
-    color: #0f1724 !important;
-    opacity: 0.9;
-}
-
-/* Inputs styling: number input, select, radio; make them look like pills */
-[data-testid="stSidebar"] .stNumberInput > div,
-[data-testid="stSidebar"] .stRadio,
-[data-testid="stSidebar"] .stSelectbox {
-    background: #ffffff;
-    border-radius: 10px;
-    padding: 8px 10px;
-    box-shadow: 0 6px 18px rgba(14, 30, 60, 0.04);
-    border: 1px solid rgba(14,30,60,0.04);
-}
-
-/* Number input inner - remove default borders (works for many versions) */
-[data-testid="stSidebar"] input[type="number"] {
-    background: transparent;
-    border: none;
-    outline: none;
-    color: #0f1724;
-    font-weight: 600;
-}
-
-/* Radio buttons labels */
-[data-testid="stSidebar"] .stRadio label, 
-[data-testid="stSidebar"] .stRadio div[role="radiogroup"] > label {
-    color: #0f1724 !important;
-    font-weight: 600;
-}
-
-
-/* Small utility: subtle separators */
-[data-testid="stSidebar"] hr {
-    border: none;
-    height: 1px;
-    background: linear-gradient(90deg, rgba(11,108,255,0.06), rgba(0,0,0,0));
-    margin: 18px 0;
-}
-
-/* Sidebar captions */
-[data-testid="stSidebar"] .stCaption {
-    color: #475569 !important;
-    opacity: 0.9;
-}
-
-/* Make toggles/switches nicer */
-[data-testid="stSidebar"] .stCheckbox>div, 
-[data-testid="stSidebar"] .stSwitch>div {
-    padding: 6px;
-}
-
-/* Responsive safety for narrow windows (won't shrink below 300) */
-@media (max-width: 900px) {
-  [data-testid="stSidebar"]{
-    width: 320px;
-    min-width: 320px;
-  }
-}
-</style>
-""", unsafe_allow_html=True)
-
-
-
-with st.sidebar:
+# Not a fragment: mode / horizon changes rerun the page so the quote re-prices
+# (the forecast and every other provider answer come from cache).
+def pricing_mode_panel():
     st.markdown("### Pricing Mode")
-    pricing_mode = st.radio("Select pricing mode:", ["Spot", "Contract"])
+    pricing_mode = st.radio("Select pricing mode:", ["Spot", "Contract"], key="pricing_mode")
 
     if pricing_mode == "Contract":
-        months_to_forecast = st.sidebar.number_input(
+        st.number_input(
             "Forecast months",
             min_value=1,
             max_value=12,
             value=12,
-            step=1
+            step=1,
+            key="months_to_forecast"
         )
 
-        if months_to_forecast < 12:
-            selected_months = months_to_forecast + 1
-
-        else:
-            selected_months=12
 
+def current_pricing_mode():
+    pricing_mode = st.session_state.get("pricing_mode", "Spot")
+    if pricing_mode == "Contract":
+        selected_months = forecast_months_to_selected(st.session_state.get("months_to_forecast", 12))
     else:
         selected_months = 1
- 
-
-    st.markdown("---")
-    st.sidebar.markdown("### Quote History")
-    if "quote_history" in st.session_state:
-        for quote in st.session_state.quote_history:
-            lane_label = f"{quote['Lane']}"
-            with st.sidebar.expander(lane_label):
-                st.write(f"**Mode:** {quote['mode']}")
-                st.write(f"**Equipment:** {quote['equipment']}")
-                st.write(f"**Rate:** ${quote['rate']}")
-    else:
+    return pricing_mode, selected_months
+
+
+def quote_owner():
+    # Signed-in user's email when the deployment has auth. Without it, an id kept
+    # in the URL: session_state is new on every browser refresh, the URL is not
+    user = st.user if hasattr(st, "user") else st.experimental_user
+    email = user.get("email")
+    if email:
+        return email
+    owner = st.query_params.get("owner")
+    if not owner:
+        owner = uuid.uuid4().hex
+        st.query_params["owner"] = owner
+    return owner
+
+
+# Fragment: paging reruns only this block. One page of this user's quotes is
+# read from the quote store per run, newest first (see add_to_quote_history).
+@st.fragment
+def quote_history_panel():
+    st.markdown("### Quote History")
+    # Last id of every page above the current one (None = newest page)
+    cursors = st.session_state.setdefault("history_cursors", [None])
+    quotes = quote_store.recent(QUOTE_HISTORY_PAGE_SIZE + 1, before_id=cursors[-1], owner=quote_owner())
+    has_older = len(quotes) > QUOTE_HISTORY_PAGE_SIZE
+    quotes = quotes[:QUOTE_HISTORY_PAGE_SIZE]
+
+    if not quotes:
         st.caption("No recent quotes yet.")
+        return
 
+    for quote in quotes:
+        with st.expander(quote["lane"]):
+            st.write(f"**Mode:** {quote['pricing_mode']}")
+            st.write(f"**Equipment:** {quote['equipment']}")
+            st.write(f"**Rate:** ${quote['final_rate']:,.0f}")
+            st.caption(f"{quote['customer']} · {datetime.fromtimestamp(quote['created_at']):%b %d, %H:%M}")
 
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("Newer", key="history_newer"):
+            cursors.pop()
+            st.rerun(scope="fragment")
+    with col2:
+        if has_older and st.button("Older", key="history_older"):
+            cursors.append(quotes[-1]["id"])
+            st.rerun(scope="fragment")
 
 
-# -----------------------------
-# USER INPUT: CUSTOMER & EQUIPMENT
-# -----------------------------
-col1, col2 = st.columns(2)
-
-with col1:
-    opcion_stops = st.selectbox("Select Customer:", ["Fabuwood Cabinetry", "Other"])
-with col2:
-    equipment_type = st.selectbox("Select Equipment Type:", ["VAN", "FLATBED", "REEFER", "STEPDECK", "CONESTOGA", "HOTSHOT"])
-
-# weight para HOTSHOT
-hotshot_weight_lbs = None
-if equipment_type == "HOTSHOT":
-    hotshot_weight_lbs = st.number_input(
-        "Hotshot weight (lbs)",
-        min_value=0, max_value=40000, value=8000, step=500
-    )
-
-# -----------------------------
-# LOGIC: VALUE PER STOP BASED ON CUSTOMER
-# -----------------------------
-if opcion_stops == "Fabuwood Cabinetry":
-    variable_stops = 150
-elif opcion_stops == "Other":
-    variable_stops = 100
-
-# -----------------------------
-# ESCALATION TYPE
-# -----------------------------
-escalation_type = "Best_fit"  # Fixed globally
-
-# -----------------------------
-# FUNCTION: Markup
-# -----------------------------
-
-
-markup_mode = st.radio(
-    "Do you want to input your own markup?",
-    options=["Yes", "No"],
-    horizontal=True,
-    index=1
-    )
-
-Mark_up=None
-
-if markup_mode == "Yes":
-    user_markup = st.number_input(
-        "Enter your mark-up",
-        min_value=0.0,
-        max_value=1.0,
-        value=0.1,
-        step=0.01,
-    )
-    Mark_up = user_markup
-    st.info(f"Manual markup selected: {round(Mark_up * 100, 2)}%")
-else:
-    st.info("Markup will be calculated automatically based on MCI values once you press Calculate.")
-
-
-# -----------------------------
-# RULES FOR MCI
-# -----------------------------
-
-def get_mci_adjustment(mci_score, rules):
-    for condition, adjustment in rules:
-        if condition(mci_score):
-            return adjustment
-    return 0
-
-
-def calculate_auto_markup(mci_data, equipment_type):
-    if not mci_data:
-        return 0.01
-
-    origin_mci = mci_data["origin_mci"]
-    destination_mci = mci_data["destination_mci"]
-
-    # Base por equipo
-    if equipment_type == "VAN":
-        base_markup = 0.12
-    elif equipment_type in ["REEFER", "FLATBED"]:
-        base_markup = 0.16
-    elif equipment_type == "STEPDECK":
-        base_markup = 0.16 + 0.06   # Flatbed (12%) + 6 pp = 18%
-    elif equipment_type == "CONESTOGA":
-        base_markup = 0.16 + 0.08   # Flatbed (12%) + 8 pp = 20%
-    else:
-        base_markup = 0.12
-
-    origin_rules = [
-        (lambda x: x >= 90, 0.02),
-        (lambda x: x >= 75, 0.015),
-        (lambda x: x >= 50, 0.01),
-        (lambda x: x <= -75, 0.01)
-    ]
-    destination_rules = [
-        (lambda x: x >= 75, -0.02),
-        (lambda x: x >= 50, -0.01),
-        (lambda x: x <= -75, 0.015)
-    ]
-
-    origin_adj = get_mci_adjustment(origin_mci, origin_rules)
-    dest_adj = get_mci_adjustment(destination_mci, destination_rules)
-
-    return base_markup + origin_adj + dest_adj
-
-
-# -----------------------------
-# FUNCTION: Identify equipment 
-# -----------------------------
-
-def provider_equipment(equipment_type: str) -> str:
-    return "FLATBED" if equipment_type in ("STEPDECK", "CONESTOGA", "HOTSHOT") else equipment_type
-
-# -----------------------------
-# FUNCTION: Stops Greenscreens  
-# -----------------------------
-
-def build_stops_from_locations(locations: list) -> list:
-    
-    stops = []
-    for idx, loc in enumerate(locations):
-        parsed = parse_location_string_spots(loc)
-        if not parsed:
-            continue
-        stops.append({
-            "order": idx,
-            "city": parsed.get("city", ""),
-            "state": parsed.get("stateOrProvince", ""),
-            "country": "US",
-            "zip": parsed.get("postalCode", "")
-        })
-    return stops
-
-# -----------------------------
-# FUNCTION: GET DAT RATE DATA
-# -----------------------------
-def get_DAT_data(locations, equipment_type, pricing_mode, selected_months):
-    logger = logging.getLogger(__name__)
-
-    headers = {
-        "Authorization": f"Bearer {st.session_state['DAT_BEARER_TOKEN']}",
-        "Content-Type": "application/json"
-    }
-
-    def _has_no_rates_error(errors):
-        if not errors:
-            return False
-        return any("No rates available" in (e.get("message", "") or "") for e in errors)
-
-    if pricing_mode == "Spot":
-
-        origin = parse_location_string_spots(locations[0])
-        destination = parse_location_string_spots(locations[-1])
-
-        # ZIP-only fallback dicts
-        origin_zip_only = {"postalCode": origin.get("postalCode")} if origin.get("postalCode") else None
-        destination_zip_only = {"postalCode": destination.get("postalCode")} if destination.get("postalCode") else None
-
-        target_escalation = {"escalationType": "BEST_FIT"}
-
-        def _call_spot(o, d):
-            body = [
-                {
-                    "origin": o,
-                    "destination": d,
-                    "rateType": "SPOT",
-                    "equipment": provider_equipment(equipment_type),
-                    "includeMyRate": True,
-                    "targetEscalation": target_escalation
-                }
-            ]
-
-            response = requests.post(url_spot, headers=headers, json=body)
-            response.raise_for_status()
-
-            data = response.json()
-            rate_response_full = data["rateResponses"][0]["response"]
-
-            errors = rate_response_full.get("errors")
-            if _has_no_rates_error(errors):
-                return None
-
-            if "rate" not in rate_response_full:
-                return None
-
-            rate_response = rate_response_full["rate"]
-
-            return {
-                "rate": rate_response["perTrip"]["rateUsd"],
-                "high": rate_response["perTrip"]["highUsd"],
-                "low": rate_response["perTrip"]["lowUsd"],
-                "miles": rate_response["mileage"],
-                "fuel_per_trip": rate_response.get("averageFuelSurchargePerTripUsd")
-            }
-
-        # Attempt 1: full location
-        try:
-            result = _call_spot(origin, destination)
-            if result is not None:
-                return result
-
-            # Attempt 2: ZIP-only fallback
-            if origin_zip_only and destination_zip_only:
-                logger.info("Retrying DAT Spot with ZIP-only fallback (origin/destination).")
-                result = _call_spot(origin_zip_only, destination_zip_only)
-                if result is not None:
-                    return result
-
-            logger.warning("No DAT rates available for this lane at the moment.")
-            return None
-
-        except Exception as e:
-            # If attempt 1 throws, try ZIP fallback once
-            if origin_zip_only and destination_zip_only:
-                logger.warning("DAT Spot full-location failed. Retrying ZIP-only. Error=%s", e)
-                try:
-                    result = _call_spot(origin_zip_only, destination_zip_only)
-                    if result is not None:
-                        return result
-                except Exception as e2:
-                    logger.exception("Error calling DAT Spot API (ZIP fallback).")
-                    st.error(f"Error calling DAT Spot API (ZIP fallback): {e2}")
-                    return None
-
-            logger.exception("Error calling DAT Spot API.")
-            st.error(f"Error calling DAT API: {e}")
-            return None
-
-    elif pricing_mode == "Contract":
-
-        origin = parse_location_string_contract(locations[0])
-        destination = parse_location_string_contract(locations[-1])
-
-        origin_spot = parse_location_string_spots(locations[0])
-        destination_spot = parse_location_string_spots(locations[-1])
-
-        origin_spot_zip_only = {"postalCode": origin_spot.get("postalCode")} if origin_spot.get("postalCode") else None
-        destination_spot_zip_only = {"postalCode": destination_spot.get("postalCode")} if destination_spot.get("postalCode") else None
-
-        try:
-            # --------- Forecast Request (Contract base rate + miles) ---------
-            body_forecast = {
-                "origin": origin,
-                "destination": destination,
-                "equipmentCategory": provider_equipment(equipment_type),
-                "forecastPeriod": "52WEEKS"
-            }
-
-            response_forecast = requests.post(url_forecast, headers=headers, json=body_forecast)
-            response_forecast.raise_for_status()
-            data_forecast = response_forecast.json()
-
-            per_trip_data = data_forecast.get("forecasts", {}).get("perTrip", [])
-            monthly_values = defaultdict(lambda: {"avg": []})
-
-            for point in per_trip_data:
-                date_str = point.get("forecastDate")
-                avg_usd = point.get("forecastUSD", 0)
-
-                if not date_str or avg_usd == 0:
-                    continue
-
-                date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-                year_month = (date.year, date.month)
-                monthly_values[year_month]["avg"].append(avg_usd)
-
-            sorted_months = sorted(monthly_values.keys())
-            selected_month_keys = sorted_months[:selected_months]
-
-            monthly_forecasts = []
-            monthly_medians = []
-
-            for ym in selected_month_keys:
-                year, month = ym
-                values = monthly_values[ym]
-                med_avg = statistics.median(values["avg"])
-
-                monthly_medians.append(med_avg)
-                monthly_forecasts.append({
-                    "date": f"{year}-{month:02d}-01T00:00:00Z",
-                    "forecastUSD": int(med_avg),
-                })
-
-            if not monthly_medians:
-                logger.warning("No forecast data available for this lane.")
-                st.warning("No forecast data available for this lane.")
-                return None
-
-            average_rate = sum(monthly_medians) / len(monthly_medians)
-            mileage = data_forecast.get("mileage", 0)
-
-            # --- Spot request for fuel, high, low (Contract Mode) ---
-            if selected_months >= 12:
-                specific_timeframe = "180_DAYS"
-                rateType = "CONTRACT"
-            elif selected_months >= 3:
-                specific_timeframe = "90_DAYS"
-                rateType = "SPOT"
-            elif selected_months == 2:
-                specific_timeframe = "60_DAYS"
-                rateType = "SPOT"
-            else:
-                specific_timeframe = "30_DAYS"
-                rateType = "SPOT"
-
-            area_sequence = ["MARKET_AREA", "EXTENDED_MARKET_AREA"]
-            spot_result = None
-            debug = True
-
-            def _call_contract_spot(o, d, area_type):
-                spot_body = [
-                    {
-                        "origin": o,
-                        "destination": d,
-                        "rateType": rateType,
-                        "equipment": provider_equipment(equipment_type),
-                        "includeMyRate": True,
-                        "targetEscalation": {
-                            "escalationType": "SPECIFIC_AREA_TYPE_AND_SPECIFIC_TIME_FRAME",
-                            "specificTimeFrame": specific_timeframe,
-                            "specificAreaType": area_type
-                        }
-                    }
-                ]
-
-                spot_response = requests.post(url_spot, headers=headers, json=spot_body)
-                spot_response.raise_for_status()
-                return spot_response.json()
-
-            for area_type in area_sequence:
-                spot_data = None
-
-                # Attempt 1: full location
-                try:
-                    if debug:
-                        logger.debug(
-                            "Trying contract spot request. area_type=%s timeframe=%s (full origin/dest)",
-                            area_type, specific_timeframe
-                        )
-                    spot_data = _call_contract_spot(origin_spot, destination_spot, area_type)
-                except Exception as e:
-                    spot_data = None
-                    if debug:
-                        logger.debug("Contract spot request error (full): %s", e)
-
-                # Attempt 2: ZIP-only fallback
-                if spot_data is None and origin_spot_zip_only and destination_spot_zip_only:
-                    try:
-                        if debug:
-                            logger.info(
-                                "Retrying contract spot with ZIP-only fallback. area_type=%s timeframe=%s",
-                                area_type, specific_timeframe
-                            )
-                        spot_data = _call_contract_spot(origin_spot_zip_only, destination_spot_zip_only, area_type)
-                    except Exception as e:
-                        if debug:
-                            logger.debug("Contract spot request error (zip fallback): %s", e)
-                        spot_data = None
-
-                if spot_data is None:
-                    continue
-
-                rate_responses = spot_data.get("rateResponses", [])
-                if not rate_responses:
-                    continue
-
-                first = rate_responses[0]
-                resp = first.get("response", {})
-
-                errors = resp.get("errors")
-                if errors:
-                    if _has_no_rates_error(errors):
-                        continue
-                    continue
-
-                rate_obj = resp.get("rate")
-                if not rate_obj:
-                    continue
-
-                per_trip = rate_obj.get("perTrip")
-                if isinstance(per_trip, list) and len(per_trip) > 0:
-                    per_trip_entry = per_trip[0]
-                elif isinstance(per_trip, dict):
-                    per_trip_entry = per_trip
-                else:
-                    per_trip_entry = {}
-
-                fuel_per_trip = rate_obj.get(
-                    "averageFuelSurchargePerTripUsd",
-                    per_trip_entry.get("averageFuelSurchargePerTripUsd", 0)
-                )
-                contract_highUSD = per_trip_entry.get("highUsd", rate_obj.get("highUsd", 0))
-                contract_lowUSD = per_trip_entry.get("lowUsd", rate_obj.get("lowUsd", 0))
-
-                spot_result = {
-                    "fuel_per_trip": fuel_per_trip,
-                    "contract_highUSD": contract_highUSD,
-                    "contract_lowUSD": contract_lowUSD,
-                    "used_area_type": area_type,
-                    "raw": spot_data
-                }
-                break
-
-            if spot_result is None:
-                return {
-                    "rate": average_rate,
-                    "miles": mileage,
-                    "fuel_per_trip": 0,
-                    "monthly_forecasts": monthly_forecasts,
-                    "contract_highUSD": 0,
-                    "contract_lowUSD": 0
-                }
-
-            fuel_per_trip = spot_result["fuel_per_trip"]
-            contract_highUSD = spot_result["contract_highUSD"]
-            contract_lowUSD = spot_result["contract_lowUSD"]
-
-            return {
-                "rate": average_rate,
-                "miles": mileage,
-                "fuel_per_trip": fuel_per_trip,
-                "monthly_forecasts": monthly_forecasts,
-                "contract_highUSD": contract_highUSD,
-                "contract_lowUSD": contract_lowUSD
-            }
-
-        except Exception as e:
-            logger.exception("Error calling DAT Contract logic.")
-            st.error(f"Error calling DAT Contract logic: {e}")
-            return None
-
-
-
-# -----------------------------
-# FUNCTION: MCI NUMBERS
-
-# -----------------------------
-
-def get_MCI_scores(locations, equipment_type, url_MCI):
-    import logging
-    logger = logging.getLogger(__name__)
-
-    headers = {
-        "Authorization": f"Bearer {st.session_state['DAT_BEARER_TOKEN']}",
-        "Content-Type": "application/json"
-    }
-
-    try:
-        origin = parse_location_string_spots(locations[0])
-        destination = parse_location_string_spots(locations[-1])
-
-        origin_postal = origin.get("postalCode")
-        destination_postal = destination.get("postalCode")
-
-        def _build_params(loc_dict, use_zip_only=False):
-            params = {
-                "page": 0,
-                "pageSize": 10,
-                "areaType": "MARKET_AREA",
-                "direction": "OUTBOUND",
-                "equipmentCategory": provider_equipment(equipment_type),
-                "timeframe": "PREVIOUS_BUSINESS_DAY",
-                "country": "US",
-            }
-
-            if use_zip_only and loc_dict.get("postalCode"):
-                params["postalCode"] = loc_dict.get("postalCode")
-            else:
-                params["city"] = loc_dict.get("city")
-                params["stateOrProvince"] = loc_dict.get("stateOrProvince")
-
-            return params
-
-        def _fetch_mci(params):
-            resp = requests.get(url_MCI, headers=headers, params=params)
-            resp.raise_for_status()
-            data = resp.json()
-
-            if not isinstance(data, list) or not data:
-                return None
-
-            first = data[0]
-            indexes = first.get("marketConditionsIndexes") or []
-            if not indexes:
-                return None
-
-            return indexes[0].get("mciScore")
-
-        # Attempt 1: city/state
-        try:
-            origin_params = _build_params(origin, use_zip_only=False)
-            dest_params = _build_params(destination, use_zip_only=False)
-
-            mci_origin = _fetch_mci(origin_params)
-            mci_destination = _fetch_mci(dest_params)
-
-            if mci_origin is not None and mci_destination is not None:
-                return {
-                    "origin_mci": mci_origin,
-                    "destination_mci": mci_destination,
-                }
-
-            raise ValueError("MCI response missing scores on city/state attempt.")
-
-        except Exception as e:
-            # Attempt 2: ZIP-only fallback (if possible)
-            if origin_postal and destination_postal:
-                logger.info("Retrying MCI with ZIP-only fallback (origin/destination). Reason=%s", e)
-
-                origin_params_zip = _build_params(origin, use_zip_only=True)
-                dest_params_zip = _build_params(destination, use_zip_only=True)
-
-                try:
-                    mci_origin = _fetch_mci(origin_params_zip)
-                    mci_destination = _fetch_mci(dest_params_zip)
-
-                    if mci_origin is None or mci_destination is None:
-                        logger.warning("Could not retrieve MCI scores for both locations (ZIP fallback returned None).")
-                        return None
-
-                    return {
-                        "origin_mci": mci_origin,
-                        "destination_mci": mci_destination,
-                    }
-
-                except Exception as e2:
-                    logger.exception("Error retrieving MCI data (ZIP fallback).")
-                    st.error(f"Error retrieving MCI data (ZIP fallback): {e2}")
-                    return None
-
-            logger.exception("Error retrieving MCI data (city/state attempt).")
-            st.error(f"Error retrieving MCI data: {e}")
-            return None
-
-    except Exception as e:
-        logger.exception("Error retrieving MCI data (outer).")
-        st.error(f"Error retrieving MCI data: {e}")
-        return None
-
-
-
-# -----------------------------
-# FUNCTION: GREENSCREENS
-# -----------------------------
-def get_greenscreens_rate(locations, equipment_type):
-    try:
-        from datetime import datetime, timezone
-
-        # Step 1: AUTH - Get token
-        auth_payload = {
-            "client_id": GS_CLIENT_ID,
-            "client_secret": GS_CLIENT_SECRET,
-            "grant_type": "client_credentials"
-        }
-
-        auth_headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-
-        auth_response = requests.post(GS_AUTH_URL, data=auth_payload, headers=auth_headers)
-        auth_response.raise_for_status()
-        access_token = auth_response.json().get("access_token")
-
-        if not access_token:
-            st.error("Failed to obtain GreenScreens access token.")
-            return None
-        
-        # Step 2: Build body for prediction
-        stops_array = build_stops_from_locations(locations)
-
-        body = {
-            "pickupDateTime": datetime.now(timezone.utc).isoformat(),
-            "transportType": provider_equipment(equipment_type),
-            "stops":stops_array,
-            "commodity": "General Freight",
-            "currency": "USD"
-        }
-
-        # Step 3: Call prediction endpoint
-        prediction_headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
-        prediction_response = requests.post(GS_PREDICT_URL, json=body, headers=prediction_headers)
-        prediction_response.raise_for_status()
-        data = prediction_response.json()
-        rpm = data.get("targetBuyRate", 0)
-        distance = data.get("distance", 0)
-        confidence = data.get("confidenceLevel", 0)
-
-        
-        total_all_in = int((rpm) * distance)
-
-        print(total_all_in,confidence)
-
-        if total_all_in is None or confidence is None:
-            st.warning("No valid rate or confidence returned from GreenScreens.")
-            return None
-
-        return {
-            "rate_per_mile": total_all_in,
-            "confidence": confidence
-        }
-
-        
-
-    except Exception as e:
-        st.error(f"Error getting GreenScreens data: {e}")
-        return None
-
-
-
-# -----------------------------
-# FUNCTION: GOOGLE MAPS ROUTE & PRICING
-# -----------------------------
-def get_route_info(locations, DAT_miles, DAT_average, effective_avg_rate=None, blend_label=None, Mark_up=0.1, chaos_premium=0,equipment_type=None):
-
-    if len(locations) < 2:
-        return {"error": "At least two valid locations are required"}
-
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-Api-Key": API_KEY,
-        "X-Goog-FieldMask": "routes.distanceMeters"
-    }
-
-    request_body = {
-        "origin": {"address": locations[0]},
-        "destination": {"address": locations[-1]},
-        "intermediates": [{"address": loc} for loc in locations[1:-1]],
-        "travelMode": "DRIVE",
-    }
-
-    try:
-        response = requests.post(base_url, json=request_body, headers=headers)
-        data = response.json()
-        # 1. Calculate Google miles (real route distance)
-        total_distance_miles = round(sum(route["distanceMeters"] for route in data["routes"]) / 1609.344)
-
-
-        # 2. Layover logic
-        Days_miles = DAT_miles / 600
-        Google_days = total_distance_miles / 600
-        layover_count = max(0, int(Google_days) - int(Days_miles))
-
-        # 3. Stops logic
-        stops = len(locations) - 2
-        total_additions = stops * variable_stops
-
-        if opcion_stops == "Fabuwood Cabinetry":
-            layover = layover_count * 125
-            increase_per_stop = round((stops / 4) * 100, 2) if stops > 4 else 0
-        else:
-            layover = layover_count * 200
-            increase_per_stop = round((stops / 4) * 150, 2) if stops > 4 else 0 
-
-        if str(equipment_type).strip().upper() == "HOTSHOT":
-            base_rate_for_rpm = effective_avg_rate if effective_avg_rate is not None else DAT_average
-        else:
-            base_rate_for_rpm = DAT_average if stops > 0 else (effective_avg_rate or DAT_average)
-            
-        RPM = base_rate_for_rpm / DAT_miles
-        mileage_charge = RPM * total_distance_miles
-
-        
-        miles_diff = total_distance_miles - DAT_miles
-
-           
-        if miles_diff >= 0:
-            total_cost = round_to_nearest_5(
-                mileage_charge + total_additions + increase_per_stop + layover
-            )
-        else:
-            total_cost = round_to_nearest_5(
-                base_rate_for_rpm + total_additions + increase_per_stop + layover
-            )
-
-
-        Final_Rate = round_to_nearest_5(total_cost * (1 + Mark_up)) #+ chaos_premium)
-
-        Manual_adj_buy = total_cost - base_rate_for_rpm
-        
-        correction_factor = effective_avg_rate - DAT_average if effective_avg_rate is not None else 0
-
-        adj_layover = layover  
-        adj_extra_stops = increase_per_stop + total_additions
-        adj_extra_miles_plus_margin = round((Manual_adj_buy) - (adj_layover + adj_extra_stops), 2) if miles_diff >= 0 else 0
-
-    
-   
-        return {
-        "google_miles": total_distance_miles,
-        "dat_miles": DAT_miles,
-        "dat_avg_rate": DAT_average,
-        "total_cost": total_cost,
-        "final_rate": Final_Rate,
-        "layover": adj_layover,
-        "extra_stops": adj_extra_stops,
-        "extra_miles": adj_extra_miles_plus_margin,
-        "blend_label": blend_label,
-        "effective_avg_rate": base_rate_for_rpm,
-        "Stops": stops,
-        "Correction_factor": correction_factor,
-        "Origin": locations[0]
-        }
-    
-    except Exception as e:
-        st.error(f"Error in Google Maps API: {str(e)}")
-
 # -----------------------------
 # RESULT
 # -----------------------------  
@@ -969,16 +161,16 @@ def SHOW_RESULT(route_data, mci_data, gs_data, Mark_up, chaos_data,pricing_mode)
     mci_destination = mci_data["destination_mci"]
     origin= route_data["Origin"]
 
-    total_all_in = gs_data["rate_per_mile"]
-    confidence = gs_data["confidence"]
-    print(total_all_in)
+    # No GS data (provider error, or skipped by the quote deadline): DAT-only market block
+    total_all_in = gs_data["rate_per_mile"] if gs_data else None
+    confidence = gs_data["confidence"] if gs_data else None
     gs_spot_sell = None
 
     if route_data["Stops"] > 0 and total_all_in:
         gs_spot_sell = round(total_all_in * (1 + Mark_up))
 
     
-    if pricing_mode == "Contract":
+    if pricing_mode == "Contract" or not gs_data:
         
         market_html = (
             f"<div style='font-weight:700;color:#4b5563;margin-bottom:8px'>DAT Market</div>"
@@ -1111,373 +303,416 @@ def SHOW_RESULT(route_data, mci_data, gs_data, Mark_up, chaos_data,pricing_mode)
             #)
 
 
-
 # -----------------------------
-# LOCATION INPUT & PARSING
+# MARKET SNAPSHOTS (per session)
 # -----------------------------
-locations_input = parse_locations()
-print(locations_input)
+# DAT / MCI / GS / Google answers for each lane are fetched once and kept here;
+# markup, customer and hotshot weight are re-priced against them locally.
+# Calculate fetches again once a snapshot is older than a DAT lookup may be reused,
+# or when a provider failed or was cut by the deadline: one timeout must not
+# misprice the lane until the snapshot expires.
+MAX_MARKET_SNAPSHOTS = 20
 
 
+def snapshot_age(snapshot):
+    return time.time() - snapshot.get("fetched_at", 0)
 
 
+def snapshot_incomplete(snapshot):
+    return bool(snapshot.get("errors") or snapshot.get("skipped"))
 
-# -----------------------------
-# GS AND DAT
-# -----------------------------
 
+def snapshot_needs_refetch(snapshot):
+    return snapshot_age(snapshot) > DAT_CACHE_TTL or snapshot_incomplete(snapshot)
 
-def get_effective_avg_rate_with_blending(DAT_average, total_all_in, confidence):
-    
-    print(confidence)
-    if total_all_in > 0 and confidence >= 89:
-        base_rate = 0.5 * DAT_average + 0.5 * total_all_in
-        blend_label = "50/50 DAT GS"
-    elif total_all_in > 0 and confidence >= 76:
-        base_rate = 0.65 * DAT_average + 0.35 * total_all_in
-        blend_label = "65/35 DAT GS"
-    else:
-        base_rate = DAT_average
-        blend_label = "100% DAT"
 
-    
-    if total_all_in > 0:
-        discrepancy_pct = abs(DAT_average - total_all_in) / DAT_average * 100
-        if discrepancy_pct > 20:
-            st.caption("GS and DAT differ by more than 20%. Defaulting to DAT.")
-        elif discrepancy_pct > 10:
-            st.caption("GS and DAT differ by more than 10%.")
+def get_market_snapshot(locations_input, equipment_type, pricing_mode, selected_months, refresh=False):
+    snapshots = st.session_state.setdefault("market_snapshots", {})
+    key = market_snapshot_key(locations_input, equipment_type, pricing_mode)
 
-    return round(base_rate), blend_label
+    if refresh or key not in snapshots or snapshot_needs_refetch(snapshots[key]):
+        snapshots.pop(key, None)
+        with quote_trace() as trace, span("fetch_providers"):
+            snapshot = engine.fetch_provider_data(locations_input, equipment_type, pricing_mode, selected_months)
+        snapshot["trace_id"] = trace.trace_id
+        snapshot["fetched_at"] = time.time()
+        keep_trace(trace)
+        snapshots[key] = snapshot
+        while len(snapshots) > MAX_MARKET_SNAPSHOTS:
+            snapshots.pop(next(iter(snapshots)))
+    return find_market_snapshot(locations_input, equipment_type, pricing_mode, selected_months)
 
 
+def find_market_snapshot(locations_input, equipment_type, pricing_mode, selected_months):
+    snapshots = st.session_state.get("market_snapshots", {})
+    key = market_snapshot_key(locations_input, equipment_type, pricing_mode)
+    if key not in snapshots:
+        return None
+    # Another "Forecast months" value: re-derive DAT from the cached forecast
+    snapshots[key] = engine.with_forecast_horizon(
+        snapshots[key], locations_input, equipment_type, pricing_mode, selected_months
+    )
+    return snapshots[key]
+
 
 # -----------------------------
-# CALCULATE CHAOS PREMIUMS 
+# PERF TRACES (per session, one per fetched snapshot)
 # -----------------------------
-def calculate_chaos_premiums(DAT_avg, DAT_high, DAT_low, miles, adjusted_base_rate):
-    if not all([DAT_avg, DAT_high, DAT_low]):
-        return {
-            "volatility": 0,
-            "skew": 0,
-            "volatility_premium": 0,
-            "skew_premium": 0,
-            "chaos_premium": 0,
-            "risk_level": "Unknown"
-        }
-
-    volatility = (DAT_high - DAT_low) / DAT_avg if DAT_avg else 0
-    skew = (DAT_high - DAT_avg) / (DAT_avg - DAT_low) if (DAT_avg - DAT_low) else 0
-    upper_spread = DAT_high - DAT_avg
-
-    # Risk level y cap
-    if volatility > 0.4 or skew > 2.0:
-        risk = "High Risk"
-        max_chaos_pct = 0.20
-    elif volatility > 0.2 or skew > 1.0:
-        risk = "Moderate Risk"
-        max_chaos_pct = 0.10
-    else:
-        risk = "Low Risk"
-        max_chaos_pct = 0.05
-
-    if volatility <= 0.1:
-        vol_pct = 0.02
-    elif volatility <= 0.2:
-        vol_pct = 0.04
-    elif volatility <= 0.3:
-        vol_pct = 0.06
-    elif volatility <= 0.4:
-        vol_pct = 0.08
-    else:
-        vol_pct = 0.12
-
-    if skew <= 0.5:
-        skew_pct = 0.00
-    elif skew <= 1.0:
-        skew_pct = 0.04
-    elif skew <= 1.5:
-        skew_pct = 0.06
-    elif skew <= 2.0:
-        skew_pct = 0.08
-    else:
-        skew_pct = 0.12
+# A quote's trace starts when its market data is fetched; every later re-price
+# and render of the same snapshot adds its spans under the same correlation ID.
+def quote_trace(snapshot=None):
+    traces = st.session_state.setdefault("perf_traces", {})
+    trace_id = (snapshot or {}).get("trace_id")
+    if trace_id in traces:
+        return start_trace(traces[trace_id])
+    return start_trace(trace_id)
 
-    raw_vol_premium = vol_pct * upper_spread
-    raw_skew_premium = skew_pct * upper_spread
-    raw_chaos_premium = raw_vol_premium + raw_skew_premium
 
-    capped_chaos_premium = min(raw_chaos_premium, max_chaos_pct * adjusted_base_rate)
-
-    if raw_chaos_premium > 0:
-        vol_premium = round(capped_chaos_premium * (raw_vol_premium / raw_chaos_premium), 2)
-        skew_premium = round(capped_chaos_premium * (raw_skew_premium / raw_chaos_premium), 2)
-    else:
-        vol_premium = 0
-        skew_premium = 0
+def keep_trace(trace):
+    traces = st.session_state.setdefault("perf_traces", {})
+    traces.pop(trace.trace_id, None)
+    traces[trace.trace_id] = trace
+    while len(traces) > PERF_TRACES_KEPT:
+        traces.pop(next(iter(traces)))
+    st.session_state["last_trace_id"] = trace.trace_id
 
 
-    if miles < 100:
-        chaos_multiplier = 0.25
-    elif miles < 250:
-        chaos_multiplier = 0.5
-    else:
-        chaos_multiplier = 1.0
-
-    chaos_premium = round((vol_premium + skew_premium) * chaos_multiplier, 2)
-
-
-
-    return {
-        "volatility": round(volatility, 3),
-        "skew": round(skew, 3),
-        "volatility_premium": vol_premium,
-        "skew_premium": skew_premium,
-        "chaos_premium": chaos_premium,
-        "risk_level": risk
-    }
-
+def perf_panel():
+    if not st.toggle("Show performance", key="show_perf"):
+        return
+    traces = st.session_state.get("perf_traces", {})
+    trace = traces.get(st.session_state.get("last_trace_id"))
+    if trace is None:
+        st.caption("No quote timed yet in this session.")
+        return
 
+    st.caption(f"Quote {trace.trace_id}")
+    st.dataframe(pd.DataFrame(trace.summary()), hide_index=True, use_container_width=True)
+    with st.expander("Spans"):
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {"stage": stage, "start_ms": round(start * 1000, 1), "ms": round(duration * 1000, 1),
+                     "error": error or "", **detail}
+                    for stage, start, duration, error, detail in trace.spans
+                ]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+    if PERF_METRICS_PORT:
+        st.caption(f"Prometheus metrics: http://127.0.0.1:{PERF_METRICS_PORT}/metrics")
 
 
 # -----------------------------
 # RUN PRICING FLOW
 # -----------------------------
 
-def run_pricing_flow(locations_input, equipment_type, pricing_mode, markup_mode, user_markup=None, hotshot_weight_lbs=None):
-    import logging
-    logger = logging.getLogger(__name__)
+def run_pricing_flow(snapshot, locations_input, equipment_type, pricing_mode, selected_months, customer,
+                     user_markup=None, hotshot_weight_lbs=None):
+    """Price the lane against a market snapshot; no API calls."""
 
-    dat_result = get_DAT_data(locations_input, equipment_type, pricing_mode, selected_months)
-    if not dat_result:
-        st.error("No DAT result returned.")
-        return
-
-    raw_avg = dat_result["rate"]
-    DAT_fuel_per_trip = dat_result["fuel_per_trip"]
-    DAT_miles = dat_result["miles"]
-    DAT_average = dat_result["rate"] + round(DAT_fuel_per_trip, 0)
+    result = engine.price_lane(
+        locations_input,
+        equipment_type,
+        pricing_mode,
+        selected_months,
+        customer,
+        user_markup,
+        hotshot_weight_lbs,
+        provider_data=snapshot
+    )
+    return {
+        "errors": snapshot["errors"],
+        "result": result,
+        "pricing_mode": pricing_mode,
+        "forecast_curve": (snapshot["dat"] or {}).get("forecast_curve"),
+        "selected_months": selected_months,
+        "customer": customer,
+        "equipment_type": equipment_type,
+    }
 
-    if pricing_mode == "Spot":
-        DAT_high = dat_result["high"]
-        DAT_low = dat_result["low"]
-    else:
-        DAT_high = dat_result["contract_highUSD"]
-        DAT_low = dat_result["contract_lowUSD"]
 
-    mci_data = get_MCI_scores(locations_input, equipment_type, url_MCI)
-    if not mci_data:
-        st.error("Failed to retrieve MCI data.")
+def add_to_quote_history(quote, snapshot, locations_input, equipment_type, customer, user_markup=None,
+                         hotshot_weight_lbs=None):
+    result = quote["result"]
+    if "error" in result:
         return
 
-    if markup_mode == "Yes" and user_markup is not None:
-        Mark_up = user_markup
-        st.success(f"Manual markup selected: {round(Mark_up * 100)}%")
-    else:
-        Mark_up = calculate_auto_markup(mci_data, equipment_type)
-        st.success(f"Auto markup based on MCI: {round(Mark_up * 100)}%")
+    with span("quote_store"):
+        quote_store.add(
+            locations_input, equipment_type, quote["pricing_mode"], quote["selected_months"], customer, result,
+            snapshot, user_markup, hotshot_weight_lbs, owner=quote_owner()
+        )
+    # Back to the newest page so the quote just priced is on top
+    st.session_state["history_cursors"] = [None]
 
-    adjusted_base_rate = raw_avg * (1 + Mark_up)
 
-    chaos_data = calculate_chaos_premiums(
-        raw_avg,
-        DAT_high,
-        DAT_low,
-        DAT_miles,
-        adjusted_base_rate
-    )
+def lane_history(locations_input, equipment_type):
+    # Same origin -> destination and equipment, any user: one indexed lookup
+    previous = quote_store.for_lane(locations_input[0], locations_input[-1], equipment_type, limit=3)
+    if previous:
+        st.caption("Quoted before: " + " · ".join(
+            f"${quote['final_rate']:,.0f} {quote['pricing_mode']} ({datetime.fromtimestamp(quote['created_at']):%b %d})"
+            for quote in previous
+        ))
 
-    gs_data = get_greenscreens_rate(locations_input, equipment_type)
-    if gs_data:
-        total_all_in = gs_data["rate_per_mile"]
-        confidence = gs_data["confidence"]
 
-        stops = max(0, len(locations_input) - 2)
+def render_quote(quote):
+    for provider_error in quote["errors"]:
+        st.error(provider_error)
 
-        use_gs = True
-        if pricing_mode == "Contract":
-            use_gs = False
+    result = quote["result"]
+    if "error" in result:
+        st.error(result["error"])
+        return
 
-        if use_gs and stops == 0:
-            effective_avg, blend_label = get_effective_avg_rate_with_blending(
-                DAT_average, total_all_in, confidence
-            )
-        else:
-            effective_avg = DAT_average
-            blend_label = "100% DAT (stops>0)" if stops > 0 else "100% DAT"
+    for note in result["notes"]:
+        st.caption(note)
 
-        logger.info("Base Rate used for cost calculation: %s", blend_label)
+    Mark_up = result["Mark_up"]
+    if result["markup_source"] == "manual":
+        st.success(f"Manual markup selected: {round(Mark_up * 100)}%")
     else:
-        effective_avg = DAT_average
-        blend_label = "100% DAT"
-        logger.info("Base Rate used: 100% DAT (no GS data)")
-
-    # -----------------------------
-    # Roundtrip / repeats safeguard
-    # -----------------------------
-    def _has_repeated_locations(locs):
-        return len(set(locs)) < len(locs)
-
-    def _segment_pairs(locs):
-        return [(locs[i], locs[i + 1]) for i in range(len(locs) - 1)]
-
-    suspicious_dat_miles = (not DAT_miles) or (DAT_miles <= 1)
-    has_repeats = _has_repeated_locations(locations_input)
-
-    if suspicious_dat_miles or has_repeats:
-        logger.warning(
-            "Roundtrip/repeat safeguard triggered. DAT_miles=%s repeats=%s locations=%s",
-            DAT_miles, has_repeats, locations_input
-        )
-
-        seg_dat_miles_sum = 0
-        seg_dat_avg_sum = 0
-
-        for idx, (o, d) in enumerate(_segment_pairs(locations_input), start=1):
-            seg_locations = [o, d]
-            seg_dat = get_DAT_data(seg_locations, equipment_type, pricing_mode, selected_months)
-            if not seg_dat:
-                st.error(f"No DAT result returned for segment {idx}: {o} -> {d}")
-                return
-
-            seg_raw = seg_dat["rate"]
-            seg_fuel = seg_dat["fuel_per_trip"]
-            seg_miles = seg_dat["miles"]
-            seg_avg = seg_raw + round(seg_fuel, 0)
-
-            seg_dat_miles_sum += (seg_miles or 0)
-            seg_dat_avg_sum += (seg_avg or 0)
-
-        if seg_dat_miles_sum > 1 and seg_dat_avg_sum > 0:
-            old_DAT_average = DAT_average
-            DAT_miles = seg_dat_miles_sum
-            DAT_average = seg_dat_avg_sum
+        st.success(f"Auto markup based on MCI: {round(Mark_up * 100)}%")
 
-            logger.info(
-                "Using segment-summed DAT values. DAT_miles=%s DAT_average=%s",
-                DAT_miles, DAT_average
-            )
+    SHOW_RESULT(result["route_data"], result["mci_data"], result["gs_data"], Mark_up, result["chaos_data"], quote["pricing_mode"])
 
-            stops = max(0, len(locations_input) - 2)
-            if stops == 0 and old_DAT_average:
-                try:
-                    ratio = DAT_average / old_DAT_average
-                    effective_avg = round(effective_avg * ratio)
-                except Exception:
-                    logger.exception("Failed to rescale effective_avg after segment override.")
+    if quote.get("forecast_curve"):
+        render_forecast_chart(quote["forecast_curve"], quote["selected_months"])
 
-    # HOTSHOT logic
-    if equipment_type == "HOTSHOT":
-        w = int(hotshot_weight_lbs)
-        hotshot_factor = 1.0 if w > 10000 else 0.8
-        effective_avg = round(effective_avg * hotshot_factor)
+    with st.expander("What-if: sell rate by markup and extra stops"):
+        render_what_if_grid(result, quote["customer"], quote["equipment_type"])
 
-    if "quote_history" not in st.session_state:
-        st.session_state.quote_history = []
 
-    from_location = parse_location_string_spots(locations_input[0])
-    to_location = parse_location_string_spots(locations_input[-1])
+WHAT_IF_MARKUPS = np.round(np.arange(0.06, 0.305, 0.02), 2)
+WHAT_IF_EXTRA_STOPS = np.arange(0, 5)
 
-    origin_city = from_location.get("city", "Unknown")
-    origin_state = from_location.get("stateOrProvince", "Unknown")
-    destination_city = to_location.get("city", "Unknown")
-    destination_state = to_location.get("stateOrProvince", "Unknown")
 
-    route_data = get_route_info(
-        locations_input,
-        DAT_miles,
-        DAT_average,
-        effective_avg,
-        blend_label,
-        Mark_up,
-        chaos_data["chaos_premium"],
-        equipment_type
+def render_what_if_grid(result, customer, equipment_type):
+    # Whole grid in one batch call: same rounding as the quote above, no API calls
+    route_data = result["route_data"]
+    grid = price_routes_batch(
+        route_data["dat_avg_rate"],
+        route_data["dat_miles"],
+        route_data["google_miles"],
+        route_data["Stops"] + WHAT_IF_EXTRA_STOPS[None, :],
+        *customer_rates(customer),
+        WHAT_IF_MARKUPS[:, None],
+        effective_avg_rate=route_data["dat_avg_rate"] + route_data["Correction_factor"],
+        hotshot=str(equipment_type).strip().upper() == "HOTSHOT",
     )
-    if not route_data:
-        st.error("Error processing route information.")
-        return
+    table = pd.DataFrame(
+        grid["final_rate"].astype(int),
+        index=[f"{round(m * 100)}%" for m in WHAT_IF_MARKUPS],
+        columns=[f"+{n} stops" for n in WHAT_IF_EXTRA_STOPS],
+    )
+    st.caption("Same lane and miles; extra stops priced at the customer's stop rate.")
+    st.dataframe(table, use_container_width=True)
 
-    final_rate = route_data["final_rate"]
-    lane_display = f"{origin_city}, {origin_state} → {destination_city}, {destination_state}"
 
-    new_quote = {
-        "equipment": equipment_type,
-        "mode": pricing_mode,
-        "Lane": lane_display,
-        "rate": final_rate
-    }
+def render_forecast_chart(forecast_curve, selected_months):
+    # Whole 52-week curve from the cached forecast; the months priced are highlighted
+    chart = pd.DataFrame(forecast_curve)
+    chart["date"] = pd.to_datetime(chart["date"]).dt.strftime("%Y-%m")
+    chart = chart.set_index("date").rename(columns={"forecastUSD": "DAT forecast (USD)"})
+    chart["Priced horizon"] = chart["DAT forecast (USD)"].where(pd.Series(range(len(chart)), index=chart.index) < selected_months)
 
-    st.session_state.quote_history.insert(0, new_quote)
-    st.session_state.quote_history = st.session_state.quote_history[:10]
-
-    SHOW_RESULT(route_data, mci_data, gs_data, Mark_up, chaos_data, pricing_mode)
+    st.markdown("##### DAT Contract forecast")
+    st.line_chart(chart)
 
 
 # -----------------------------
-# BUTTON ACTION: CALCULATE
+# QUOTE INPUTS & CALCULATE (fragment: widget changes rerun only this block)
 # -----------------------------
-if st.button("Calculate"):
-    if len(locations_input) < 2:
-        st.error("Please enter at least two locations.")
-    else:
-        run_pricing_flow(
-            locations_input,
-            equipment_type,
-            pricing_mode,
-            markup_mode,
-            user_markup if markup_mode == "Yes" else None,
-            hotshot_weight_lbs
-        )
-   
-        
-        
-        
-        
-        
-              
-        
-            
-
-        
-        
-            
-
-
-        
-            
-
-
-        
-   
-        
-        
-
-
-
-
-
-
-
-
-
-
-
-
+@st.fragment
+def quote_panel():
+    col1, col2 = st.columns(2)
 
+    with col1:
+        customer = st.selectbox("Select Customer:", CUSTOMERS, key="customer")
+    with col2:
+        equipment_type = st.selectbox("Select Equipment Type:", EQUIPMENT_TYPES, key="equipment_type")
 
+    # weight para HOTSHOT
+    hotshot_weight_lbs = None
+    if equipment_type == "HOTSHOT":
+        hotshot_weight_lbs = st.slider(
+            "Hotshot weight (lbs)",
+            min_value=0, max_value=40000, value=8000, step=500,
+            key="hotshot_weight_lbs"
+        )
 
+    markup_mode = st.radio(
+        "Do you want to input your own markup?",
+        options=["Yes", "No"],
+        horizontal=True,
+        index=1,
+        key="markup_mode"
+        )
 
+    user_markup = None
+    if markup_mode == "Yes":
+        user_markup = st.slider(
+            "Enter your mark-up",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.1,
+            step=0.01,
+            key="user_markup"
+        )
+        st.info(f"Manual markup selected: {round(user_markup * 100, 2)}%")
+    else:
+        st.info("Markup will be calculated automatically based on MCI values once you press Calculate.")
 
+    # -----------------------------
+    # LOCATION INPUT & PARSING
+    # -----------------------------
+    locations_input = parse_locations()
+    pricing_mode, selected_months = current_pricing_mode()
+
+    # Offline preview from the ZIP gazetteer: no API calls until Calculate
+    if len(locations_input) >= 2:
+        for problem in engine.check_locations(locations_input):
+            st.warning(problem)
+        estimated_miles = engine.estimate_miles(locations_input)
+        if estimated_miles is not None:
+            st.caption(f"Estimated distance: ~{estimated_miles:,} mi")
+        lane_history(locations_input, equipment_type)
 
+    # -----------------------------
+    # BUTTON ACTION: CALCULATE
+    # -----------------------------
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        calculate = st.button("Calculate")
+    with col2:
+        refresh = st.button("Refresh market data", help="Fetch DAT, MCI, GreenScreens and Google again for this lane")
+
+    if calculate or refresh:
+        if len(locations_input) < 2:
+            st.error("Please enter at least two locations.")
+        else:
+            with st.spinner("Fetching market data..."):
+                snapshot = get_market_snapshot(
+                    locations_input, equipment_type, pricing_mode, selected_months, refresh=refresh
+                )
+            quote = run_pricing_flow(
+                snapshot, locations_input, equipment_type, pricing_mode, selected_months,
+                customer, user_markup, hotshot_weight_lbs
+            )
+            add_to_quote_history(
+                quote, snapshot, locations_input, equipment_type, customer, user_markup, hotshot_weight_lbs
+            )
+            # Full rerun once per quote so the sidebar history picks it up
+            st.rerun()
+
+    # Live quote: every knob change re-prices the stored snapshot, no API calls
+    if len(locations_input) >= 2:
+        snapshot = find_market_snapshot(locations_input, equipment_type, pricing_mode, selected_months)
+        if snapshot is not None:
+            if snapshot_age(snapshot) > DAT_CACHE_TTL:
+                st.caption(
+                    f"Market data is {int(snapshot_age(snapshot) // 60)} min old: Calculate fetches it again."
+                )
+            elif snapshot_incomplete(snapshot):
+                st.caption("Some market data could not be fetched: Calculate tries again.")
+            with quote_trace(snapshot) as trace:
+                quote = run_pricing_flow(
+                    snapshot, locations_input, equipment_type, pricing_mode, selected_months,
+                    customer, user_markup, hotshot_weight_lbs
+                )
+                with span("render"):
+                    render_quote(quote)
+            keep_trace(trace)
 
 
+# -----------------------------
+# BULK RFP PRICING (UI)
+# -----------------------------
+@st.fragment
+def bulk_panel():
+    st.caption(
+        "One lane per row. Columns: `stops` (locations separated by `;`) or `origin` + `destination`, "
+        "plus optional `equipment`, `hotshot_weight_lbs`, `customer` and `markup` (%, auto from MCI when empty). "
+        "Or paste a Vooma load board with a blank line between loads. "
+        "Uses the pricing mode and forecast months from the sidebar."
+    )
+    bulk_file = st.file_uploader("Upload lanes", type=["csv", "xlsx"])
+    bulk_paste = st.text_area("...or paste loads from Vooma", key="bulk_paste")
+
+    if (bulk_file is not None or bulk_paste) and st.button("Price lanes"):
+        if bulk_file is None:
+            bulk_rows_in = ({"stops": stops} for stops in iter_vooma_loads(bulk_paste))
+        elif bulk_file.name.lower().endswith(".xlsx"):
+            bulk_rows_in = pd.read_excel(bulk_file).to_dict("records")
+        else:
+            bulk_rows_in = pd.read_csv(bulk_file).to_dict("records")
 
+        pricing_mode, selected_months = current_pricing_mode()
+        bulk_lanes = parse_bulk_lanes(bulk_rows_in)
 
+        if not bulk_lanes:
+            st.warning("No lanes found: check the file has rows, or that the paste has at least two stops per load.")
+        else:
+            progress = st.progress(0.0, text=f"Pricing {len(bulk_lanes)} lanes...")
+
+            bulk_rows = []
+            for done, bulk_row in enumerate(engine.price_lanes_bulk(bulk_lanes, pricing_mode, selected_months), start=1):
+                bulk_rows.append(bulk_row)
+                progress.progress(done / len(bulk_lanes), text=f"Priced {done}/{len(bulk_lanes)} lanes")
+
+            st.session_state["bulk_results"] = pd.DataFrame(bulk_rows).sort_values("row").reset_index(drop=True)
+
+    if "bulk_results" in st.session_state:
+        bulk_results = st.session_state["bulk_results"]
+        failed = bulk_results["error"].notna().sum()
+        st.write(f"**{len(bulk_results)} lanes priced** ({failed} with errors)")
+        st.dataframe(bulk_results, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "Download CSV",
+                bulk_results.to_csv(index=False),
+                file_name="priced_lanes.csv",
+                mime="text/csv"
+            )
+        with col2:
+            st.download_button(
+                "Download Parquet",
+                bulk_results.to_parquet(index=False),
+                file_name="priced_lanes.parquet",
+                mime="application/octet-stream"
+            )
 
 
+# -----------------------------
+# PAGE LAYOUT
+# -----------------------------
+# A full script run only happens on first load, after Calculate and on pricing
+# mode / horizon changes; every other interaction reruns just its fragment.
+st.markdown(load_css("assets/sidebar.css"), unsafe_allow_html=True)
+st.title("Multis Spot or Contract: Pricing Department")
 
+check_dat_auth()
+if st.session_state["dat_auth_error"]:
+    st.sidebar.error(st.session_state["dat_auth_error"])
 
+with st.sidebar:
+    pricing_mode_panel()
+    st.markdown("---")
+    quote_history_panel()
 
+quote_panel()
 
+with st.expander("Bulk RFP pricing (CSV / Excel)"):
+    bulk_panel()
 
+# Last in the script so the panel already includes this run's render spans
+with st.sidebar:
+    st.markdown("---")
+    perf_panel()
 
+if PERF_METRICS_FILE:
+    write_metrics_file(PERF_METRICS_FILE)
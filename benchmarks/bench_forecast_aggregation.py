@@ -0,0 +1,96 @@
+"""Monthly forecast aggregation: per-point Python loop vs. the NumPy batch in pricing_engine.
+
+    python benchmarks/bench_forecast_aggregation.py [--lanes 1000 5000] [--repeat 3]
+
+Every lane gets a synthetic 52-week forecast (one point per week, a few
+zero/missing points like the real API). The batch result is checked against
+the loop before timings are printed.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pricing_engine import aggregate_monthly_forecast, aggregate_monthly_forecasts  # noqa: E402
+
+
+# -----------------------------
+# BASELINE (the per-lane loop get_DAT_data used to run)
+# -----------------------------
+def loop_monthly_forecast(per_trip_data):
+    monthly_values = defaultdict(lambda: {"avg": []})
+
+    for point in per_trip_data:
+        date_str = point.get("forecastDate")
+        avg_usd = point.get("forecastUSD", 0)
+
+        if not date_str or avg_usd == 0:
+            continue
+
+        date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+        year_month = (date.year, date.month)
+        monthly_values[year_month]["avg"].append(avg_usd)
+
+    return [(ym, statistics.median(monthly_values[ym]["avg"])) for ym in sorted(monthly_values.keys())]
+
+
+# -----------------------------
+# SYNTHETIC FORECASTS
+# -----------------------------
+def make_forecast(rng, start):
+    base = rng.uniform(800, 4500)
+    points = []
+    for week in range(52):
+        date = start + timedelta(weeks=week)
+        value = round(base * (1 + 0.15 * rng.uniform(-1, 1)))
+        if rng.random() < 0.03:
+            value = 0
+        point = {"forecastUSD": value}
+        if rng.random() > 0.01:
+            point["forecastDate"] = date.strftime("%Y-%m-%dT%H:%M:%SZ")
+        points.append(point)
+    return points
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lanes", type=int, nargs="+", default=[1, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = datetime(2026, 1, 5, tzinfo=timezone.utc)
+
+    print(f"{'lanes':>7} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n_lanes in args.lanes:
+        forecasts = [make_forecast(rng, start + timedelta(days=rng.randrange(28))) for _ in range(n_lanes)]
+
+        loop_s, expected = timed(lambda: [loop_monthly_forecast(f) for f in forecasts], args.repeat)
+        numpy_s, actual = timed(lambda: aggregate_monthly_forecasts(forecasts), args.repeat)
+
+        if actual != expected:
+            sys.exit(f"MISMATCH at {n_lanes} lanes: NumPy aggregation differs from the loop")
+        if n_lanes and aggregate_monthly_forecast(forecasts[0]) != expected[0]:
+            sys.exit("MISMATCH: single-lane aggregation differs from the loop")
+
+        print(f"{n_lanes:>7} {loop_s * 1000:>10.1f} {numpy_s * 1000:>10.1f} {loop_s / numpy_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
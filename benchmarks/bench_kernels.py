@@ -0,0 +1,364 @@
+"""Micro-benchmarks and golden checks for the pure pricing kernels.
+
+    python benchmarks/bench_kernels.py [--repeat 7] [--kernels price_route calculate_chaos_premiums]
+    python benchmarks/bench_kernels.py --update-golden     # only after an intended price change
+
+Kernels: calculate_auto_markup, get_mci_adjustment, calculate_chaos_premiums,
+get_effective_avg_rate_with_blending, round_to_nearest_5 and price_route (the
+cost math behind get_route_info), plus the NumPy batch versions of the last
+three, which must give exactly the scalar prices. Each one runs over generated lane
+distributions (miles, stops, DAT high/low/avg, GS rate/confidence, MCI
+scores, plus the edge cases: zero DAT, .5 rounding ties, short hauls...).
+
+Before timing, every output is compared with benchmarks/golden_kernels.json
+(one short hash per case): a mismatch prints the lane and exits 1, so an
+optimization cannot silently change a price. Timings are ns/op (best and
+median of --repeat runs over all cases) and allocations per op, measured with
+tracemalloc: peak bytes while the call runs and bytes still held by its result.
+Batch kernels report ns per lane of one call over every case.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from pricing_engine import (  # noqa: E402
+    CUSTOMERS, EQUIPMENT_TYPES, calculate_auto_markup, calculate_chaos_premiums, get_effective_avg_rate_with_blending,
+    get_mci_adjustment, price_route, calculate_chaos_premiums_batch, customer_rates_batch, price_routes_batch,
+    round_to_nearest_5_batch,
+)
+from utils_parse import round_to_nearest_5  # noqa: E402
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_kernels.json")
+DEFAULT_SEED = 20240501
+DEFAULT_CASES = 2000
+
+# Same tables calculate_auto_markup uses, for the standalone get_mci_adjustment case
+ORIGIN_RULES = [
+    (lambda x: x >= 90, 0.02),
+    (lambda x: x >= 75, 0.015),
+    (lambda x: x >= 50, 0.01),
+    (lambda x: x <= -75, 0.01)
+]
+DESTINATION_RULES = [
+    (lambda x: x >= 75, -0.02),
+    (lambda x: x >= 50, -0.01),
+    (lambda x: x <= -75, 0.015)
+]
+
+
+# -----------------------------
+# LANE DISTRIBUTIONS
+# -----------------------------
+def _lane_miles(rng):
+    # Mostly regional/OTR, with the short-haul bands the chaos multiplier cares about
+    band = rng.random()
+    if band < 0.08:
+        return rng.randint(1, 99)
+    if band < 0.18:
+        return rng.randint(100, 249)
+    return int(rng.lognormvariate(6.6, 0.6)) + 250
+
+
+def _dat_rates(rng, miles):
+    avg = round(max(250, miles * rng.uniform(1.5, 4.2)))
+    high = round(avg * (1 + rng.uniform(0, 0.6)))
+    low = round(avg * (1 - rng.uniform(0, 0.4)))
+    roll = rng.random()
+    if roll < 0.03:
+        return avg, 0, 0                 # no spread returned
+    if roll < 0.05:
+        return avg, avg, avg             # flat market: skew denominator is 0
+    if roll < 0.06:
+        return 0, 0, 0
+    return avg, high, low
+
+
+def make_lanes(n, seed):
+    rng = random.Random(seed)
+    lanes = []
+    for _ in range(n):
+        dat_miles = _lane_miles(rng)
+        # Google vs DAT miles: usually a bit longer, sometimes shorter (miles_diff < 0)
+        google_miles = max(1, round(dat_miles * rng.uniform(0.85, 1.45)))
+        avg, high, low = _dat_rates(rng, dat_miles)
+        gs_rate = round(avg * rng.uniform(0.75, 1.3)) if rng.random() < 0.7 else 0
+        stops = rng.choice((0, 0, 0, 0, 1, 1, 2, 3, 4, 5, 6, 8))
+        mci = None if rng.random() < 0.05 else {
+            "origin_mci": rng.randint(-100, 100),
+            "destination_mci": rng.randint(-100, 100),
+        }
+        lanes.append({
+            "dat_miles": dat_miles,
+            "google_miles": google_miles,
+            "dat_avg": avg,
+            "dat_high": high,
+            "dat_low": low,
+            "gs_rate": gs_rate,
+            "gs_confidence": rng.randint(40, 100),
+            "stops": stops,
+            "mci": mci,
+            "equipment": rng.choice(EQUIPMENT_TYPES),
+            "customer": rng.choice(CUSTOMERS),
+            "markup": round(rng.uniform(0.05, 0.3), 4),
+            # Exact .5 ties (x.5 * 5) exercise round()'s banker's rounding
+            "to_round": rng.randint(0, 4000) * 2.5 if rng.random() < 0.3 else rng.uniform(0, 20000),
+        })
+    return lanes
+
+
+# -----------------------------
+# KERNEL CASES (positional args per lane)
+# -----------------------------
+def _route_args(lane):
+    locations = ["ORIGIN"] + [f"STOP {i}" for i in range(lane["stops"])] + ["DESTINATION"]
+    effective, label = get_effective_avg_rate_with_blending(lane["dat_avg"], lane["gs_rate"], lane["gs_confidence"])
+    return (
+        locations, lane["google_miles"], lane["dat_miles"], lane["dat_avg"] or 1, effective or None, label,
+        lane["markup"], 0, lane["equipment"], lane["customer"],
+    )
+
+
+KERNELS = {
+    "round_to_nearest_5": (round_to_nearest_5, lambda lane: (lane["to_round"],)),
+    "get_mci_adjustment": (
+        get_mci_adjustment,
+        # Origin table on odd-mile lanes, destination table on the rest
+        lambda lane: ((lane["mci"] or {}).get("origin_mci", 0), ORIGIN_RULES if lane["dat_miles"] % 2 else DESTINATION_RULES),
+    ),
+    "calculate_auto_markup": (calculate_auto_markup, lambda lane: (lane["mci"], lane["equipment"])),
+    "get_effective_avg_rate_with_blending": (
+        get_effective_avg_rate_with_blending,
+        lambda lane: (lane["dat_avg"], lane["gs_rate"], lane["gs_confidence"]),
+    ),
+    "calculate_chaos_premiums": (
+        calculate_chaos_premiums,
+        lambda lane: (lane["dat_avg"], lane["dat_high"], lane["dat_low"], lane["dat_miles"], lane["dat_avg"]),
+    ),
+    "price_route": (price_route, _route_args),
+}
+
+
+# -----------------------------
+# GOLDEN VALUES
+# -----------------------------
+def _canonical(value):
+    # repr keeps every float digit: 1049.9999 and 1050.0 hash differently
+    return json.dumps(value, sort_keys=True, default=repr, ensure_ascii=False)
+
+
+def output_hash(value):
+    return hashlib.sha1(_canonical(value).encode("utf-8")).hexdigest()[:12]
+
+
+def load_golden(path=GOLDEN_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_golden(golden, cases):
+    """Names of the kernels whose outputs differ from the golden hashes (details printed)."""
+    failed = []
+    for name, args_list in cases.items():
+        expected = golden["kernels"].get(name)
+        if expected is None:
+            print(f"  {name}: no golden values (run --update-golden)")
+            continue
+        fn = KERNELS[name][0]
+        for idx, (args, want) in enumerate(zip(args_list, expected)):
+            got = fn(*args)
+            if output_hash(got) != want:
+                print(f"  {name}: case {idx} changed")
+                print(f"    args:   {_canonical(args)}")
+                print(f"    output: {_canonical(got)}")
+                failed.append(name)
+                break
+    return failed
+
+
+def write_golden(cases, seed, path=GOLDEN_PATH):
+    golden = {
+        "seed": seed,
+        "cases": len(next(iter(cases.values()))),
+        "kernels": {name: [output_hash(KERNELS[name][0](*args)) for args in args_list] for name, args_list in cases.items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, separators=(",", ":"))
+        f.write("\n")
+
+
+# -----------------------------
+# BATCH KERNELS (must match the scalar ones case by case)
+# -----------------------------
+def _batch_route_inputs(route_cases):
+    locations, google, dat_miles, dat_avg, effective, _, markup, _, equipment, customer = zip(*route_cases)
+    stop_price, layover_rate, extra_stop_rate = customer_rates_batch(customer)
+    return dict(
+        DAT_average=np.array(dat_avg, dtype=float),
+        DAT_miles=np.array(dat_miles, dtype=float),
+        google_miles=np.array(google, dtype=float),
+        stops=np.array([len(locs) - 2 for locs in locations], dtype=float),
+        stop_price=stop_price,
+        layover_rate=layover_rate,
+        Mark_up=np.array(markup, dtype=float),
+        extra_stop_rate=extra_stop_rate,
+        effective_avg_rate=np.array([np.nan if e is None else e for e in effective], dtype=float),
+        hotshot=np.array([str(e).strip().upper() == "HOTSHOT" for e in equipment]),
+    )
+
+
+BATCH_KERNELS = {
+    # name: (batch fn, scalar kernel it replaces, cases -> kwargs, output keys compared)
+    "round_to_nearest_5_batch": (
+        lambda values: {"rounded": round_to_nearest_5_batch(values)}, "round_to_nearest_5",
+        lambda cases: {"values": np.array([args[0] for args in cases], dtype=float)}, ("rounded",),
+    ),
+    "calculate_chaos_premiums_batch": (
+        lambda **kw: {"chaos_premium": calculate_chaos_premiums_batch(**kw)}, "calculate_chaos_premiums",
+        lambda cases: dict(zip(
+            ("DAT_avg", "DAT_high", "DAT_low", "miles", "adjusted_base_rate"),
+            (np.array(column, dtype=float) for column in zip(*cases)),
+        )),
+        ("chaos_premium",),
+    ),
+    "price_routes_batch": (
+        price_routes_batch, "price_route", _batch_route_inputs,
+        ("total_cost", "final_rate", "layover", "extra_stops", "extra_miles"),
+    ),
+}
+
+
+def _scalar_value(output, key):
+    if key == "rounded":
+        return output
+    return output[key]
+
+
+def check_batch(names, cases):
+    """Names of the batch kernels that price any case differently from their scalar kernel."""
+    failed = []
+    for name in names:
+        fn, scalar_name, inputs, keys = BATCH_KERNELS[name]
+        scalar_cases = cases[scalar_name]
+        batch = fn(**inputs(scalar_cases))
+        scalar_fn = KERNELS[scalar_name][0]
+        for idx, args in enumerate(scalar_cases):
+            expected = scalar_fn(*args)
+            diffs = {k: (_scalar_value(expected, k), batch[k][idx].item()) for k in keys
+                     if _scalar_value(expected, k) != batch[k][idx]}
+            if diffs:
+                print(f"  {name}: case {idx} differs from {scalar_name} (scalar, batch): {diffs}")
+                failed.append(name)
+                break
+    return failed
+
+
+# -----------------------------
+# TIMING / ALLOCATIONS
+# -----------------------------
+def time_kernel(fn, args_list, repeat):
+    """ns/op over every case: (best, median) of `repeat` runs."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for args in args_list:
+            fn(*args)
+        runs.append((time.perf_counter_ns() - start) / len(args_list))
+    return min(runs), statistics.median(runs)
+
+
+def allocations(fn, args_list, sample=200):
+    """Mean bytes per op: peak while the call runs, and retained by its result."""
+    args_list = args_list[:sample]
+    peak_total = retained_total = 0
+    tracemalloc.start()
+    try:
+        for args in args_list:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = fn(*args)
+            current, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += current - before
+            del result
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(args_list), retained_total / len(args_list)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ns/op, allocations and golden checks for the pricing kernels.")
+    parser.add_argument("--kernels", nargs="+", choices=list(KERNELS), default=list(KERNELS))
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs over all cases (best and median reported)")
+    parser.add_argument("--update-golden", action="store_true", help="Rewrite the golden values from the current code")
+    parser.add_argument("--json", help="Also write the results here, for comparing runs")
+    args = parser.parse_args(argv)
+
+    golden = None if args.update_golden else load_golden()
+    seed = golden["seed"] if golden else DEFAULT_SEED
+    n_cases = golden["cases"] if golden else DEFAULT_CASES
+    lanes = make_lanes(n_cases, seed)
+
+    if args.update_golden:
+        all_cases = {name: [build(lane) for lane in lanes] for name, (_, build) in KERNELS.items()}
+        write_golden(all_cases, seed)
+        print(f"Golden values written for {len(all_cases)} kernels x {n_cases} cases -> {GOLDEN_PATH}")
+        return 0
+
+    cases = {name: [KERNELS[name][1](lane) for lane in lanes] for name in args.kernels}
+    if golden is None:
+        print(f"No golden values at {GOLDEN_PATH}: run with --update-golden first.")
+        return 1
+
+    batch_names = [name for name, spec in BATCH_KERNELS.items() if spec[1] in cases]
+    failed = check_golden(golden, cases) + check_batch(batch_names, cases)
+    if failed:
+        print(f"Golden check FAILED: {', '.join(failed)}")
+        return 1
+    print(f"Golden check ok: {len(cases) + len(batch_names)} kernels x {n_cases} cases (seed {seed})")
+
+    results = []
+    print(f"{'kernel':<38} {'ns/op':>9} {'median':>9} {'peak B/op':>10} {'kept B/op':>10}")
+    for name, args_list in cases.items():
+        fn = KERNELS[name][0]
+        best, median = time_kernel(fn, args_list, args.repeat)
+        peak, retained = allocations(fn, args_list)
+        results.append({
+            "kernel": name, "ns_per_op": round(best, 1), "median_ns_per_op": round(median, 1),
+            "peak_bytes_per_op": round(peak, 1), "retained_bytes_per_op": round(retained, 1),
+        })
+        print(f"{name:<38} {best:>9.1f} {median:>9.1f} {peak:>10.1f} {retained:>10.1f}")
+
+    for name in batch_names:
+        fn, scalar_name, inputs, _ = BATCH_KERNELS[name]
+        # One call over every case: ns per lane
+        batch_args = [(inputs(cases[scalar_name]),)]
+        best, median = time_kernel(lambda kwargs: fn(**kwargs), batch_args, args.repeat)
+        peak, retained = allocations(lambda kwargs: fn(**kwargs), batch_args)
+        best, median, peak, retained = (value / n_cases for value in (best, median, peak, retained))
+        results.append({
+            "kernel": name, "ns_per_op": round(best, 1), "median_ns_per_op": round(median, 1),
+            "peak_bytes_per_op": round(peak, 1), "retained_bytes_per_op": round(retained, 1),
+        })
+        print(f"{name:<38} {best:>9.1f} {median:>9.1f} {peak:>10.1f} {retained:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"seed": seed, "cases": n_cases, "repeat": args.repeat, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
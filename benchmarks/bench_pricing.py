@@ -0,0 +1,167 @@
+"""End-to-end quote benchmark against the local provider mocks.
+
+    python benchmarks/bench_pricing.py --quotes 200 --concurrency 8 --latency dat_lookup=120 gs_predict=350
+    python benchmarks/bench_pricing.py --provider-url http://127.0.0.1:8765 --json bench.json
+
+Starts benchmarks/mock_providers.py in-process (unless --provider-url is
+given), points every provider URL at it and prices Spot, Contract, multi-stop
+and roundtrip lanes through PricingEngine.price_lane, the same path the app
+takes. Every scenario starts with cold caches and a fresh route store; lanes
+repeat once --quotes exceeds --lanes, so the warm-cache share is up to you.
+
+Reports quotes/sec, p50/p95/p99 quote latency, errors and provider API calls
+per quote (total and per endpoint, as counted by the mock).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_providers import add_mock_arguments, mock_from_args  # noqa: E402
+
+
+CITIES = [
+    "60601, Chicago, IL", "75201, Dallas, TX", "30303, Atlanta, GA", "90012, Los Angeles, CA",
+    "85003, Phoenix, AZ", "77002, Houston, TX", "80202, Denver, CO", "98104, Seattle, WA",
+    "37203, Nashville, TN", "46204, Indianapolis, IN", "43215, Columbus, OH", "28202, Charlotte, NC",
+    "64106, Kansas City, MO", "55401, Minneapolis, MN", "32202, Jacksonville, FL", "84101, Salt Lake City, UT",
+    "Memphis, TN", "Laredo, TX", "Savannah, GA", "Reno, NV", "Allentown, PA", "Fresno, CA",
+]
+
+SCENARIOS = {
+    # name: (pricing mode, stops per lane, roundtrip)
+    "spot": ("Spot", 2, False),
+    "contract": ("Contract", 2, False),
+    "multistop": ("Spot", 4, False),
+    "roundtrip": ("Spot", 2, True),
+}
+
+
+def make_lanes(rng, n_lanes, n_stops, roundtrip):
+    lanes = []
+    for _ in range(n_lanes):
+        stops = rng.sample(CITIES, n_stops)
+        if roundtrip:
+            stops.append(stops[0])
+        lanes.append({"locations": stops, "equipment": rng.choice(["VAN", "REEFER", "FLATBED"])})
+    return lanes
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+def run_scenario(pe, mock, name, args, rng):
+    from utils_cache import clear_caches
+
+    pricing_mode, n_stops, roundtrip = SCENARIOS[name]
+    selected_months = pe.forecast_months_to_selected(args.months) if pricing_mode == "Contract" else 1
+    lanes = make_lanes(rng, args.lanes or args.quotes, n_stops, roundtrip)
+
+    # Cold start: in-memory caches emptied, Google legs stored in a throwaway file
+    clear_caches()
+    pe.ROUTE_CACHE_PATH = os.path.join(args.workdir, f"routes_{name}_{time.monotonic_ns()}.sqlite3")
+
+    engine = pe.PricingEngine(
+        api_key="bench", org_username="bench", org_password="bench",
+        account_username="bench", gs_client_secret="bench",
+    )
+
+    def quote(i):
+        lane = lanes[i % len(lanes)]
+        start = time.perf_counter()
+        try:
+            result = engine.price_lane(lane["locations"], lane["equipment"], pricing_mode, selected_months, "Other")
+            ok = "error" not in result
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    calls_before = mock.counts() if mock else {}
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(quote, range(args.quotes)))
+    wall = time.perf_counter() - wall_start
+    calls_after = mock.counts() if mock else {}
+
+    latencies = sorted(seconds * 1000 for seconds, _ in outcomes)
+    calls = {k: calls_after.get(k, 0) - calls_before.get(k, 0) for k in calls_after}
+    calls = {k: v for k, v in calls.items() if v}
+    return {
+        "scenario": name,
+        "quotes": args.quotes,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "quotes_per_sec": round(args.quotes / wall, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.fmean(latencies), 1),
+        "api_calls_per_quote": round(sum(calls.values()) / args.quotes, 2) if mock else None,
+        "api_calls": calls,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quotes/sec, latency percentiles and API calls per quote.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--quotes", type=int, default=100, help="Quotes per scenario")
+    parser.add_argument("--lanes", type=int, default=None, help="Distinct lanes per scenario (default: one per quote)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Quotes in flight at once")
+    parser.add_argument("--months", type=int, default=12, help="Forecast months for the Contract scenario")
+    parser.add_argument("--provider-url", help="Use an already running mock (or any stand-in) instead of starting one")
+    parser.add_argument("--json", help="Also write the results here, for comparing runs")
+    parser.add_argument("--metrics", help="Write the per-stage Prometheus metrics here after the run")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # Lane-level warnings (roundtrip safeguard, no rates...) would drown the table
+    logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
+
+    mock = None
+    if args.provider_url:
+        provider_url = args.provider_url
+    else:
+        mock = mock_from_args(args)
+        provider_url = mock.start()
+
+    # Provider URLs are read from the environment when Access is first imported
+    os.environ["SPOTS_PROVIDER_URL"] = provider_url
+    import pricing_engine as pe
+
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        print(f"providers: {provider_url}   quotes/scenario: {args.quotes}   concurrency: {args.concurrency}")
+        print(f"{'scenario':<10} {'q/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'calls/q':>8}")
+        for name in args.scenarios:
+            row = run_scenario(pe, mock, name, args, rng)
+            results.append(row)
+            calls = "-" if row["api_calls_per_quote"] is None else f"{row['api_calls_per_quote']:.2f}"
+            print(f"{name:<10} {row['quotes_per_sec']:>7.2f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {row['errors']:>6} {calls:>8}   {row['api_calls']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "workdir"}, "results": results}, f, indent=2)
+    if args.metrics:
+        from utils_perf import write_metrics_file
+        write_metrics_file(args.metrics)
+    if mock:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
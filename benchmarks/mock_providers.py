@@ -0,0 +1,295 @@
+"""Local stand-ins for every provider endpoint the pricer calls.
+
+    python benchmarks/mock_providers.py --port 8765 --latency dat_lookup=120 gs_predict=350 \
+        --error-rate 0.02 --no-rates 0.1
+
+then run the app or the CLI with SPOTS_PROVIDER_URL=http://127.0.0.1:8765.
+
+DAT identity/lookups/forecast/MCI, GreenScreens auth/predict and Google
+computeRoutes are served from one port with the same paths as the real APIs.
+Answers are deterministic per lane (hash of the request), so caches behave as
+they would live. Latency (lognormal around the mean), 429/5xx error rate and
+the share of "No rates available" lookups are configurable.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+ENDPOINTS = {
+    ("POST", "/access/v1/token/organization"): "dat_auth",
+    ("POST", "/access/v1/token/user"): "dat_auth",
+    ("POST", "/linehaulrates/v1/lookups"): "dat_lookup",
+    ("POST", "/linehaulrates/v1/forecasts/spot"): "dat_forecast",
+    ("GET", "/marketconditions/v1/marketConditionsIndexes"): "mci",
+    ("POST", "/v1/auth/token"): "gs_auth",
+    ("POST", "/v3/prediction/rates"): "gs_predict",
+    ("POST", "/directions/v2:computeRoutes"): "google_route",
+}
+
+DEFAULT_LATENCY_MS = {     # rough live medians
+    "dat_auth": 150,
+    "dat_lookup": 250,
+    "dat_forecast": 400,
+    "mci": 120,
+    "gs_auth": 200,
+    "gs_predict": 600,
+    "google_route": 200,
+}
+
+
+def _unit(*parts):
+    # Stable pseudo-random number in [0, 1) for a request
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _lane_miles(origin, destination):
+    if origin == destination:
+        return 1    # what DAT answers for an A -> A lookup (roundtrips)
+    return int(150 + 2200 * _unit("miles", origin, destination))
+
+
+# -----------------------------
+# PROVIDER ANSWERS
+# -----------------------------
+def _dat_lookup(body, no_rates):
+    responses = []
+    for rate_request in body:
+        origin, destination = rate_request.get("origin"), rate_request.get("destination")
+        if _unit("no_rates", rate_request) < no_rates:
+            responses.append({"response": {"errors": [{"message": "No rates available for this lane."}]}})
+            continue
+
+        miles = _lane_miles(_lane_key(origin), _lane_key(destination))
+        rate = round(miles * (1.6 + 1.8 * _unit("rpm", origin, destination, rate_request.get("equipment"))))
+        responses.append({"response": {"rate": {
+            "mileage": miles,
+            "averageFuelSurchargePerTripUsd": round(miles * 0.45, 2),
+            "perTrip": {"rateUsd": rate, "highUsd": round(rate * 1.18), "lowUsd": round(rate * 0.84)},
+        }}})
+    return {"rateResponses": responses}
+
+
+def _lane_key(stop):
+    # Full address and ZIP-only variants of the same stop price the same lane
+    stop = stop or {}
+    state = stop.get("stateOrProvince") or stop.get("stateProv") or ""
+    return stop.get("postalCode") or f"{stop.get('city', '')}|{state}".upper()
+
+
+def _dat_forecast(body):
+    origin, destination = body.get("origin"), body.get("destination")
+    miles = _lane_miles(_lane_key(origin), _lane_key(destination))
+    base = miles * (1.6 + 1.8 * _unit("rpm", origin, destination, body.get("equipmentCategory")))
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "mileage": miles,
+        "forecasts": {"perTrip": [
+            {
+                "forecastDate": (start + timedelta(weeks=week)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "forecastUSD": round(base * (1 + 0.08 * math.sin(week / 52 * 2 * math.pi))),
+            }
+            for week in range(52)
+        ]},
+    }
+
+
+def _mci(query):
+    place = query.get("postalCode") or f"{query.get('city')}|{query.get('stateOrProvince')}".upper()
+    market = f"{query.get('stateOrProvince') or place[:3]}-{int(_unit('market', place) * 4)}"
+    score = round(-100 + 200 * _unit("mci", market, query.get("direction"), query.get("equipmentCategory")))
+    return [{"area": {"id": market}, "marketConditionsIndexes": [{"mciScore": score}]}]
+
+
+def _google_route(body):
+    stops = [body["origin"]["address"]]
+    stops += [stop["address"] for stop in body.get("intermediates", [])]
+    stops.append(body["destination"]["address"])
+    legs = [{"distanceMeters": int(_lane_miles(a, b) * 1609.344)} for a, b in zip(stops, stops[1:])]
+    return {"routes": [{"distanceMeters": sum(leg["distanceMeters"] for leg in legs), "legs": legs}]}
+
+
+def _gs_predict(body):
+    stops = body.get("stops", [])
+    key = [stop.get("zip") or stop.get("city") for stop in stops]
+    return {
+        "targetBuyRate": round(1.7 + 1.8 * _unit("gs", key, body.get("transportType")), 2),
+        "distance": _lane_miles(key[0] if key else "", key[-1] if key else ""),
+        "confidenceLevel": int(40 + 55 * _unit("confidence", key)),
+    }
+
+
+# -----------------------------
+# SERVER
+# -----------------------------
+class MockProviders:
+    """The mock server plus its knobs and per-endpoint call counts."""
+
+    def __init__(self, latency_ms=None, latency_sigma=0.35, error_rate=0.0, no_rates=0.0, seed=None):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.no_rates = no_rates
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve from a daemon thread; returns the base URL."""
+        handler = type("Handler", (_Handler,), {"mock": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-providers", daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def counts(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def _count(self, endpoint):
+        with self._counts_lock:
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+
+    def _delay(self, endpoint):
+        # Lognormal with the configured mean: a realistic long tail
+        with self._rng_lock:
+            factor = self._rng.lognormvariate(-self.latency_sigma ** 2 / 2, self.latency_sigma)
+            failed = self._rng.random() < self.error_rate
+            status = self._rng.choice((429, 500, 503))
+        return self.latency_ms.get(endpoint, 0) / 1000 * factor, status if failed else None
+
+    def answer(self, endpoint, body, query):
+        if endpoint == "dat_auth":
+            expires = datetime.now(timezone.utc) + timedelta(minutes=30)
+            return {"accessToken": "mock-dat-token", "expiresWhen": expires.isoformat()}
+        if endpoint == "dat_lookup":
+            return _dat_lookup(body, self.no_rates)
+        if endpoint == "dat_forecast":
+            return _dat_forecast(body)
+        if endpoint == "mci":
+            return _mci(query)
+        if endpoint == "gs_auth":
+            return {"access_token": "mock-gs-token", "expires_in": 3600}
+        if endpoint == "gs_predict":
+            return _gs_predict(body)
+        return _google_route(body)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real providers
+    mock = None
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        endpoint = ENDPOINTS.get((method, parts.path))
+        if endpoint is None:
+            self._send(404, {"error": f"No mock for {method} {parts.path}"})
+            return
+
+        self.mock._count(endpoint)
+        delay, failure = self.mock._delay(endpoint)
+        time.sleep(delay)
+        if failure:
+            self._send(failure, {"error": "mock failure"})
+            return
+
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            body = {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+        else:
+            body = json.loads(raw) if raw else {}
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        self._send(200, self.mock.answer(endpoint, body, query))
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def parse_latency(items):
+    """["dat_lookup=120", "gs_predict=350"] -> {"dat_lookup": 120.0, "gs_predict": 350.0}"""
+    latency = {}
+    for item in items or []:
+        endpoint, _, ms = item.partition("=")
+        if endpoint not in DEFAULT_LATENCY_MS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {endpoint!r}; one of {', '.join(DEFAULT_LATENCY_MS)}")
+        latency[endpoint] = float(ms)
+    return latency
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", nargs="*", metavar="ENDPOINT=MS",
+                        help=f"Mean latency per endpoint ({', '.join(DEFAULT_LATENCY_MS)})")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Lognormal spread of the latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered 429/500/503")
+    parser.add_argument("--no-rates", type=float, default=0.0, help="Share of DAT lookups answered 'No rates available'")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def mock_from_args(args):
+    return MockProviders(
+        latency_ms=parse_latency(args.latency),
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        no_rates=args.no_rates,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local DAT / GreenScreens / Google stand-ins.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = mock_from_args(args)
+    url = mock.start(args.host, args.port)
+    print(f"Mock providers on {url}  (SPOTS_PROVIDER_URL={url})", flush=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(f"calls: {mock.counts()}", flush=True)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
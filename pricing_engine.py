@@ -0,0 +1,1730 @@
+"""Headless pricing engine: provider clients + pricing math, no Streamlit.
+
+Spot_project.py is only the UI on top of this module. Workers, batch jobs
+and benchmarks can import it directly, or price lanes from the command line:
+
+    python pricing_engine.py lanes.json --mode Contract --months 6
+    python pricing_engine.py load_board.txt --vooma
+    cat lanes.jsonl | python pricing_engine.py
+"""
+# -----------------------------
+# LIBRARIES
+# -----------------------------
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from itertools import repeat
+
+import numpy as np
+
+# -----------------------------
+# CONNECTIONS / CONFIG IMPORTS
+# -----------------------------
+from Access import user_url, org_url, url_spot, base_url, url_forecast, url_MCI, GS_CLIENT_ID, GS_AUTH_URL, GS_PREDICT_URL
+from Access import DAT_TOKEN_REFRESH_MARGIN, DAT_TOKEN_DEFAULT_TTL, DAT_TOKEN_CACHE_PATH, GS_TOKEN_REFRESH_MARGIN
+from Access import DAT_CACHE_TTL, DAT_CACHE_NO_RATES_TTL, DAT_CACHE_MAXSIZE, MCI_ROLLOVER_HOUR_UTC, ROUTE_CACHE_PATH
+from Access import BULK_DAT_BATCH_SIZE, BULK_LANE_WORKERS, BULK_PROVIDER_CONCURRENCY
+from Access import ZIP_GAZETTEER_PATH, ROAD_CIRCUITY, DAT_FORECAST_CACHE_TTL, DAT_FORECAST_CACHE_MAXSIZE
+from Access import QUOTE_DEADLINE_SECONDS, QUOTE_OPTIONAL_PROVIDERS, QUOTE_OPTIONAL_GRACE
+from utils_parse import Location, parse_bulk_lanes, iter_vooma_loads, round_to_nearest_5
+from utils_http import http_get, http_post, Deadline, deadline_scope, bind_context, use_cassette
+from utils_auth import get_dat_token_broker, get_greenscreens_client
+from utils_cache import get_cache, dat_lookup_key, get_mci_cache, get_distance_store
+from utils_geo import get_gazetteer
+from utils_perf import span, metrics, write_metrics_file
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# CUSTOMERS & EQUIPMENT
+# -----------------------------
+CUSTOMERS = ["Fabuwood Cabinetry", "Other"]
+EQUIPMENT_TYPES = ["VAN", "FLATBED", "REEFER", "STEPDECK", "CONESTOGA", "HOTSHOT"]
+
+# customer: (price per extra stop, layover per day, surcharge per 4 stops when more than 4)
+CUSTOMER_RATES = {"Fabuwood Cabinetry": (150, 125, 100)}
+DEFAULT_CUSTOMER_RATES = (100, 200, 150)
+
+
+def customer_rates(customer):
+    return CUSTOMER_RATES.get(customer, DEFAULT_CUSTOMER_RATES)
+
+
+def get_stop_price(customer):
+    return customer_rates(customer)[0]
+
+
+def provider_equipment(equipment_type: str) -> str:
+    return "FLATBED" if equipment_type in ("STEPDECK", "CONESTOGA", "HOTSHOT") else equipment_type
+
+
+def forecast_months_to_selected(months_to_forecast):
+    # Sidebar "Forecast months" -> number of forecast months averaged (current month included below 12)
+    return months_to_forecast + 1 if months_to_forecast < 12 else 12
+
+
+# -----------------------------
+# RULES FOR MCI
+# -----------------------------
+
+def get_mci_adjustment(mci_score, rules):
+    for condition, adjustment in rules:
+        if condition(mci_score):
+            return adjustment
+    return 0
+
+
+def calculate_auto_markup(mci_data, equipment_type):
+    if not mci_data:
+        return 0.01
+
+    origin_mci = mci_data["origin_mci"]
+    destination_mci = mci_data["destination_mci"]
+
+    # Base por equipo
+    if equipment_type == "VAN":
+        base_markup = 0.12
+    elif equipment_type in ["REEFER", "FLATBED"]:
+        base_markup = 0.16
+    elif equipment_type == "STEPDECK":
+        base_markup = 0.16 + 0.06   # Flatbed (12%) + 6 pp = 18%
+    elif equipment_type == "CONESTOGA":
+        base_markup = 0.16 + 0.08   # Flatbed (12%) + 8 pp = 20%
+    else:
+        base_markup = 0.12
+
+    origin_rules = [
+        (lambda x: x >= 90, 0.02),
+        (lambda x: x >= 75, 0.015),
+        (lambda x: x >= 50, 0.01),
+        (lambda x: x <= -75, 0.01)
+    ]
+    destination_rules = [
+        (lambda x: x >= 75, -0.02),
+        (lambda x: x >= 50, -0.01),
+        (lambda x: x <= -75, 0.015)
+    ]
+
+    origin_adj = get_mci_adjustment(origin_mci, origin_rules)
+    dest_adj = get_mci_adjustment(destination_mci, destination_rules)
+
+    return base_markup + origin_adj + dest_adj
+
+
+# -----------------------------
+# GS AND DAT
+# -----------------------------
+
+def get_effective_avg_rate_with_blending(DAT_average, total_all_in, confidence):
+    if total_all_in > 0 and confidence >= 89:
+        base_rate = 0.5 * DAT_average + 0.5 * total_all_in
+        blend_label = "50/50 DAT GS"
+    elif total_all_in > 0 and confidence >= 76:
+        base_rate = 0.65 * DAT_average + 0.35 * total_all_in
+        blend_label = "65/35 DAT GS"
+    else:
+        base_rate = DAT_average
+        blend_label = "100% DAT"
+
+    return round(base_rate), blend_label
+
+
+def blend_discrepancy_note(DAT_average, total_all_in):
+    if total_all_in > 0:
+        discrepancy_pct = abs(DAT_average - total_all_in) / DAT_average * 100
+        if discrepancy_pct > 20:
+            return "GS and DAT differ by more than 20%. Defaulting to DAT."
+        elif discrepancy_pct > 10:
+            return "GS and DAT differ by more than 10%."
+    return None
+
+
+# -----------------------------
+# CALCULATE CHAOS PREMIUMS
+# -----------------------------
+def calculate_chaos_premiums(DAT_avg, DAT_high, DAT_low, miles, adjusted_base_rate):
+    if not all([DAT_avg, DAT_high, DAT_low]):
+        return {
+            "volatility": 0,
+            "skew": 0,
+            "volatility_premium": 0,
+            "skew_premium": 0,
+            "chaos_premium": 0,
+            "risk_level": "Unknown"
+        }
+
+    volatility = (DAT_high - DAT_low) / DAT_avg if DAT_avg else 0
+    skew = (DAT_high - DAT_avg) / (DAT_avg - DAT_low) if (DAT_avg - DAT_low) else 0
+    upper_spread = DAT_high - DAT_avg
+
+    # Risk level y cap
+    if volatility > 0.4 or skew > 2.0:
+        risk = "High Risk"
+        max_chaos_pct = 0.20
+    elif volatility > 0.2 or skew > 1.0:
+        risk = "Moderate Risk"
+        max_chaos_pct = 0.10
+    else:
+        risk = "Low Risk"
+        max_chaos_pct = 0.05
+
+    if volatility <= 0.1:
+        vol_pct = 0.02
+    elif volatility <= 0.2:
+        vol_pct = 0.04
+    elif volatility <= 0.3:
+        vol_pct = 0.06
+    elif volatility <= 0.4:
+        vol_pct = 0.08
+    else:
+        vol_pct = 0.12
+
+    if skew <= 0.5:
+        skew_pct = 0.00
+    elif skew <= 1.0:
+        skew_pct = 0.04
+    elif skew <= 1.5:
+        skew_pct = 0.06
+    elif skew <= 2.0:
+        skew_pct = 0.08
+    else:
+        skew_pct = 0.12
+
+    raw_vol_premium = vol_pct * upper_spread
+    raw_skew_premium = skew_pct * upper_spread
+    raw_chaos_premium = raw_vol_premium + raw_skew_premium
+
+    capped_chaos_premium = min(raw_chaos_premium, max_chaos_pct * adjusted_base_rate)
+
+    if raw_chaos_premium > 0:
+        vol_premium = round(capped_chaos_premium * (raw_vol_premium / raw_chaos_premium), 2)
+        skew_premium = round(capped_chaos_premium * (raw_skew_premium / raw_chaos_premium), 2)
+    else:
+        vol_premium = 0
+        skew_premium = 0
+
+    if miles < 100:
+        chaos_multiplier = 0.25
+    elif miles < 250:
+        chaos_multiplier = 0.5
+    else:
+        chaos_multiplier = 1.0
+
+    chaos_premium = round((vol_premium + skew_premium) * chaos_multiplier, 2)
+
+    return {
+        "volatility": round(volatility, 3),
+        "skew": round(skew, 3),
+        "volatility_premium": vol_premium,
+        "skew_premium": skew_premium,
+        "chaos_premium": chaos_premium,
+        "risk_level": risk
+    }
+
+
+# -----------------------------
+# ROUTE PRICING (the math behind get_route_info)
+# -----------------------------
+def price_route(locations, total_distance_miles, DAT_miles, DAT_average, effective_avg_rate=None, blend_label=None,
+                Mark_up=0.1, chaos_premium=0, equipment_type=None, customer="Other"):
+
+    # 2. Layover logic
+    Days_miles = DAT_miles / 600
+    Google_days = total_distance_miles / 600
+    layover_count = max(0, int(Google_days) - int(Days_miles))
+
+    # 3. Stops logic
+    stops = len(locations) - 2
+    stop_price, layover_rate, extra_stop_rate = customer_rates(customer)
+    total_additions = stops * stop_price
+
+    layover = layover_count * layover_rate
+    increase_per_stop = round((stops / 4) * extra_stop_rate, 2) if stops > 4 else 0
+
+    if str(equipment_type).strip().upper() == "HOTSHOT":
+        base_rate_for_rpm = effective_avg_rate if effective_avg_rate is not None else DAT_average
+    else:
+        base_rate_for_rpm = DAT_average if stops > 0 else (effective_avg_rate or DAT_average)
+
+    RPM = base_rate_for_rpm / DAT_miles
+    mileage_charge = RPM * total_distance_miles
+
+    miles_diff = total_distance_miles - DAT_miles
+
+    if miles_diff >= 0:
+        total_cost = round_to_nearest_5(
+            mileage_charge + total_additions + increase_per_stop + layover
+        )
+    else:
+        total_cost = round_to_nearest_5(
+            base_rate_for_rpm + total_additions + increase_per_stop + layover
+        )
+
+    Final_Rate = round_to_nearest_5(total_cost * (1 + Mark_up)) #+ chaos_premium)
+
+    Manual_adj_buy = total_cost - base_rate_for_rpm
+
+    correction_factor = effective_avg_rate - DAT_average if effective_avg_rate is not None else 0
+
+    adj_layover = layover
+    adj_extra_stops = increase_per_stop + total_additions
+    adj_extra_miles_plus_margin = round((Manual_adj_buy) - (adj_layover + adj_extra_stops), 2) if miles_diff >= 0 else 0
+
+    return {
+        "google_miles": total_distance_miles,
+        "dat_miles": DAT_miles,
+        "dat_avg_rate": DAT_average,
+        "total_cost": total_cost,
+        "final_rate": Final_Rate,
+        "layover": adj_layover,
+        "extra_stops": adj_extra_stops,
+        "extra_miles": adj_extra_miles_plus_margin,
+        "blend_label": blend_label,
+        "effective_avg_rate": base_rate_for_rpm,
+        "Stops": stops,
+        "Correction_factor": correction_factor,
+        "Origin": locations[0]
+    }
+
+
+# -----------------------------
+# BATCH PRICING (NumPy: what-if grids, thousands of RFP lanes per call)
+# -----------------------------
+# Same math as calculate_chaos_premiums / price_route on arrays (any mix of
+# scalars and broadcastable arrays), with the same rounding: np.rint is
+# round-half-to-even like round(), and round(x, 2) ties are settled by round()
+# itself (see _round_like_python). benchmarks/bench_kernels.py checks that
+# both paths give the same prices.
+def _round_like_python(values, ndigits):
+    # np.round scales by 10**ndigits first and can land on the other side of a
+    # tie that round() resolves on the exact value
+    values = np.asarray(values, dtype=float)
+    flat = values.reshape(-1)
+    rounded = np.round(flat, ndigits)
+    scaled = flat * 10.0 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(v, ndigits) for v in flat[near_tie].tolist()]
+    return rounded.reshape(values.shape)
+
+
+def round_to_nearest_5_batch(values):
+    return np.rint(np.asarray(values, dtype=float) / 5) * 5
+
+
+def customer_rates_batch(customers):
+    """Customer names -> (stop_price, layover_rate, extra_stop_rate) arrays."""
+    rates = np.array([customer_rates(customer) for customer in customers], dtype=float).reshape(-1, 3)
+    return rates[:, 0], rates[:, 1], rates[:, 2]
+
+
+def calculate_chaos_premiums_batch(DAT_avg, DAT_high, DAT_low, miles, adjusted_base_rate):
+    """chaos_premium of calculate_chaos_premiums for every lane at once."""
+    DAT_avg, DAT_high, DAT_low, miles, adjusted_base_rate = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (DAT_avg, DAT_high, DAT_low, miles, adjusted_base_rate))
+    )
+    priced = (DAT_avg != 0) & (DAT_high != 0) & (DAT_low != 0)
+    low_spread = DAT_avg - DAT_low
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volatility = np.where(DAT_avg != 0, (DAT_high - DAT_low) / DAT_avg, 0.0)
+        skew = np.where(low_spread != 0, (DAT_high - DAT_avg) / low_spread, 0.0)
+    upper_spread = DAT_high - DAT_avg
+
+    max_chaos_pct = np.select(
+        [(volatility > 0.4) | (skew > 2.0), (volatility > 0.2) | (skew > 1.0)], [0.20, 0.10], 0.05
+    )
+    vol_pct = np.select(
+        [volatility <= 0.1, volatility <= 0.2, volatility <= 0.3, volatility <= 0.4], [0.02, 0.04, 0.06, 0.08], 0.12
+    )
+    skew_pct = np.select([skew <= 0.5, skew <= 1.0, skew <= 1.5, skew <= 2.0], [0.00, 0.04, 0.06, 0.08], 0.12)
+
+    raw_vol_premium = vol_pct * upper_spread
+    raw_skew_premium = skew_pct * upper_spread
+    raw_chaos_premium = raw_vol_premium + raw_skew_premium
+    capped_chaos_premium = np.minimum(raw_chaos_premium, max_chaos_pct * adjusted_base_rate)
+
+    positive = raw_chaos_premium > 0
+    safe_raw = np.where(positive, raw_chaos_premium, 1.0)
+    vol_premium = np.where(positive, _round_like_python(capped_chaos_premium * (raw_vol_premium / safe_raw), 2), 0.0)
+    skew_premium = np.where(positive, _round_like_python(capped_chaos_premium * (raw_skew_premium / safe_raw), 2), 0.0)
+
+    chaos_multiplier = np.select([miles < 100, miles < 250], [0.25, 0.5], 1.0)
+    chaos_premium = _round_like_python((vol_premium + skew_premium) * chaos_multiplier, 2)
+    return np.where(priced, chaos_premium, 0.0)
+
+
+def price_routes_batch(DAT_average, DAT_miles, google_miles, stops, stop_price, layover_rate, extra_stop_rate,
+                       Mark_up, effective_avg_rate=None, hotshot=False, DAT_high=None, DAT_low=None, DAT_raw=None):
+    """price_route for many lanes (or one lane under many what-ifs) in one call.
+
+    `stops` counts the stops between origin and destination; stop_price,
+    layover_rate and extra_stop_rate are the customer's rates (customer_rates /
+    customer_rates_batch). effective_avg_rate NaN (or None) means no blended
+    rate, as in price_route.
+    With DAT_high and DAT_low the chaos premium is added, computed on DAT_raw
+    (rate without fuel; DAT_average when None) like _price_lane does.
+
+    Returns a dict of arrays: total_cost, final_rate, layover, extra_stops,
+    extra_miles and, with DAT_high / DAT_low, chaos_premium.
+    """
+    if effective_avg_rate is None:
+        effective_avg_rate = np.nan
+    (DAT_average, DAT_miles, google_miles, stops, stop_price, layover_rate, Mark_up, extra_stop_rate,
+     effective_avg_rate, hotshot) = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (
+            DAT_average, DAT_miles, google_miles, stops, stop_price, layover_rate, Mark_up, extra_stop_rate,
+            effective_avg_rate,
+        )),
+        np.asarray(hotshot, dtype=bool),
+    )
+
+    # Layover: whole driving days (600 mi) Google adds over DAT
+    layover_count = np.maximum(0, np.trunc(google_miles / 600) - np.trunc(DAT_miles / 600))
+    layover = layover_count * layover_rate
+
+    total_additions = stops * stop_price
+    increase_per_stop = np.where(stops > 4, _round_like_python((stops / 4) * extra_stop_rate, 2), 0.0)
+
+    has_effective = ~np.isnan(effective_avg_rate)
+    base_rate_for_rpm = np.where(
+        hotshot,
+        np.where(has_effective, effective_avg_rate, DAT_average),
+        np.where((stops > 0) | ~has_effective | (effective_avg_rate == 0), DAT_average, effective_avg_rate),
+    )
+
+    mileage_charge = base_rate_for_rpm / DAT_miles * google_miles
+    longer = google_miles - DAT_miles >= 0
+    total_cost = round_to_nearest_5_batch(
+        np.where(longer, mileage_charge, base_rate_for_rpm) + total_additions + increase_per_stop + layover
+    )
+    final_rate = round_to_nearest_5_batch(total_cost * (1 + Mark_up))
+
+    extra_stops = increase_per_stop + total_additions
+    extra_miles = np.where(
+        longer, _round_like_python((total_cost - base_rate_for_rpm) - (layover + extra_stops), 2), 0.0
+    )
+
+    priced = {
+        "total_cost": total_cost,
+        "final_rate": final_rate,
+        "layover": layover,
+        "extra_stops": extra_stops,
+        "extra_miles": extra_miles,
+    }
+    if DAT_high is not None and DAT_low is not None:
+        raw = DAT_average if DAT_raw is None else DAT_raw
+        priced["chaos_premium"] = calculate_chaos_premiums_batch(
+            raw, DAT_high, DAT_low, DAT_miles, np.asarray(raw, dtype=float) * (1 + Mark_up)
+        )
+    return priced
+
+
+# -----------------------------
+# DAT REQUEST BUILDERS & PARSERS
+# -----------------------------
+def _has_no_rates_error(errors):
+    if not errors:
+        return False
+    return any("No rates available" in (e.get("message", "") or "") for e in errors)
+
+
+def _spot_rate_request(o, d, equipment_type):
+    return {
+        "origin": o,
+        "destination": d,
+        "rateType": "SPOT",
+        "equipment": provider_equipment(equipment_type),
+        "includeMyRate": True,
+        "targetEscalation": {"escalationType": "BEST_FIT"}
+    }
+
+
+def _contract_rate_request(o, d, equipment_type, rate_type, specific_timeframe, area_type):
+    return {
+        "origin": o,
+        "destination": d,
+        "rateType": rate_type,
+        "equipment": provider_equipment(equipment_type),
+        "includeMyRate": True,
+        "targetEscalation": {
+            "escalationType": "SPECIFIC_AREA_TYPE_AND_SPECIFIC_TIME_FRAME",
+            "specificTimeFrame": specific_timeframe,
+            "specificAreaType": area_type
+        }
+    }
+
+
+def _contract_timeframe(selected_months):
+    # (specificTimeFrame, rateType) for the Contract high/low/fuel lookup
+    if selected_months >= 12:
+        return "180_DAYS", "CONTRACT"
+    elif selected_months >= 3:
+        return "90_DAYS", "SPOT"
+    elif selected_months == 2:
+        return "60_DAYS", "SPOT"
+    return "30_DAYS", "SPOT"
+
+
+def _zip_only(location):
+    # The stop's own ZIP, else the gazetteer's first ZIP for its city/state
+    if location.zip_only:
+        return location.zip_only
+    gazetteer = get_gazetteer(ZIP_GAZETTEER_PATH)
+    entry = gazetteer.lookup_city(location.city, location.state) if gazetteer else None
+    return {"postalCode": entry.zip} if entry else None
+
+
+def _rate_variants(o, d):
+    # Full address first, then ZIP-only when both ends have a ZIP (own or from the gazetteer)
+    variants = [(o.dat_spot, d.dat_spot)]
+    o_zip, d_zip = _zip_only(o), _zip_only(d)
+    if o_zip and d_zip:
+        variants.append((o_zip, d_zip))
+    return variants
+
+
+def _lane_rate_variants(locations, equipment_type, pricing_mode, selected_months):
+    """The url_spot requests get_DAT_data sends for a lane, in priority order."""
+    origin = Location.parse(locations[0])
+    destination = Location.parse(locations[-1])
+
+    if pricing_mode == "Spot":
+        return [_spot_rate_request(o, d, equipment_type) for o, d in _rate_variants(origin, destination)]
+
+    # Priority order: MARKET_AREA full, MARKET_AREA ZIP-only, EXTENDED full, EXTENDED ZIP-only
+    specific_timeframe, rate_type = _contract_timeframe(selected_months)
+    area_sequence = ["MARKET_AREA", "EXTENDED_MARKET_AREA"]
+    return [
+        _contract_rate_request(o, d, equipment_type, rate_type, specific_timeframe, area_type)
+        for area_type in area_sequence
+        for o, d in _rate_variants(origin, destination)
+    ]
+
+
+def _parse_contract_rate(resp):
+    if resp.get("errors"):
+        return None
+
+    rate_obj = resp.get("rate")
+    if not rate_obj:
+        return None
+
+    per_trip = rate_obj.get("perTrip")
+    if isinstance(per_trip, list) and len(per_trip) > 0:
+        per_trip_entry = per_trip[0]
+    elif isinstance(per_trip, dict):
+        per_trip_entry = per_trip
+    else:
+        per_trip_entry = {}
+
+    return {
+        "fuel_per_trip": rate_obj.get(
+            "averageFuelSurchargePerTripUsd",
+            per_trip_entry.get("averageFuelSurchargePerTripUsd", 0)
+        ),
+        "contract_highUSD": per_trip_entry.get("highUsd", rate_obj.get("highUsd", 0)),
+        "contract_lowUSD": per_trip_entry.get("lowUsd", rate_obj.get("lowUsd", 0)),
+    }
+
+
+def _parse_spot_rate(rate_response_full):
+    errors = rate_response_full.get("errors")
+    if _has_no_rates_error(errors):
+        return None
+
+    if "rate" not in rate_response_full:
+        return None
+
+    rate_response = rate_response_full["rate"]
+
+    return {
+        "rate": rate_response["perTrip"]["rateUsd"],
+        "high": rate_response["perTrip"]["highUsd"],
+        "low": rate_response["perTrip"]["lowUsd"],
+        "miles": rate_response["mileage"],
+        "fuel_per_trip": rate_response.get("averageFuelSurchargePerTripUsd")
+    }
+
+
+# Below this many lanes the NumPy setup costs more than it saves (see
+# benchmarks/bench_forecast_aggregation.py): a single Calculate uses the plain loop
+FORECAST_NUMPY_MIN_LANES = 4
+
+
+def aggregate_monthly_forecasts(per_trip_lists):
+    """Median forecastUSD per calendar month for many lanes at once.
+
+    Returns, per lane, [((year, month), median), ...] oldest month first.
+    Fewer than FORECAST_NUMPY_MIN_LANES lanes go through
+    aggregate_monthly_forecast one by one. Otherwise all points are flattened
+    into NumPy arrays and the month is read straight from the "YYYY-MM" prefix
+    of the ISO date (as datetime.fromisoformat does, no timezone shift). Points are then grouped by (lane, month) with one sort
+    on an integer key; every group holds a handful of weekly points, so the
+    medians come from sorting a small padded row per group instead of sorting
+    every value.
+    """
+    if len(per_trip_lists) < FORECAST_NUMPY_MIN_LANES:
+        return [aggregate_monthly_forecast(per_trip_data) for per_trip_data in per_trip_lists]
+
+    results = [[] for _ in per_trip_lists]
+    points = [point for per_trip_data in per_trip_lists for point in per_trip_data]
+    if not points:
+        return results
+
+    lane_ids = np.repeat(np.arange(len(per_trip_lists)), [len(per_trip_data) for per_trip_data in per_trip_lists])
+    # map(dict.get) keeps the per-point work in C; None dates become b"None" and are dropped below
+    dates = np.array(list(map(dict.get, points, repeat("forecastDate"), repeat(""))), dtype="S7")
+    values = np.fromiter(
+        map(dict.get, points, repeat("forecastUSD"), repeat(0)), dtype=np.float64, count=len(points)
+    )
+
+    keep = (dates != b"") & (dates != b"None") & (values != 0)
+    if not keep.any():
+        return results
+    lane_ids, dates, values = lane_ids[keep], dates[keep], values[keep]
+
+    # "YYYY-MM" bytes -> months since 1970-01
+    digits = dates.view(np.uint8).reshape(-1, 7).astype(np.int32) - ord("0")
+    years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    months = (years - 1970) * 12 + digits[:, 5] * 10 + digits[:, 6] - 1
+
+    # (lane, month) -> one integer key; the API returns weeks in order, so this sort is nearly free
+    first_month = months.min()
+    group_keys = lane_ids * (months.max() - first_month + 1) + (months - first_month)
+    order = np.argsort(group_keys, kind="stable")
+    group_keys, values = group_keys[order], values[order]
+
+    starts = np.flatnonzero(np.r_[True, group_keys[1:] != group_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(values)])
+    n_groups = len(starts)
+
+    # One row per group, padded with +inf so the real values sort to the front
+    grid = np.full((n_groups, sizes.max()), np.inf)
+    grid[np.repeat(np.arange(n_groups), sizes), np.arange(len(values)) - np.repeat(starts, sizes)] = values
+    grid.sort(axis=1)
+    rows = np.arange(n_groups)
+    medians = (grid[rows, (sizes - 1) // 2] + grid[rows, sizes // 2]) / 2
+
+    # Groups are sorted by lane, then month: slice each lane's run instead of appending one by one.
+    # Every (year, month) tuple is built once and shared between lanes.
+    year_months = [(1970 + month // 12, month % 12 + 1) for month in range(first_month, months.max() + 1)]
+    group_months = (months[order][starts] - first_month).tolist()
+    pairs = list(zip(map(year_months.__getitem__, group_months), medians.tolist()))
+    lane_bounds = np.searchsorted(lane_ids[order][starts], np.arange(len(per_trip_lists) + 1)).tolist()
+    return [pairs[lo:hi] for lo, hi in zip(lane_bounds, lane_bounds[1:])]
+
+
+def aggregate_monthly_forecast(per_trip_data):
+    """Median forecastUSD per calendar month, oldest month first: [((year, month), median), ...]."""
+    monthly_values = defaultdict(list)
+
+    for point in per_trip_data:
+        date_str = point.get("forecastDate")
+        avg_usd = point.get("forecastUSD", 0)
+
+        if not date_str or avg_usd == 0:
+            continue
+
+        date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+        monthly_values[(date.year, date.month)].append(avg_usd)
+
+    return [(ym, statistics.median(monthly_values[ym])) for ym in sorted(monthly_values)]
+
+
+def build_lane_forecasts(data_forecasts):
+    """build_lane_forecast for many forecast responses, aggregated in one NumPy pass."""
+    monthly_per_lane = aggregate_monthly_forecasts(
+        [data_forecast.get("forecasts", {}).get("perTrip", []) for data_forecast in data_forecasts]
+    )
+    return [_lane_forecast(data_forecast, monthly) for data_forecast, monthly in zip(data_forecasts, monthly_per_lane)]
+
+
+def build_lane_forecast(data_forecast):
+    """Monthly medians of a forecast response plus the average rate for every horizon.
+
+    prefix_averages[n - 1] is the mean of the first n monthly medians, the
+    Contract base rate for a horizon of n months.
+    """
+    return build_lane_forecasts([data_forecast])[0]
+
+
+def _lane_forecast(data_forecast, monthly):
+    if not monthly:
+        return None
+
+    monthly_forecasts = []
+    prefix_averages = []
+    running_total = 0
+    for n, ((year, month), med_avg) in enumerate(monthly, start=1):
+        running_total += med_avg
+        prefix_averages.append(running_total / n)
+        monthly_forecasts.append({
+            "date": f"{year}-{month:02d}-01T00:00:00Z",
+            "forecastUSD": int(med_avg),
+        })
+
+    return {
+        "mileage": data_forecast.get("mileage", 0),
+        "monthly_forecasts": monthly_forecasts,
+        "prefix_averages": prefix_averages,
+    }
+
+
+def build_stops_from_locations(locations: list) -> list:
+
+    return [Location.parse(loc).gs_stop(idx) for idx, loc in enumerate(locations)]
+
+
+def market_snapshot_key(locations, equipment_type, pricing_mode):
+    """Identity of the market inputs fetched for a lane.
+
+    Only what the providers are asked for goes in: the customer, markup and
+    hotshot weight are applied afterwards, STEPDECK/CONESTOGA/HOTSHOT share
+    the FLATBED market, and another forecast horizon is re-derived with
+    `with_forecast_horizon` instead of a new snapshot.
+    """
+    return (tuple(Location.parse(loc) for loc in locations), provider_equipment(equipment_type), pricing_mode)
+
+
+def _with_limit(limit, stage, fn, *args):
+    with limit or nullcontext(), span(stage):
+        return fn(*args)
+
+
+# -----------------------------
+# PRICING ENGINE (provider clients with explicit credentials)
+# -----------------------------
+PROVIDER_ERROR_LABELS = {
+    "dat": "Error calling DAT API",
+    "mci": "Error retrieving MCI data",
+    "gs": "Error getting GreenScreens data",
+    "google_miles": "Error in Google Maps API",
+}
+
+
+class PricingEngine:
+    """DAT, MCI, GreenScreens and Google clients plus the lane pricing flow.
+
+    Provider methods raise on transport/API errors and return None when the
+    provider simply has no answer; `fetch_provider_data` turns the errors
+    into messages so callers (UI, CLI, workers) decide how to show them.
+    """
+
+    def __init__(self, api_key, org_username, org_password, account_username, gs_client_secret,
+                 gs_client_id=GS_CLIENT_ID):
+        self.api_key = api_key
+        self.dat_tokens = get_dat_token_broker(
+            org_url,
+            user_url,
+            org_username,
+            org_password,
+            account_username,
+            refresh_margin=DAT_TOKEN_REFRESH_MARGIN,
+            default_ttl=DAT_TOKEN_DEFAULT_TTL,
+            cache_path=DAT_TOKEN_CACHE_PATH,
+        )
+        self.gs_client = get_greenscreens_client(
+            GS_AUTH_URL,
+            GS_PREDICT_URL,
+            gs_client_id,
+            gs_client_secret,
+            refresh_margin=GS_TOKEN_REFRESH_MARGIN,
+        )
+
+    def dat_headers(self):
+        return {
+            "Authorization": f"Bearer {self.dat_tokens.get_token()}",
+            "Content-Type": "application/json"
+        }
+
+    # -----------------------------
+    # DAT LOOKUP (cached, batched)
+    # -----------------------------
+    def dat_rate_lookup_batch(self, rate_requests):
+        """POST several rate requests to url_spot in one call; one `response` per request.
+
+        The lookups endpoint takes a JSON array, so every uncached request goes
+        out in a single round trip and `rateResponses` is mapped back by position.
+        Answers are cached per normalized lane/equipment/rateType/escalation and
+        shared by every session; "No rates available" answers use a shorter TTL.
+        """
+        cache = get_cache("dat_lookups", maxsize=DAT_CACHE_MAXSIZE, ttl=DAT_CACHE_TTL)
+        keys = [dat_lookup_key(rate_request) for rate_request in rate_requests]
+        results = {key: cache.get(key) for key in keys}
+
+        pending = {}
+        for key, rate_request in zip(keys, rate_requests):
+            if results[key] is None and key not in pending:
+                pending[key] = rate_request
+
+        if pending:
+            with span("dat_lookup", requests=len(pending)):
+                response = http_post(url_spot, headers=self.dat_headers(), json=list(pending.values()))
+                response.raise_for_status()
+                rate_responses = response.json().get("rateResponses") or []
+
+            if len(rate_responses) != len(pending):
+                raise ValueError(f"DAT returned {len(rate_responses)} rate responses for {len(pending)} requests.")
+
+            for key, rate_response in zip(pending, rate_responses):
+                resp = rate_response.get("response", {})
+                results[key] = resp
+
+                if "rate" in resp:
+                    cache.set(key, resp)
+                elif _has_no_rates_error(resp.get("errors")):
+                    cache.set(key, resp, ttl=DAT_CACHE_NO_RATES_TTL)
+
+        return [results[key] for key in keys]
+
+    def dat_lookup_first_usable(self, variant_groups, parse):
+        """Send every fallback variant of every lane in one lookup; keep the first usable answer.
+
+        `variant_groups` holds, per lane, its rate requests in priority order.
+        Returns, per lane, `(parsed, rate_request)` for the first variant that
+        `parse` accepts, or `(None, None)` when none of them has a rate.
+        """
+        flat_requests = [rate_request for group in variant_groups for rate_request in group]
+        responses = iter(self.dat_rate_lookup_batch(flat_requests))
+
+        results = []
+        for group in variant_groups:
+            chosen = (None, None)
+            for rate_request in group:
+                resp = next(responses)
+                if chosen[0] is None:
+                    parsed = parse(resp)
+                    if parsed is not None:
+                        chosen = (parsed, rate_request)
+            results.append(chosen)
+        return results
+
+    # -----------------------------
+    # DAT RATE DATA
+    # -----------------------------
+    def get_DAT_data(self, locations, equipment_type, pricing_mode, selected_months):
+
+        if pricing_mode == "Spot":
+
+            # Full address and ZIP-only fallback go out together; first usable answer wins
+            variants = _lane_rate_variants(locations, equipment_type, pricing_mode, selected_months)
+
+            [(result, used_request)] = self.dat_lookup_first_usable([variants], _parse_spot_rate)
+
+            if result is None:
+                logger.warning("No DAT rates available for this lane at the moment.")
+            elif used_request is not variants[0]:
+                logger.info("DAT Spot answered by the ZIP-only fallback (origin/destination).")
+                metrics.increment("dat_fallback_answers", mode="Spot")
+            return result
+
+        elif pricing_mode == "Contract":
+
+            # --- Spot request for fuel, high, low (Contract Mode), every fallback variant at once ---
+            contract_variants = _lane_rate_variants(locations, equipment_type, pricing_mode, selected_months)
+
+            def _lookup_contract_spot():
+                try:
+                    [(spot_result, used_request)] = self.dat_lookup_first_usable(
+                        [contract_variants], _parse_contract_rate
+                    )
+                    if spot_result is not None:
+                        if used_request is not contract_variants[0]:
+                            metrics.increment("dat_fallback_answers", mode="Contract")
+                        escalation = used_request["targetEscalation"]
+                        logger.debug(
+                            "Contract spot answered. area_type=%s timeframe=%s",
+                            escalation["specificAreaType"], escalation["specificTimeFrame"]
+                        )
+                    return spot_result
+                except Exception as e:
+                    logger.debug("Contract spot request error: %s", e)
+                    return None
+
+            # The lookup does not depend on the forecast: run both round trips at once
+            lookup_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="contract-spot")
+            spot_future = lookup_pool.submit(bind_context(_lookup_contract_spot))
+            lookup_pool.shutdown(wait=False)
+
+            # --------- Forecast (Contract base rate + miles), cached per lane/equipment ---------
+            forecast = self.get_lane_forecast(locations, equipment_type)
+            if forecast is None:
+                logger.warning("No forecast data available for this lane.")
+                return None
+
+            horizon = min(selected_months, len(forecast["monthly_forecasts"]))
+            monthly_forecasts = forecast["monthly_forecasts"][:horizon]
+            average_rate = forecast["prefix_averages"][horizon - 1]
+            mileage = forecast["mileage"]
+
+            spot_result = spot_future.result()
+
+            if spot_result is None:
+                return {
+                    "rate": average_rate,
+                    "miles": mileage,
+                    "fuel_per_trip": 0,
+                    "monthly_forecasts": monthly_forecasts,
+                    "forecast_curve": forecast["monthly_forecasts"],
+                    "contract_highUSD": 0,
+                    "contract_lowUSD": 0
+                }
+
+            return {
+                "rate": average_rate,
+                "miles": mileage,
+                "fuel_per_trip": spot_result["fuel_per_trip"],
+                "monthly_forecasts": monthly_forecasts,
+                "forecast_curve": forecast["monthly_forecasts"],
+                "contract_highUSD": spot_result["contract_highUSD"],
+                "contract_lowUSD": spot_result["contract_lowUSD"]
+            }
+
+    # -----------------------------
+    # DAT FORECAST (cached, every horizon precomputed)
+    # -----------------------------
+    def get_lane_forecast(self, locations, equipment_type):
+        """The 52-week forecast for a lane, aggregated per month, or None when DAT has no points.
+
+        The response does not depend on the forecast horizon, so it is cached
+        per origin/destination/equipment and every horizon (1..N months) is
+        answered from the precomputed prefix averages.
+        """
+        origin = Location.parse(locations[0])
+        destination = Location.parse(locations[-1])
+        cache = get_cache("dat_forecasts", maxsize=DAT_FORECAST_CACHE_MAXSIZE, ttl=DAT_FORECAST_CACHE_TTL)
+        key = (origin, destination, provider_equipment(equipment_type))
+
+        forecast = cache.get(key)
+        if forecast is not None:
+            return forecast
+
+        forecast = build_lane_forecast(self._fetch_forecast(origin, destination, equipment_type))
+        if forecast is not None:
+            cache.set(key, forecast)
+        return forecast
+
+    def _fetch_forecast(self, origin, destination, equipment_type):
+        body_forecast = {
+            "origin": origin.dat_contract,
+            "destination": destination.dat_contract,
+            "equipmentCategory": provider_equipment(equipment_type),
+            "forecastPeriod": "52WEEKS"
+        }
+
+        with span("dat_forecast"):
+            response_forecast = http_post(url_forecast, headers=self.dat_headers(), json=body_forecast)
+            response_forecast.raise_for_status()
+            return response_forecast.json()
+
+    def prefetch_lane_forecasts(self, lanes):
+        """Fetch the forecasts a chunk of Contract lanes is missing and aggregate them in one pass."""
+        cache = get_cache("dat_forecasts", maxsize=DAT_FORECAST_CACHE_MAXSIZE, ttl=DAT_FORECAST_CACHE_TTL)
+
+        missing = {}
+        for lane in lanes:
+            if lane.get("error"):
+                continue
+            origin = Location.parse(lane["locations"][0])
+            destination = Location.parse(lane["locations"][-1])
+            key = (origin, destination, provider_equipment(lane["equipment"]))
+            if key not in missing and cache.get(key) is None:
+                missing[key] = key
+        if not missing:
+            return
+
+        def _fetch(key):
+            try:
+                return self._fetch_forecast(*key)
+            except Exception as e:
+                # Not fatal: the lane fetches its own forecast when it is priced
+                logger.warning("Bulk forecast prefetch failed for %s -> %s. Error=%s", key[0], key[1], e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(BULK_PROVIDER_CONCURRENCY["dat"], len(missing)),
+                                thread_name_prefix="forecast-prefetch") as pool:
+            responses = dict(zip(missing, pool.map(_fetch, missing)))
+
+        fetched = {key: data for key, data in responses.items() if data is not None}
+        for key, forecast in zip(fetched, build_lane_forecasts(list(fetched.values()))):
+            if forecast is not None:
+                cache.set(key, forecast)
+
+    # -----------------------------
+    # DAT SEGMENTS (roundtrip safeguard)
+    # -----------------------------
+    def get_DAT_segment_data(self, segment_pairs, equipment_type, pricing_mode, selected_months):
+        """DAT result for every (origin, destination) segment, None where DAT has no rate.
+
+        In Spot mode every segment, with its ZIP-only fallback, goes out in one
+        batched lookup. The Contract forecast endpoint takes a single lane per
+        call, so Contract segments are fetched concurrently.
+        """
+        if pricing_mode != "Spot":
+            def _segment(pair):
+                try:
+                    return self.get_DAT_data(list(pair), equipment_type, pricing_mode, selected_months)
+                except Exception:
+                    logger.exception("Error calling DAT Contract logic (segment %s -> %s).", *pair)
+                    return None
+
+            with ThreadPoolExecutor(max_workers=min(8, len(segment_pairs)) or 1, thread_name_prefix="segment") as pool:
+                return list(pool.map(bind_context(_segment), segment_pairs))
+
+        parsed = [(Location.parse(o), Location.parse(d)) for o, d in segment_pairs]
+
+        # Every segment and its ZIP-only fallback in one request
+        variant_groups = [
+            [_spot_rate_request(vo, vd, equipment_type) for vo, vd in _rate_variants(o, d)]
+            for o, d in parsed
+        ]
+
+        try:
+            return [result for result, _ in self.dat_lookup_first_usable(variant_groups, _parse_spot_rate)]
+        except Exception:
+            logger.exception("Error calling DAT Spot API (segments).")
+            return [None] * len(parsed)
+
+    # -----------------------------
+    # MCI NUMBERS
+    # -----------------------------
+    def get_MCI_scores(self, locations, equipment_type):
+        headers = self.dat_headers()
+        mci_cache = get_mci_cache(rollover_hour_utc=MCI_ROLLOVER_HOUR_UTC)
+
+        origin = Location.parse(locations[0])
+        destination = Location.parse(locations[-1])
+
+        # Market area of each end from the gazetteer (None without one): the MCI
+        # cache is keyed by it, so any ZIP or city of a market already scored is a hit
+        gazetteer = get_gazetteer(ZIP_GAZETTEER_PATH)
+        entries = {loc: gazetteer.resolve(loc) if gazetteer is not None else None for loc in (origin, destination)}
+        areas = {loc: entry.market_area if entry is not None else None for loc, entry in entries.items()}
+
+        def _build_params(location, use_zip_only=False):
+            params = {
+                "page": 0,
+                "pageSize": 10,
+                "areaType": "MARKET_AREA",
+                "direction": "OUTBOUND",
+                "equipmentCategory": provider_equipment(equipment_type),
+                "timeframe": "PREVIOUS_BUSINESS_DAY",
+                "country": "US",
+            }
+
+            if use_zip_only and _zip_only(location):
+                params["postalCode"] = _zip_only(location)["postalCode"]
+            else:
+                params["city"] = location.city
+                params["stateOrProvince"] = location.state
+
+            return params
+
+        def _fetch_mci(params, market_area):
+            # PREVIOUS_BUSINESS_DAY scores only change at the business-day rollover
+            cached = mci_cache.get(params, market_area)
+            if cached is not None:
+                return cached
+
+            resp = http_get(url_MCI, headers=headers, params=params)
+            resp.raise_for_status()
+            data = resp.json()
+
+            if not isinstance(data, list) or not data:
+                return None
+
+            first = data[0]
+            indexes = first.get("marketConditionsIndexes") or []
+            if not indexes:
+                return None
+
+            score = indexes[0].get("mciScore")
+            mci_cache.set(params, score, market_area)
+            return score
+
+        def _fetch_mci_pair(origin_params, dest_params):
+            # Origin and destination scores are independent GETs; issue both at once
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                return tuple(pool.map(
+                    bind_context(_fetch_mci), [origin_params, dest_params], [areas[origin], areas[destination]]
+                ))
+
+        # Attempt 1: city/state
+        try:
+            with span("mci_city_state"):
+                mci_origin, mci_destination = _fetch_mci_pair(
+                    _build_params(origin, use_zip_only=False),
+                    _build_params(destination, use_zip_only=False)
+                )
+
+            if mci_origin is not None and mci_destination is not None:
+                return {
+                    "origin_mci": mci_origin,
+                    "destination_mci": mci_destination,
+                }
+
+            raise ValueError("MCI response missing scores on city/state attempt.")
+
+        except Exception as e:
+            # Attempt 2: ZIP-only fallback (if possible)
+            if not (_zip_only(origin) and _zip_only(destination)):
+                raise
+
+            logger.info("Retrying MCI with ZIP-only fallback (origin/destination). Reason=%s", e)
+
+            with span("mci_zip_fallback"):
+                mci_origin, mci_destination = _fetch_mci_pair(
+                    _build_params(origin, use_zip_only=True),
+                    _build_params(destination, use_zip_only=True)
+                )
+
+            if mci_origin is None or mci_destination is None:
+                logger.warning("Could not retrieve MCI scores for both locations (ZIP fallback returned None).")
+                return None
+
+            return {
+                "origin_mci": mci_origin,
+                "destination_mci": mci_destination,
+            }
+
+    # -----------------------------
+    # GREENSCREENS
+    # -----------------------------
+    def get_greenscreens_rate(self, locations, equipment_type):
+        # Step 1: Build body for prediction
+        body = {
+            "pickupDateTime": datetime.now(timezone.utc).isoformat(),
+            "transportType": provider_equipment(equipment_type),
+            "stops": build_stops_from_locations(locations),
+            "commodity": "General Freight",
+            "currency": "USD"
+        }
+
+        # Step 2: Call prediction endpoint (token is cached by the client, re-auth once on 401)
+        data = self.gs_client.predict(body)
+        rpm = data.get("targetBuyRate", 0)
+        distance = data.get("distance", 0)
+        confidence = data.get("confidenceLevel", 0)
+
+        total_all_in = int((rpm) * distance)
+        logger.debug("GreenScreens all-in=%s confidence=%s", total_all_in, confidence)
+
+        if total_all_in is None or confidence is None:
+            logger.warning("No valid rate or confidence returned from GreenScreens.")
+            return None
+
+        return {
+            "rate_per_mile": total_all_in,
+            "confidence": confidence
+        }
+
+    # -----------------------------
+    # GOOGLE MAPS ROUTE & PRICING
+    # -----------------------------
+    def get_google_miles(self, locations):
+        """Road miles for the whole route, summed from per-leg distances.
+
+        Legs already in the distance store cost nothing; otherwise one Routes
+        request covers the span from the first to the last new leg (a stop
+        added or moved on a known route touches only its neighbours) and its
+        legs are stored for next time.
+        """
+        stops = [Location.parse(loc) for loc in locations]
+        legs = [(stops[i], stops[i + 1]) for i in range(len(stops) - 1)]
+
+        store = get_distance_store(ROUTE_CACHE_PATH)
+        leg_meters = store.get_legs(legs)
+        missing = [i for i, leg in enumerate(legs) if leg not in leg_meters]
+        if not missing:
+            return round(sum(leg_meters[leg] for leg in legs) / 1609.344)
+
+        first, last = missing[0], missing[-1]
+        span_stops = stops[first:last + 2]
+        headers = {
+            "Content-Type": "application/json",
+            "X-Goog-Api-Key": self.api_key,
+            "X-Goog-FieldMask": "routes.distanceMeters,routes.legs.distanceMeters"
+        }
+
+        request_body = {
+            "origin": {"address": span_stops[0].google_address},
+            "destination": {"address": span_stops[-1].google_address},
+            "intermediates": [{"address": loc.google_address} for loc in span_stops[1:-1]],
+            "travelMode": "DRIVE",
+        }
+
+        with span("google_route", legs=len(span_stops) - 1):
+            response = http_post(base_url, json=request_body, headers=headers)
+            response.raise_for_status()
+            data = response.json()
+        route = data["routes"][0]
+        route_legs = route.get("legs", [])
+
+        span_legs = legs[first:last + 1]
+        if len(route_legs) == len(span_legs):
+            # A leg without distanceMeters is not stored: asked again next time, never cached as 0
+            store.set_legs({
+                leg: route_leg["distanceMeters"]
+                for leg, route_leg in zip(span_legs, route_legs) if "distanceMeters" in route_leg
+            })
+
+        # Proto3 JSON omits zero values: a missing route distance is 0 m
+        known_meters = sum(leg_meters[leg] for leg in legs[:first] + legs[last + 1:])
+        return round((known_meters + route.get("distanceMeters", 0)) / 1609.344)
+
+    def get_route_info(self, locations, DAT_miles, DAT_average, effective_avg_rate=None, blend_label=None, Mark_up=0.1,
+                       chaos_premium=0, equipment_type=None, google_miles=None, customer="Other"):
+
+        if len(locations) < 2:
+            return {"error": "At least two valid locations are required"}
+
+        # 1. Google miles (real route distance), fetched here only if the caller did not prefetch it
+        total_distance_miles = google_miles if google_miles is not None else self.get_google_miles(locations)
+        if total_distance_miles is None:
+            return None
+
+        return price_route(
+            locations, total_distance_miles, DAT_miles, DAT_average, effective_avg_rate, blend_label,
+            Mark_up, chaos_premium, equipment_type, customer
+        )
+
+    # -----------------------------
+    # OFFLINE CHECKS (ZIP gazetteer, no API calls)
+    # -----------------------------
+    def check_locations(self, locations):
+        """What the gazetteer finds wrong with the stops; empty when it is not built."""
+        return [problem for _, problem in self._location_problems(locations)]
+
+    def _location_problems(self, locations):
+        """(Location, problem) for every stop the gazetteer flags."""
+        gazetteer = get_gazetteer(ZIP_GAZETTEER_PATH)
+        if gazetteer is None:
+            return []
+        parsed = (Location.parse(loc) for loc in locations)
+        problems = ((location, gazetteer.validate(location)) for location in parsed)
+        return [(location, problem) for location, problem in problems if problem]
+
+    def estimate_miles(self, locations):
+        """Straight-line miles x ROAD_CIRCUITY, or None without a gazetteer or for an unknown stop."""
+        gazetteer = get_gazetteer(ZIP_GAZETTEER_PATH)
+        if gazetteer is None:
+            return None
+        return gazetteer.estimate_miles([Location.parse(loc) for loc in locations], circuity=ROAD_CIRCUITY)
+
+    # -----------------------------
+    # CONCURRENT PROVIDER FETCH
+    # -----------------------------
+    def fetch_provider_data(self, locations, equipment_type, pricing_mode, selected_months, limits=None,
+                            deadline_seconds=QUOTE_DEADLINE_SECONDS):
+        """Issue the DAT, MCI, GreenScreens and Google calls at once and join them.
+
+        None of them depend on each other, so the quote waits for the slowest
+        provider instead of the sum of all round trips. `limits` optionally maps
+        a provider name to a semaphore that bounds its concurrency (bulk mode).
+        A provider that fails comes back as None with its message in "errors";
+        failed Google miles fall back to the gazetteer estimate when there is one.
+
+        Every HTTP call shares a `deadline_seconds` budget (None = no budget).
+        Optional providers (GreenScreens) get QUOTE_OPTIONAL_GRACE seconds past
+        the required ones; if they are still running they are listed in
+        "skipped" and the lane is priced without them.
+        """
+        limits = limits or {}
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+
+        calls = {
+            "dat": (self.get_DAT_data, locations, equipment_type, pricing_mode, selected_months),
+            "mci": (self.get_MCI_scores, locations, equipment_type),
+            "gs": (self.get_greenscreens_rate, locations, equipment_type),
+            "google_miles": (self.get_google_miles, locations),
+        }
+
+        provider_data = {"errors": [], "skipped": [], "selected_months": selected_months}
+        pool = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="provider")
+        futures = {
+            name: pool.submit(bind_context(_with_limit, deadline), limits.get(name), name, fn, *args)
+            for name, (fn, *args) in calls.items()
+        }
+        pool.shutdown(wait=False)
+
+        required = [f for name, f in futures.items() if name not in QUOTE_OPTIONAL_PROVIDERS]
+        optional = [f for name, f in futures.items() if name in QUOTE_OPTIONAL_PROVIDERS]
+        wait(required, timeout=deadline.remaining() if deadline else None)
+        wait(optional, timeout=max(0, min(QUOTE_OPTIONAL_GRACE, deadline.remaining())) if deadline else None)
+
+        for name, future in futures.items():
+            if not future.done():
+                provider_data[name] = None
+                if name in QUOTE_OPTIONAL_PROVIDERS:
+                    logger.warning("%s still running after the required providers: skipped.", name)
+                    provider_data["skipped"].append(name)
+                else:
+                    provider_data["errors"].append(
+                        f"{PROVIDER_ERROR_LABELS[name]}: quote deadline ({deadline_seconds}s) reached"
+                    )
+                continue
+            try:
+                provider_data[name] = future.result()
+            except Exception as e:
+                logger.exception("%s.", PROVIDER_ERROR_LABELS[name])
+                provider_data[name] = None
+                provider_data["errors"].append(f"{PROVIDER_ERROR_LABELS[name]}: {e}")
+
+        if provider_data["google_miles"] is None:
+            # Google failed: price on the offline estimate rather than not at all
+            provider_data["google_miles"] = self.estimate_miles(locations)
+            provider_data["google_miles_estimated"] = provider_data["google_miles"] is not None
+        return provider_data
+
+    def with_forecast_horizon(self, provider_data, locations, equipment_type, pricing_mode, selected_months):
+        """The same snapshot at another forecast horizon; only the DAT part is rebuilt.
+
+        The 52-week forecast comes from the forecast cache, so a horizon change
+        costs at most the high/low lookup for the new timeframe.
+        """
+        if provider_data.get("selected_months") == selected_months:
+            return provider_data
+
+        dat_label = PROVIDER_ERROR_LABELS["dat"]
+        errors = [e for e in provider_data["errors"] if not e.startswith(dat_label)]
+        updated = {k: v for k, v in provider_data.items() if k != "dat_segments"}
+        updated.update(errors=errors, selected_months=selected_months)
+        try:
+            with deadline_scope(Deadline(QUOTE_DEADLINE_SECONDS)):
+                updated["dat"] = self.get_DAT_data(locations, equipment_type, pricing_mode, selected_months)
+        except Exception as e:
+            logger.exception("%s.", dat_label)
+            updated["dat"] = None
+            errors.append(f"{dat_label}: {e}")
+        return updated
+
+    # -----------------------------
+    # PRICE ONE LANE
+    # -----------------------------
+    def price_lane(self, locations_input, equipment_type, pricing_mode, selected_months, customer,
+                   user_markup=None, hotshot_weight_lbs=None, provider_data=None):
+        """Fetch (unless `provider_data` is given) and price one lane without drawing anything.
+
+        With `provider_data` from an earlier fetch the lane is re-priced without
+        any API call, so markup, customer and hotshot weight can change freely.
+        Returns {"error": message} when a required provider has no answer.
+        """
+        if provider_data is None:
+            provider_data = self.fetch_provider_data(locations_input, equipment_type, pricing_mode, selected_months)
+
+        with span("pricing"):
+            return self._price_lane(
+                locations_input, equipment_type, pricing_mode, selected_months, customer,
+                user_markup, hotshot_weight_lbs, provider_data
+            )
+
+    def _price_lane(self, locations_input, equipment_type, pricing_mode, selected_months, customer,
+                    user_markup, hotshot_weight_lbs, provider_data):
+        notes = []
+        if provider_data.get("google_miles_estimated"):
+            notes.append("Google Maps unavailable: miles estimated offline (straight line x road circuity).")
+        if "gs" in provider_data.get("skipped", ()):
+            notes.append("GreenScreens too slow for this quote: priced on 100% DAT.")
+
+        dat_result = provider_data["dat"]
+        if not dat_result:
+            return {"error": "No DAT result returned."}
+
+        raw_avg = dat_result["rate"]
+        DAT_fuel_per_trip = dat_result["fuel_per_trip"]
+        DAT_miles = dat_result["miles"]
+        DAT_average = dat_result["rate"] + round(DAT_fuel_per_trip, 0)
+
+        if pricing_mode == "Spot":
+            DAT_high = dat_result["high"]
+            DAT_low = dat_result["low"]
+        else:
+            DAT_high = dat_result["contract_highUSD"]
+            DAT_low = dat_result["contract_lowUSD"]
+
+        mci_data = provider_data["mci"]
+        if not mci_data:
+            return {"error": "Failed to retrieve MCI data."}
+
+        if user_markup is not None:
+            Mark_up = user_markup
+            markup_source = "manual"
+        else:
+            Mark_up = calculate_auto_markup(mci_data, equipment_type)
+            markup_source = "auto"
+
+        adjusted_base_rate = raw_avg * (1 + Mark_up)
+
+        chaos_data = calculate_chaos_premiums(
+            raw_avg,
+            DAT_high,
+            DAT_low,
+            DAT_miles,
+            adjusted_base_rate
+        )
+
+        gs_data = provider_data["gs"]
+        if gs_data:
+            total_all_in = gs_data["rate_per_mile"]
+            confidence = gs_data["confidence"]
+
+            stops = max(0, len(locations_input) - 2)
+
+            use_gs = True
+            if pricing_mode == "Contract":
+                use_gs = False
+
+            if use_gs and stops == 0:
+                effective_avg, blend_label = get_effective_avg_rate_with_blending(
+                    DAT_average, total_all_in, confidence
+                )
+                note = blend_discrepancy_note(DAT_average, total_all_in)
+                if note:
+                    notes.append(note)
+            else:
+                effective_avg = DAT_average
+                blend_label = "100% DAT (stops>0)" if stops > 0 else "100% DAT"
+
+            logger.info("Base Rate used for cost calculation: %s", blend_label)
+        else:
+            effective_avg = DAT_average
+            blend_label = "100% DAT"
+            logger.info("Base Rate used: 100% DAT (no GS data)")
+
+        # -----------------------------
+        # Roundtrip / repeats safeguard
+        # -----------------------------
+        def _has_repeated_locations(locs):
+            return len({Location.parse(loc) for loc in locs}) < len(locs)
+
+        def _segment_pairs(locs):
+            return [(locs[i], locs[i + 1]) for i in range(len(locs) - 1)]
+
+        suspicious_dat_miles = (not DAT_miles) or (DAT_miles <= 1)
+        has_repeats = _has_repeated_locations(locations_input)
+
+        if suspicious_dat_miles or has_repeats:
+            logger.warning(
+                "Roundtrip/repeat safeguard triggered. DAT_miles=%s repeats=%s locations=%s",
+                DAT_miles, has_repeats, locations_input
+            )
+
+            seg_dat_miles_sum = 0
+            seg_dat_avg_sum = 0
+
+            segment_pairs = _segment_pairs(locations_input)
+            # Kept with the provider data so re-pricing the same snapshot makes no new calls
+            segment_results = provider_data.get("dat_segments")
+            if segment_results is None:
+                segment_results = self.get_DAT_segment_data(segment_pairs, equipment_type, pricing_mode, selected_months)
+                provider_data["dat_segments"] = segment_results
+
+            for idx, ((o, d), seg_dat) in enumerate(zip(segment_pairs, segment_results), start=1):
+                if not seg_dat:
+                    return {"error": f"No DAT result returned for segment {idx}: {o} -> {d}"}
+
+                seg_raw = seg_dat["rate"]
+                seg_fuel = seg_dat["fuel_per_trip"]
+                seg_miles = seg_dat["miles"]
+                seg_avg = seg_raw + round(seg_fuel, 0)
+
+                seg_dat_miles_sum += (seg_miles or 0)
+                seg_dat_avg_sum += (seg_avg or 0)
+
+            if seg_dat_miles_sum > 1 and seg_dat_avg_sum > 0:
+                old_DAT_average = DAT_average
+                DAT_miles = seg_dat_miles_sum
+                DAT_average = seg_dat_avg_sum
+
+                logger.info(
+                    "Using segment-summed DAT values. DAT_miles=%s DAT_average=%s",
+                    DAT_miles, DAT_average
+                )
+
+                stops = max(0, len(locations_input) - 2)
+                if stops == 0 and old_DAT_average:
+                    try:
+                        ratio = DAT_average / old_DAT_average
+                        effective_avg = round(effective_avg * ratio)
+                    except Exception:
+                        logger.exception("Failed to rescale effective_avg after segment override.")
+
+        # HOTSHOT logic
+        if equipment_type == "HOTSHOT":
+            w = int(hotshot_weight_lbs)
+            hotshot_factor = 1.0 if w > 10000 else 0.8
+            effective_avg = round(effective_avg * hotshot_factor)
+
+        from_location = Location.parse(locations_input[0])
+        to_location = Location.parse(locations_input[-1])
+
+        origin_city = from_location.city
+        origin_state = from_location.state
+        destination_city = to_location.city
+        destination_state = to_location.state
+
+        try:
+            route_data = self.get_route_info(
+                locations_input,
+                DAT_miles,
+                DAT_average,
+                effective_avg,
+                blend_label,
+                Mark_up,
+                chaos_data["chaos_premium"],
+                equipment_type,
+                google_miles=provider_data["google_miles"],
+                customer=customer
+            )
+        except Exception as e:
+            logger.exception("Error computing route pricing.")
+            return {"error": f"Error computing route pricing: {e}"}
+
+        if not route_data:
+            return {"error": "Error processing route information."}
+
+        return {
+            "route_data": route_data,
+            "mci_data": mci_data,
+            "gs_data": gs_data,
+            "chaos_data": chaos_data,
+            "Mark_up": Mark_up,
+            "markup_source": markup_source,
+            "notes": notes,
+            "lane_display": f"{origin_city}, {origin_state} → {destination_city}, {destination_state}",
+        }
+
+    # -----------------------------
+    # BULK RFP PRICING
+    # -----------------------------
+    def prefetch_dat_lookups(self, lanes, pricing_mode, selected_months):
+        """Warm the DAT lookup cache for a chunk of lanes with one batched request.
+
+        Every lane's fallback variants go out together; the per-lane pricing that
+        follows then reads its DAT answer from the cache instead of the network.
+        In Contract mode the chunk's forecasts are fetched and aggregated too.
+        """
+        rate_requests = []
+        for lane in lanes:
+            if lane.get("error"):
+                continue
+            rate_requests.extend(
+                _lane_rate_variants(lane["locations"], lane["equipment"], pricing_mode, selected_months)
+            )
+        if not rate_requests:
+            return
+
+        try:
+            self.dat_rate_lookup_batch(rate_requests)
+        except Exception as e:
+            # Not fatal: each lane falls back to its own lookup
+            logger.warning("Bulk DAT prefetch failed for %s lanes. Error=%s", len(lanes), e)
+
+        if pricing_mode == "Contract":
+            self.prefetch_lane_forecasts(lanes)
+
+    def _price_bulk_lane(self, lane, pricing_mode, selected_months, limits):
+        locations = lane["locations"]
+        row = {
+            "row": lane["row"],
+            "lane": " → ".join(str(loc) for loc in locations),
+            "stops": max(0, len(locations) - 2),
+            "equipment": lane["equipment"],
+            "customer": lane["customer"],
+            "error": lane.get("error"),
+            "notes": None,
+        }
+        if row["error"]:
+            return row
+
+        # Bad ZIPs are caught offline before spending any API call. A city missing
+        # from the gazetteer only means the gazetteer is partial: DAT/Google decide
+        fatal, notes = [], []
+        for location, problem in self._location_problems(locations):
+            (fatal if location.postal_code else notes).append(problem)
+        if fatal:
+            row["error"] = "; ".join(fatal)
+            return row
+
+        try:
+            # No per-quote budget in bulk: waiting on the provider semaphores would eat it.
+            # Every call still has its connect/read timeout and retries.
+            provider_data = self.fetch_provider_data(
+                locations, lane["equipment"], pricing_mode, selected_months, limits=limits, deadline_seconds=None
+            )
+            result = self.price_lane(
+                locations,
+                lane["equipment"],
+                pricing_mode,
+                selected_months,
+                lane["customer"],
+                user_markup=lane.get("markup"),
+                hotshot_weight_lbs=lane["hotshot_weight_lbs"],
+                provider_data=provider_data
+            )
+        except Exception as e:
+            row["error"] = str(e)
+            return row
+
+        if "error" in result:
+            row["error"] = "; ".join([result["error"]] + provider_data["errors"])
+            return row
+
+        route_data = result["route_data"]
+        gs_data = result["gs_data"] or {}
+        row["notes"] = "; ".join(notes + result["notes"]) or None
+        row.update({
+            "dat_miles": route_data["dat_miles"],
+            "google_miles": route_data["google_miles"],
+            "dat_avg_rate": route_data["dat_avg_rate"],
+            "base_rate": route_data["effective_avg_rate"],
+            "blend": route_data["blend_label"],
+            "markup_pct": round(result["Mark_up"] * 100, 2),
+            "buy_rate": route_data["total_cost"],
+            "sell_rate": route_data["final_rate"],
+            "layover": route_data["layover"],
+            "extra_stops": route_data["extra_stops"],
+            "origin_mci": result["mci_data"]["origin_mci"],
+            "destination_mci": result["mci_data"]["destination_mci"],
+            "gs_rate": gs_data.get("rate_per_mile"),
+            "gs_confidence": gs_data.get("confidence"),
+        })
+        return row
+
+    def price_lanes_bulk(self, lanes, pricing_mode, selected_months):
+        """Price many lanes, yielding one output row per lane as soon as it is done.
+
+        Lanes are processed in chunks of BULK_DAT_BATCH_SIZE: each chunk's DAT
+        lookups go out as one batched request (the next chunk's is prefetched
+        while the current one prices), and BULK_PROVIDER_CONCURRENCY caps the
+        in-flight calls per provider.
+        """
+        limits = {name: threading.BoundedSemaphore(n) for name, n in BULK_PROVIDER_CONCURRENCY.items()}
+        chunks = [lanes[i:i + BULK_DAT_BATCH_SIZE] for i in range(0, len(lanes), BULK_DAT_BATCH_SIZE)]
+        if not chunks:
+            return
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-prefetch") as prefetch_pool, \
+                ThreadPoolExecutor(max_workers=BULK_LANE_WORKERS, thread_name_prefix="bulk") as lane_pool:
+
+            prefetch = prefetch_pool.submit(
+                _with_limit, limits["dat"], "dat_prefetch", self.prefetch_dat_lookups, chunks[0], pricing_mode, selected_months
+            )
+
+            for idx, chunk in enumerate(chunks):
+                prefetch.result()
+                if idx + 1 < len(chunks):
+                    prefetch = prefetch_pool.submit(
+                        _with_limit, limits["dat"], "dat_prefetch", self.prefetch_dat_lookups, chunks[idx + 1], pricing_mode, selected_months
+                    )
+
+                futures = [
+                    lane_pool.submit(self._price_bulk_lane, lane, pricing_mode, selected_months, limits)
+                    for lane in chunk
+                ]
+                for future in as_completed(futures):
+                    yield future.result()
+
+
+# -----------------------------
+# CREDENTIALS
+# -----------------------------
+SECRET_KEYS = ["API_KEY", "ORG_USERNAME", "ORG_PASSWORD", "ACCOUNT_USERNAME", "GS_CLIENT_SECRET"]
+
+
+def load_secrets(path=".streamlit/secrets.toml"):
+    """Same keys as st.secrets, read from the Streamlit secrets file; environment variables win."""
+    secrets = {}
+    if path and os.path.exists(path):
+        import tomllib
+        with open(path, "rb") as f:
+            secrets.update(tomllib.load(f))
+    for key in SECRET_KEYS:
+        if os.environ.get(key):
+            secrets[key] = os.environ[key]
+    return secrets
+
+
+def engine_from_secrets(secrets):
+    return PricingEngine(
+        api_key=secrets["API_KEY"],
+        org_username=secrets["ORG_USERNAME"],
+        org_password=secrets["ORG_PASSWORD"],
+        account_username=secrets["ACCOUNT_USERNAME"],
+        gs_client_secret=secrets["GS_CLIENT_SECRET"],
+    )
+
+
+# -----------------------------
+# CLI: price lanes from JSON
+# -----------------------------
+def _load_lanes(text):
+    # A JSON array, a single JSON object, or one JSON object per line
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+        rows = data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price lanes without the Streamlit UI. Prints one JSON row per lane.")
+    parser.add_argument("input", nargs="?", help="JSON / JSON-lines file with lanes (default: stdin)")
+    parser.add_argument("--vooma", action="store_true", help="Input is a Vooma paste; loads separated by blank lines")
+    parser.add_argument("--mode", choices=["Spot", "Contract"], default="Spot")
+    parser.add_argument("--months", type=int, default=12, help="Forecast months, Contract mode only (1-12)")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="Streamlit secrets file with the API credentials")
+    parser.add_argument("--metrics", help="Write per-stage timings and cache hit ratios here (Prometheus text format)")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="Record every provider call (secrets redacted) to this file")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="Answer every provider call from this file, no network")
+    parser.add_argument("--replay-latency", choices=["recorded", "zero"], default="recorded")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    if args.record:
+        use_cassette(args.record, "record")
+    elif args.replay:
+        use_cassette(args.replay, "replay", latency=args.replay_latency)
+
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+
+    if args.vooma:
+        lanes = parse_bulk_lanes({"stops": stops} for stops in iter_vooma_loads(text))
+    else:
+        lanes = parse_bulk_lanes(_load_lanes(text))
+    selected_months = forecast_months_to_selected(args.months) if args.mode == "Contract" else 1
+    secrets = load_secrets(args.secrets)
+    if args.replay:
+        # Credentials are redacted in the cassette: any placeholder will do
+        secrets = {**{key: "replay" for key in SECRET_KEYS}, **secrets}
+    engine = engine_from_secrets(secrets)
+
+    for row in engine.price_lanes_bulk(lanes, args.mode, selected_months):
+        print(json.dumps(row, ensure_ascii=False, default=str), flush=True)
+
+    if args.metrics:
+        write_metrics_file(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
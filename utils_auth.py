@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from utils_http import http_post
+from utils_perf import span
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# DAT TOKEN BROKER (shared by every session in the process)
+# -----------------------------
+class DATTokenBroker:
+    """Holds the DAT user bearer token for the whole process.
+
+    The token is refreshed on a background thread `refresh_margin` seconds
+    before it expires (at most half its lifetime, for short-lived tokens),
+    concurrent refreshes collapse into one exchange, and
+    the token can be persisted to `cache_path` so a restart does not have to
+    cold-authenticate.
+    """
+
+    def __init__(self, org_url, user_url, org_username, org_password, account_username,
+                 refresh_margin=300, default_ttl=1800, cache_path=None):
+        self.org_url = org_url
+        self.user_url = user_url
+        self.org_username = org_username
+        self.org_password = org_password
+        self.account_username = account_username
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.default_ttl = timedelta(seconds=default_ttl)
+        self.cache_path = cache_path
+
+        self._token = None
+        self._expiry = None
+        self._refresh_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+        self._load_cached_token()
+
+    # ---- public API ----
+    def get_token(self, force_refresh=False):
+        if not force_refresh and self._is_fresh():
+            return self._token
+
+        seen_token = self._token
+        with span("dat_token"), self._lock:
+            # Another caller refreshed while we waited for the lock: reuse its token
+            if self._is_fresh() and (not force_refresh or self._token is not seen_token):
+                return self._token
+            self._refresh_locked()
+            return self._token
+
+    @property
+    def expiry(self):
+        return self._expiry
+
+    def stop(self):
+        self._stop.set()
+
+    # ---- internals ----
+    def _is_fresh(self):
+        if not self._token or not self._refresh_at:
+            return False
+        return datetime.now(timezone.utc) < self._refresh_at
+
+    def _schedule_refresh(self, expiry):
+        # A token that lives less than the margin would be due before it is even
+        # used (and re-fetched in a tight loop): cap the margin at half its lifetime
+        lifetime = max(expiry - datetime.now(timezone.utc), timedelta(0))
+        self._refresh_at = expiry - min(self.refresh_margin, lifetime / 2)
+
+    def _refresh_locked(self):
+        org_payload = {
+            "username": self.org_username,
+            "password": self.org_password
+        }
+        org_response = http_post(self.org_url, json=org_payload)
+        org_response.raise_for_status()
+        org_token = org_response.json()["accessToken"]
+
+        user_payload = {
+            "username": self.account_username
+        }
+        user_headers = {
+            "Authorization": f"Bearer {org_token}"
+        }
+        user_response = http_post(self.user_url, json=user_payload, headers=user_headers)
+        user_response.raise_for_status()
+        data = user_response.json()
+
+        expires_raw = data.get("expiresWhen")
+        if expires_raw:
+            expires_dt = datetime.fromisoformat(expires_raw.replace("Z", "+00:00"))
+        else:
+            # No expiry returned: assume the default lifetime instead of "now",
+            # which would force a new exchange on every call
+            expires_dt = datetime.now(timezone.utc) + self.default_ttl
+
+        self._token = data["accessToken"]
+        self._expiry = expires_dt
+        self._schedule_refresh(expires_dt)
+        logger.info("DAT token refreshed. Expires: %s", expires_dt.isoformat())
+
+        self._save_cached_token()
+        self._ensure_refresher()
+
+    def _ensure_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="dat-token-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            refresh_at = self._refresh_at
+            if refresh_at is None:
+                wait = 30
+            else:
+                # Floor: even a token issued already expired cannot make this spin
+                wait = max(1.0, (refresh_at - datetime.now(timezone.utc)).total_seconds())
+
+            if self._stop.wait(wait):
+                return
+
+            if self._is_fresh():
+                continue
+            try:
+                with self._lock:
+                    if not self._is_fresh():
+                        self._refresh_locked()
+            except Exception:
+                logger.exception("Background DAT token refresh failed. Retrying in 30s.")
+                if self._stop.wait(30):
+                    return
+
+    def _load_cached_token(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            expiry = datetime.fromisoformat(cached["expiresWhen"])
+            if datetime.now(timezone.utc) < expiry - self.refresh_margin:
+                self._token = cached["accessToken"]
+                self._expiry = expiry
+                self._schedule_refresh(expiry)
+                self._ensure_refresher()
+        except Exception:
+            logger.warning("Ignoring unreadable DAT token cache at %s", self.cache_path)
+
+    def _save_cached_token(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            # Created 0600 before the token is written; the mode only applies on
+            # creation, so a temp file left by a crashed write is removed first
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"accessToken": self._token, "expiresWhen": self._expiry.isoformat()}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            logger.warning("Could not persist DAT token to %s", self.cache_path)
+
+
+_dat_broker = None
+_dat_broker_lock = threading.Lock()
+
+
+def get_dat_token_broker(org_url, user_url, org_username, org_password, account_username, **options):
+    global _dat_broker
+    if _dat_broker is None:
+        with _dat_broker_lock:
+            if _dat_broker is None:
+                _dat_broker = DATTokenBroker(
+                    org_url, user_url, org_username, org_password, account_username, **options
+                )
+    return _dat_broker
+
+
+# -----------------------------
+# GREENSCREENS CLIENT (cached OAuth client-credentials token)
+# -----------------------------
+class GreenScreensClient:
+    """Prediction client that reuses the GreenScreens access token until it expires.
+
+    The token is refreshed `refresh_margin` seconds (at most half its lifetime)
+    before `expires_in` runs out, and a 401 from the prediction endpoint triggers one re-auth + retry.
+    """
+
+    def __init__(self, auth_url, predict_url, client_id, client_secret,
+                 refresh_margin=60, default_ttl=3600):
+        self.auth_url = auth_url
+        self.predict_url = predict_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.default_ttl = default_ttl
+
+        self._token = None
+        self._expiry = None
+        self._refresh_at = None
+        self._lock = threading.Lock()
+
+    def get_token(self, force_refresh=False):
+        if not force_refresh and self._is_fresh():
+            return self._token
+
+        seen_token = self._token
+        with span("gs_auth"), self._lock:
+            if self._is_fresh() and (not force_refresh or self._token is not seen_token):
+                return self._token
+            self._refresh_locked()
+            return self._token
+
+    def predict(self, body):
+        response = self._post_prediction(body, self.get_token())
+
+        if response.status_code == 401:
+            logger.info("GreenScreens returned 401. Re-authenticating and retrying once.")
+            response = self._post_prediction(body, self.get_token(force_refresh=True))
+
+        response.raise_for_status()
+        return response.json()
+
+    def _post_prediction(self, body, access_token):
+        prediction_headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        with span("gs_predict"):
+            return http_post(self.predict_url, json=body, headers=prediction_headers)
+
+    def _is_fresh(self):
+        if not self._token or not self._refresh_at:
+            return False
+        return datetime.now(timezone.utc) < self._refresh_at
+
+    def _refresh_locked(self):
+        auth_payload = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "grant_type": "client_credentials"
+        }
+        auth_headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        auth_response = http_post(self.auth_url, data=auth_payload, headers=auth_headers)
+        auth_response.raise_for_status()
+        data = auth_response.json()
+
+        access_token = data.get("access_token")
+        if not access_token:
+            raise ValueError("Failed to obtain GreenScreens access token.")
+
+        expires_in = data.get("expires_in") or self.default_ttl
+        lifetime = timedelta(seconds=int(expires_in))
+        self._token = access_token
+        self._expiry = datetime.now(timezone.utc) + lifetime
+        # Same cap as the DAT broker: a token shorter than the margin is still reused
+        self._refresh_at = self._expiry - min(self.refresh_margin, lifetime / 2)
+        logger.info("GreenScreens token refreshed. Expires in %ss", expires_in)
+
+
+_gs_client = None
+_gs_client_lock = threading.Lock()
+
+
+def get_greenscreens_client(auth_url, predict_url, client_id, client_secret, **options):
+    global _gs_client
+    if _gs_client is None:
+        with _gs_client_lock:
+            if _gs_client is None:
+                _gs_client = GreenScreensClient(auth_url, predict_url, client_id, client_secret, **options)
+    return _gs_client
@@ -0,0 +1,264 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+
+# -----------------------------
+# TTL + LRU CACHE (process-wide, shared by every Streamlit session)
+# -----------------------------
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL.
+
+    Each entry can carry its own TTL (e.g. a shorter one for "no rates"
+    answers). When `maxsize` is reached the least recently used entry goes.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_MISSING = object()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, maxsize=1024, ttl=600):
+    # Named registry so the main Streamlit script (re-executed on every rerun)
+    # always gets back the same cache object.
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                cache = TTLCache(maxsize=maxsize, ttl=ttl)
+                _caches[name] = cache
+    return cache
+
+
+def clear_caches():
+    """Empty every named cache and the MCI cache (the route store is on disk and stays)."""
+    for cache in list(_caches.values()):
+        cache.clear()
+    if _mci_cache is not None:
+        _mci_cache.scores.clear()
+
+
+def cache_stats():
+    """{name: (hits, misses, entries)} for every named cache, the MCI cache and the route store."""
+    stats = {name: (cache.hits, cache.misses, len(cache)) for name, cache in list(_caches.items())}
+    if _mci_cache is not None:
+        stats["mci_scores"] = (_mci_cache.scores.hits, _mci_cache.scores.misses, len(_mci_cache.scores))
+    for store in list(_distance_stores.values()):
+        stats["route_legs"] = (store.hits, store.misses, None)
+    return stats
+
+
+# -----------------------------
+# CACHE KEYS
+# -----------------------------
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).upper()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v not in (None, "")}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def dat_lookup_key(rate_request):
+    # Canonical origin/destination dicts + equipment + rateType + targetEscalation
+    normalized = {
+        "origin": _normalize(rate_request.get("origin")),
+        "destination": _normalize(rate_request.get("destination")),
+        "equipment": _normalize(rate_request.get("equipment")),
+        "rateType": _normalize(rate_request.get("rateType")),
+        "targetEscalation": _normalize(rate_request.get("targetEscalation")),
+        "includeMyRate": rate_request.get("includeMyRate"),
+    }
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+# -----------------------------
+# MCI CACHE (expires at the next PREVIOUS_BUSINESS_DAY rollover)
+# -----------------------------
+def next_business_day_rollover(now=None, rollover_hour_utc=10):
+    """Next moment the PREVIOUS_BUSINESS_DAY timeframe points at a new day.
+
+    That happens on the morning after each business day (Tue-Sat); Sat, Sun
+    and Monday morning all still see Friday. Holidays are not modelled, so at
+    worst a holiday costs one extra refetch.
+    """
+    now = now or datetime.now(timezone.utc)
+    candidate = now.replace(hour=rollover_hour_utc, minute=0, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    while (candidate - timedelta(days=1)).weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+class MCICache:
+    """MCI scores keyed by (market area, direction, equipment category).
+
+    Callers pass the market area the location falls in (from the ZIP
+    gazetteer) on both get and set, so every ZIP and city of a market shares
+    one cached score, even ones never looked up before. Without a known area
+    the ZIP or city/state is the key. Scores expire at the business-day
+    rollover.
+    """
+
+    def __init__(self, maxsize=4096, rollover_hour_utc=10):
+        self.rollover_hour_utc = rollover_hour_utc
+        self.scores = TTLCache(maxsize=maxsize, ttl=86400)
+
+    @staticmethod
+    def location_key(params):
+        if params.get("postalCode"):
+            return ("ZIP", _normalize(params["postalCode"]))
+        return ("CITY", _normalize(params.get("city")), _normalize(params.get("stateOrProvince")))
+
+    def key(self, params, market_area=None):
+        place = ("MARKET", _normalize(market_area)) if market_area else self.location_key(params)
+        return (place, params.get("direction"), params.get("equipmentCategory"))
+
+    def get(self, params, market_area=None):
+        return self.scores.get(self.key(params, market_area))
+
+    def set(self, params, score, market_area=None):
+        if score is None:
+            return
+        ttl = (next_business_day_rollover(rollover_hour_utc=self.rollover_hour_utc)
+               - datetime.now(timezone.utc)).total_seconds()
+        self.scores.set(self.key(params, market_area), score, ttl=ttl)
+
+
+_mci_cache = None
+
+
+def get_mci_cache(**options):
+    global _mci_cache
+    if _mci_cache is None:
+        with _caches_lock:
+            if _mci_cache is None:
+                _mci_cache = MCICache(**options)
+    return _mci_cache
+
+
+# -----------------------------
+# ROUTE DISTANCE STORE (SQLite, per leg)
+# -----------------------------
+def normalize_address(address):
+    # ", Dallas, TX" / "75201 ,dallas,tx" -> "DALLAS, TX" / "75201, DALLAS, TX"
+    parts = [" ".join(p.split()).upper() for p in str(address).split(",")]
+    return ", ".join(p for p in parts if p)
+
+
+class DistanceStore:
+    """Disk-backed road distance per directed leg (origin -> destination).
+
+    Road distance between two addresses is effectively static, so legs are
+    kept until the file is deleted and a multi-stop route is priced by
+    summing its legs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS legs ("
+                " origin TEXT NOT NULL,"
+                " destination TEXT NOT NULL,"
+                " meters INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (origin, destination))"
+            )
+
+    def get_legs(self, legs):
+        """Return {(origin, destination): meters} for the legs already stored."""
+        keys = [(normalize_address(o), normalize_address(d)) for o, d in legs]
+        found = {}
+        with self._lock:
+            for leg, key in zip(legs, keys):
+                row = self._conn.execute(
+                    "SELECT meters FROM legs WHERE origin = ? AND destination = ?", key
+                ).fetchone()
+                if row is not None:
+                    found[leg] = row[0]
+            self.hits += len(found)
+            self.misses += len(legs) - len(found)
+        return found
+
+    def set_legs(self, leg_meters):
+        now = time.time()
+        rows = [
+            (normalize_address(o), normalize_address(d), int(meters), now)
+            for (o, d), meters in leg_meters.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO legs (origin, destination, meters, updated_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+
+_distance_stores = {}
+
+
+def get_distance_store(path):
+    store = _distance_stores.get(path)
+    if store is None:
+        with _caches_lock:
+            store = _distance_stores.get(path)
+            if store is None:
+                store = DistanceStore(path)
+                _distance_stores[path] = store
+    return store
@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from Access import CASSETTE_REDACT_FIELDS, CASSETTE_IGNORED_FIELDS, CASSETTE_TIME_FIELDS
+
+REDACTED = "<redacted>"
+_KEPT_RESPONSE_HEADERS = ("Content-Type", "Retry-After")
+_SECRET_QUERY_PARAMS = ("key", "api_key")
+
+
+# -----------------------------
+# REDACTION / MATCHING
+# -----------------------------
+def _scrub(value, drop=()):
+    # Secrets -> "<redacted>", volatile fields (e.g. pickupDateTime) removed
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if k in CASSETTE_REDACT_FIELDS else _scrub(v, drop)
+            for k, v in value.items() if k not in drop
+        }
+    if isinstance(value, list):
+        return [_scrub(v, drop) for v in value]
+    return value
+
+
+def _shift_times(value, seconds):
+    # Absolute expiries (DAT expiresWhen) moved forward by the time since recording
+    if isinstance(value, dict):
+        shifted = {}
+        for k, v in value.items():
+            if k in CASSETTE_TIME_FIELDS and isinstance(v, str):
+                try:
+                    v = (datetime.fromisoformat(v.replace("Z", "+00:00")) + timedelta(seconds=seconds)).isoformat()
+                except ValueError:
+                    pass
+            shifted[k] = _shift_times(v, seconds)
+        return shifted
+    if isinstance(value, list):
+        return [_shift_times(v, seconds) for v in value]
+    return value
+
+
+def _scrub_url(url):
+    parts = urlsplit(url)
+    query = sorted(
+        (k, REDACTED if k in CASSETTE_REDACT_FIELDS or k in _SECRET_QUERY_PARAMS else v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+    )
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _parse_body(body, content_type):
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    if "json" in (content_type or ""):
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body
+    if "x-www-form-urlencoded" in (content_type or ""):
+        return dict(parse_qsl(body, keep_blank_values=True))
+    return body
+
+
+def request_key(method, url, body, content_type):
+    """Same request -> same key, whatever the credentials or the clock."""
+    scrubbed = _scrub(_parse_body(body, content_type), drop=CASSETTE_IGNORED_FIELDS)
+    digest = hashlib.sha1(json.dumps(scrubbed, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    # Host left out: a cassette recorded against the live APIs replays against any base URL
+    parts = urlsplit(_scrub_url(url))
+    return f"{method.upper()} {parts.path}?{parts.query} {digest}"
+
+
+# -----------------------------
+# CASSETTE STORE (gzip JSON lines, one record per provider call)
+# -----------------------------
+class Cassette:
+    """Recorded provider calls, replayed in the order they were recorded.
+
+    Each record holds the match key, the redacted URL, status, a couple of
+    headers, the (redacted) response body and how long the call took. Repeats
+    of the same request are served in recording order; once they run out the
+    last one keeps being served.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records.setdefault(record["key"], []).append(record)
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.values())
+
+    def append(self, record):
+        with self._lock:
+            self._records.setdefault(record["key"], []).append(record)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # One gzip member per record: the file stays readable even if the process dies
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def next_for(self, key):
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                return None
+            idx = self._served.get(key, 0)
+            self._served[key] = idx + 1
+            return records[min(idx, len(records) - 1)]
+
+    def rewind(self):
+        with self._lock:
+            self._served.clear()
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path):
+    cassette = _cassettes.get(path)
+    if cassette is None:
+        with _cassettes_lock:
+            cassette = _cassettes.get(path)
+            if cassette is None:
+                cassette = Cassette(path)
+                _cassettes[path] = cassette
+    return cassette
+
+
+# -----------------------------
+# TRANSPORT (requests adapter)
+# -----------------------------
+class CassetteAdapter(HTTPAdapter):
+    """HTTPAdapter that records every exchange to a cassette, or answers from it.
+
+    mode "record": real call, then the redacted exchange is appended.
+    mode "replay": no network; recorded answers with their recorded latency
+    (latency="recorded") or immediately (latency="zero"). A request that was
+    never recorded fails like an unreachable host.
+    """
+
+    def __init__(self, cassette, mode, latency="recorded", **kwargs):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        content_type = request.headers.get("Content-Type", "")
+        key = request_key(request.method, request.url, request.body, content_type)
+
+        if self.mode == "replay":
+            return self._replay(request, key)
+
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        elapsed = time.monotonic() - start
+        body = _scrub(_parse_body(response.content, response.headers.get("Content-Type")))
+        self.cassette.append({
+            "key": key,
+            "url": _scrub_url(request.url),
+            "status": response.status_code,
+            "headers": {h: response.headers[h] for h in _KEPT_RESPONSE_HEADERS if h in response.headers},
+            "body": body,
+            "elapsed": round(elapsed, 4),
+            "recorded_at": round(time.time(), 3),
+        })
+        return response
+
+    def _replay(self, request, key):
+        record = self.cassette.next_for(key)
+        if record is None:
+            raise requests.ConnectionError(f"No cassette entry for {key}", request=request)
+        if self.latency == "recorded":
+            time.sleep(record["elapsed"])
+
+        body = _shift_times(record["body"], time.time() - record.get("recorded_at", time.time()))
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.headers = CaseInsensitiveDict(record["headers"])
+        if body is None:
+            response._content = b""
+        elif isinstance(body, str):
+            response._content = body.encode("utf-8")
+        else:
+            response._content = json.dumps(body).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        response.elapsed = timedelta(seconds=record["elapsed"])
+        return response
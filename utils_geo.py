@@ -0,0 +1,230 @@
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import namedtuple
+
+
+# -----------------------------
+# ZIP GAZETTEER (memory-mapped, read-only)
+# -----------------------------
+# File layout (little endian):
+#   header   : magic (8s) | record count (I) | city index offset (I) | strings offset (I)
+#   records  : one per ZIP, sorted by ZIP -> zip (I) | lat (f) | lon (f) | place offset (I) | place length (H)
+#   city idx : record numbers (I) sorted by "CITY|ST", first ZIP of each city/state only
+#   strings  : utf-8 "City|ST|Market area" for every record
+_MAGIC = b"ZIPGAZ1\0"
+_HEADER = struct.Struct("<8sIII")
+_RECORD = struct.Struct("<IffIH")
+_INDEX = struct.Struct("<I")
+
+ZipEntry = namedtuple("ZipEntry", ["zip", "city", "state", "lat", "lon", "market_area"])
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def _city_key(city, state):
+    return f"{' '.join(str(city).split()).upper()}|{str(state).strip().upper()}"
+
+
+class ZipGazetteer:
+    """ZIP -> (city, state, lat, lon, market area) lookups without any API call.
+
+    The index file is memory-mapped on first use, so importing this module or
+    building the object costs nothing and every lookup is a binary search over
+    the mapped bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._buf = None
+        self._count = 0
+        self._city_offset = 0
+        self._city_count = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._buf is None:
+            with self._lock:
+                if self._buf is None:
+                    with open(self.path, "rb") as f:
+                        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, count, city_offset, strings_offset = _HEADER.unpack_from(buf, 0)
+                    if magic != _MAGIC:
+                        raise ValueError(f"{self.path} is not a ZIP gazetteer file")
+                    self._count = count
+                    self._city_offset = city_offset
+                    self._city_count = (strings_offset - city_offset) // _INDEX.size
+                    self._buf = buf
+        return self._buf
+
+    def _record(self, idx):
+        return _RECORD.unpack_from(self._buf, _HEADER.size + idx * _RECORD.size)
+
+    def _place(self, idx):
+        _, _, _, place_offset, place_len = self._record(idx)
+        return self._buf[place_offset:place_offset + place_len].decode("utf-8").split("|")
+
+    def _city_record(self, pos):
+        return _INDEX.unpack_from(self._buf, self._city_offset + pos * _INDEX.size)[0]
+
+    def _entry(self, idx):
+        zip_code, lat, lon, _, _ = self._record(idx)
+        city, state, market_area = self._place(idx)
+        return ZipEntry(f"{zip_code:05d}", city, state, lat, lon, market_area or None)
+
+    def __len__(self):
+        self._open()
+        return self._count
+
+    # ---- lookups ----
+    def lookup_zip(self, zip_code):
+        if not zip_code or not str(zip_code).isdigit():
+            return None
+        self._open()
+        target = int(zip_code)
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._record(lo)[0] == target:
+            return self._entry(lo)
+        return None
+
+    def lookup_city(self, city, state):
+        """First (lowest) ZIP of a city/state, or None."""
+        if not city or not state:
+            return None
+        self._open()
+        target = _city_key(city, state)
+
+        lo, hi = 0, self._city_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _city_key(*self._place(self._city_record(mid))[:2]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._city_count:
+            idx = self._city_record(lo)
+            if _city_key(*self._place(idx)[:2]) == target:
+                return self._entry(idx)
+        return None
+
+    def resolve(self, location):
+        """Gazetteer entry for a Location: its ZIP if known, else its city/state."""
+        entry = self.lookup_zip(location.postal_code) if location.postal_code else None
+        return entry or self.lookup_city(location.city, location.state)
+
+    def validate(self, location):
+        """None when the stop looks right, otherwise a short reason."""
+        if location.postal_code:
+            entry = self.lookup_zip(location.postal_code)
+            if entry is None:
+                return f"Unknown ZIP {location.postal_code}"
+            if entry.state != location.state.upper():
+                return f"ZIP {location.postal_code} is in {entry.state}, not {location.state}"
+            return None
+        if self.lookup_city(location.city, location.state) is None:
+            return f"Unknown city {location.city}, {location.state}"
+        return None
+
+    def estimate_miles(self, locations, circuity=1.2):
+        """Straight-line miles x circuity over every leg, or None if a stop is unknown."""
+        points = []
+        for location in locations:
+            entry = self.resolve(location)
+            if entry is None:
+                return None
+            points.append((entry.lat, entry.lon))
+
+        total = sum(haversine_miles(a, b) for a, b in zip(points, points[1:]))
+        return round(total * circuity)
+
+
+def haversine_miles(a, b):
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+
+def get_gazetteer(path):
+    # None when the index has not been built: every caller then skips the offline checks
+    gazetteer = _gazetteers.get(path)
+    if gazetteer is None:
+        if not path or not os.path.exists(path):
+            return None
+        with _gazetteers_lock:
+            gazetteer = _gazetteers.get(path)
+            if gazetteer is None:
+                gazetteer = ZipGazetteer(path)
+                _gazetteers[path] = gazetteer
+    return gazetteer
+
+
+# -----------------------------
+# BUILD THE INDEX FROM A CSV
+# -----------------------------
+def build_gazetteer(csv_path, out_path):
+    """Write the binary index from a CSV with zip, city, state, lat, lon[, market_area] columns."""
+    rows = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for raw in csv.DictReader(f):
+            row = {str(k).strip().lower(): (v or "").strip() for k, v in raw.items()}
+            zip_code = row.get("zip") or row.get("zipcode") or row.get("postal_code")
+            if not zip_code or not zip_code.isdigit():
+                continue
+            rows[int(zip_code)] = (
+                row["city"].replace("|", " "),
+                row["state"].upper(),
+                float(row.get("lat") or row.get("latitude")),
+                float(row.get("lon") or row.get("lng") or row.get("longitude")),
+                (row.get("market_area") or "").replace("|", " "),
+            )
+
+    zips = sorted(rows)
+
+    # First ZIP per city/state, sorted by the city key
+    first_by_city = {}
+    for idx, zip_code in enumerate(zips):
+        city, state = rows[zip_code][:2]
+        first_by_city.setdefault(_city_key(city, state), idx)
+    city_index = b"".join(_INDEX.pack(idx) for _, idx in sorted(first_by_city.items()))
+
+    city_offset = _HEADER.size + len(zips) * _RECORD.size
+    strings_offset = city_offset + len(city_index)
+
+    records = bytearray()
+    strings = bytearray()
+    for zip_code in zips:
+        city, state, lat, lon, market_area = rows[zip_code]
+        place = f"{city}|{state}|{market_area}".encode("utf-8")
+        records += _RECORD.pack(zip_code, lat, lon, strings_offset + len(strings), len(place))
+        strings += place
+
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(zips), city_offset, strings_offset))
+        f.write(records)
+        f.write(city_index)
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+    return len(zips)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python utils_geo.py build <zips.csv> <zip_gazetteer.bin>")
+    print(f"{build_gazetteer(sys.argv[2], sys.argv[3])} ZIPs written to {sys.argv[3]}")
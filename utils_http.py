@@ -0,0 +1,284 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Access import HTTP_POOL_MAXSIZE, HTTP_POOL_BLOCK, HTTP_POOL_LIMITS
+from Access import HTTP_DEFAULT_TIMEOUT, HTTP_TIMEOUTS, HTTP_MAX_RETRIES, HTTP_RETRY_STATUSES
+from Access import HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_HEDGE_HOSTS, HTTP_HEDGE_MIN_SAMPLES
+from Access import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY
+from utils_cassette import CassetteAdapter, get_cassette
+from utils_perf import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# SHARED SESSIONS (one keep-alive pool per provider host)
+# -----------------------------
+# Module state survives Streamlit reruns: only the main script is re-executed,
+# imported modules stay in sys.modules for the life of the process.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Record / replay provider traffic (utils_cassette); mode None = live calls
+_cassette = {"mode": CASSETTE_MODE, "path": CASSETTE_PATH, "latency": CASSETTE_LATENCY}
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def _build_session(host):
+    pool_size = HTTP_POOL_LIMITS.get(host, HTTP_POOL_MAXSIZE)
+
+    pool_options = dict(
+        pool_connections=1,         # a session only ever talks to its own host
+        pool_maxsize=pool_size,
+        pool_block=HTTP_POOL_BLOCK,
+    )
+    if _cassette["mode"]:
+        adapter = CassetteAdapter(
+            get_cassette(_cassette["path"]), _cassette["mode"], latency=_cassette["latency"], **pool_options
+        )
+    else:
+        adapter = HTTPAdapter(**pool_options)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    host = _host(url)
+
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _build_session(host)
+                _sessions[host] = session
+    return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def use_cassette(path, mode, latency="recorded"):
+    """Switch every provider call to record to / replay from `path` (mode None = live again)."""
+    _cassette.update(mode=mode, path=path, latency=latency)
+    close_sessions()
+
+
+# -----------------------------
+# QUOTE DEADLINE (budget shared by every call of one quote)
+# -----------------------------
+class DeadlineExceeded(requests.Timeout):
+    """The quote's time budget ran out before (or while) calling a provider."""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+_current_deadline = ContextVar("http_deadline", default=None)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Every http_get/http_post inside the block is clipped to `deadline` (None = no budget)."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def bind_context(fn, deadline=None):
+    """`fn` wrapped to run with the caller's context: quote deadline and perf trace.
+
+    Thread pools do not copy context variables into their workers, so every
+    function handed to a pool inside a quote goes through here. `deadline`
+    replaces the caller's one.
+    """
+    context = copy_context()
+    if deadline is not None:
+        context.run(_current_deadline.set, deadline)
+
+    def _bound(*args, **kwargs):
+        # One copy per call: a Context cannot be entered by two threads at once
+        return context.copy().run(fn, *args, **kwargs)
+    return _bound
+
+
+# -----------------------------
+# LATENCY TRACKING (for hedged requests)
+# -----------------------------
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+def _record_latency(host, seconds):
+    with _latencies_lock:
+        _latencies.setdefault(host, deque(maxlen=200)).append(seconds)
+
+
+def latency_p95(host):
+    """p95 of the last successful calls to `host`, or None with too few samples."""
+    with _latencies_lock:
+        samples = sorted(_latencies.get(host, ()))
+    if len(samples) < HTTP_HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(0.95 * (len(samples) - 1))]
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="http-hedge")
+    return _hedge_pool
+
+
+def _timed_send(session, method, url, host, **kwargs):
+    start = time.monotonic()
+    response = session.request(method, url, **kwargs)
+    if response.status_code < 400:
+        _record_latency(host, time.monotonic() - start)
+    return response
+
+
+def _close_when_done(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _send(session, method, url, host, **kwargs):
+    """One attempt; on hedged hosts a duplicate goes out once the first outlives the p95."""
+    hedge_after = latency_p95(host) if host in HTTP_HEDGE_HOSTS else None
+    if hedge_after is None:
+        return _timed_send(session, method, url, host, **kwargs)
+
+    pool = _get_hedge_pool()
+    futures = [pool.submit(_timed_send, session, method, url, host, **kwargs)]
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        logger.info("%s slower than its p95 (%.2fs): sending a hedged request.", host, hedge_after)
+        metrics.increment("http_hedges", host=host)
+        futures.append(pool.submit(_timed_send, session, method, url, host, **kwargs))
+
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next((f for f in done if f.exception() is None), None)
+        if winner is not None or not pending:
+            for loser in futures:
+                if loser is not winner:
+                    loser.add_done_callback(_close_when_done)
+            if winner is None:
+                return next(iter(done)).result()   # both failed: raise the last error
+            return winner.result()
+
+
+# -----------------------------
+# REQUESTS WITH TIMEOUTS, RETRIES AND DEADLINE
+# -----------------------------
+def _backoff_delay(attempt, response=None):
+    # Full jitter: random(0, base * 2**attempt), capped; Retry-After (seconds) wins when larger
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.strip().isdigit():
+        delay = max(delay, min(float(retry_after), HTTP_BACKOFF_MAX))
+    return delay
+
+
+def http_request(method, url, **kwargs):
+    """session.request with the provider's (connect, read) timeout, retries and the quote deadline.
+
+    429/5xx answers and connection errors/timeouts are retried up to
+    HTTP_MAX_RETRIES times with jittered exponential backoff. Under a
+    deadline_scope every timeout is clipped to the time left, and a retry that
+    would not fit in it is not attempted: the last answer (or error) comes back.
+    """
+    host = _host(url)
+    session = get_session(url)
+    connect_timeout, read_timeout = kwargs.pop("timeout", None) or HTTP_TIMEOUTS.get(host, HTTP_DEFAULT_TIMEOUT)
+    deadline = current_deadline()
+
+    attempt = 0
+    while True:
+        timeout = (connect_timeout, read_timeout)
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Quote deadline ({deadline.seconds}s) reached before calling {host}.")
+            timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+        error = response = None
+        try:
+            response = _send(session, method, url, host, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= HTTP_MAX_RETRIES:
+                raise
+            error = e
+        else:
+            if response.status_code not in HTTP_RETRY_STATUSES or attempt >= HTTP_MAX_RETRIES:
+                return response
+
+        delay = _backoff_delay(attempt, response)
+        if deadline is not None and delay >= deadline.remaining():
+            # No time left for another attempt: hand back what we have
+            if response is not None:
+                return response
+            raise error
+
+        logger.info(
+            "%s %s failed (%s); retry %d/%d in %.2fs.",
+            method, host, response.status_code if response is not None else error,
+            attempt + 1, HTTP_MAX_RETRIES, delay
+        )
+        metrics.increment("http_retries", host=host)
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+        attempt += 1
+
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
@@ -1,95 +1,338 @@
-import streamlit as st
 import re
+import threading
+import weakref
 
 # Función para redondear a múltiplos de 5
 def round_to_nearest_5(value):
     return round(value / 5) * 5
 
-def parse_location_string_spots(loc_str):
+# -----------------------------
+# LOCATION (parsed once, shared by every provider)
+# -----------------------------
+_ZIP_RE = re.compile(r"^\d{5}$")
+
+
+class Location:
+    """One stop, parsed once from "ZIP, City, ST" or "City, ST".
+
+    Instances are interned (the same string, or the same ZIP/city/state in a
+    different spelling, returns the same object) while anything still holds
+    them, so the table does not grow with every stop ever pasted into a
+    long-running server. They are immutable, so they are safe as cache keys. Provider views are built on first use and shared:
+    treat the returned dicts as read-only.
+    """
+
+    __slots__ = ("postal_code", "city", "state", "key", "_views", "__weakref__")
+
+    _interned = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __init__(self, postal_code, city, state):
+        object.__setattr__(self, "postal_code", postal_code)
+        object.__setattr__(self, "city", city)
+        object.__setattr__(self, "state", state)
+        object.__setattr__(self, "key", (postal_code or "", city.upper(), state.upper()))
+        object.__setattr__(self, "_views", {})
+
+    @classmethod
+    def parse(cls, value):
+        if isinstance(value, cls):
+            return value
 
-        parts = [p.strip() for p in loc_str.split(",")]
+        location = cls._interned.get(value)
+        if location is not None:
+            return location
 
-        if len(parts) >= 3 and re.match(r"^\d{5}$", parts[0]):
+        parts = [p.strip() for p in value.split(",")]
+
+        if len(parts) >= 3 and _ZIP_RE.match(parts[0]):
             # Tiene ZIP válido + ciudad + estado
-            return {
-                "postalCode": parts[0],
-                "city": parts[1],
-                "stateOrProvince": parts[2]
-            }
-        elif len(parts) >= 2:
+            parsed = cls(parts[0], parts[1], parts[2])
+        elif len(parts) >= 2 and parts[-2] and parts[-1]:
             # Solo ciudad + estado
-            city = parts[-2]
-            state = parts[-1]
-            if city and state:
-                return {
-                    "city": city,
-                    "stateOrProvince": state
-                }
-        raise ValueError(f"Formato de ubicación inválido: {loc_str}")
+            parsed = cls(None, parts[-2], parts[-1])
+        else:
+            raise ValueError(f"Formato de ubicación inválido: {value}")
+
+        return cls._intern(parsed, value)
+
+    @classmethod
+    def of(cls, postal_code, city, state):
+        # Already-tokenized stop (e.g. from the Vooma paste parser)
+        location = cls._interned.get((postal_code or "", city.upper(), state.upper()))
+        if location is not None:
+            return location
+        return cls._intern(cls(postal_code or None, city, state))
+
+    @classmethod
+    def _intern(cls, parsed, raw=None):
+        location = cls._interned.get(parsed.key)
+        if location is None or raw is not None:
+            with cls._lock:
+                location = cls._interned.setdefault(parsed.key, parsed)
+                if raw is not None:
+                    cls._interned[raw] = location
+        return location
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Location is immutable")
+
+    def __eq__(self, other):
+        return isinstance(other, Location) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"Location({self.google_address!r})"
+
+    def __str__(self):
+        return self.google_address
+
+    def _view(self, name, build):
+        view = self._views.get(name)
+        if view is None:
+            view = self._views.setdefault(name, build())
+        return view
+
+    # ---- provider views ----
+    @property
+    def dat_spot(self):
+        # DAT rate lookups / MCI
+        def build():
+            view = {"postalCode": self.postal_code} if self.postal_code else {}
+            view.update({"city": self.city, "stateOrProvince": self.state})
+            return view
+        return self._view("dat_spot", build)
+
+    @property
+    def dat_contract(self):
+        # DAT forecast endpoint
+        def build():
+            view = {"postalCode": self.postal_code} if self.postal_code else {}
+            view.update({"city": self.city, "stateProv": self.state})
+            return view
+        return self._view("dat_contract", build)
+
+    @property
+    def zip_only(self):
+        if not self.postal_code:
+            return None
+        return self._view("zip_only", lambda: {"postalCode": self.postal_code})
+
+    @property
+    def google_address(self):
+        return self._view("google", lambda: ", ".join(p for p in (self.postal_code, self.city, self.state) if p))
+
+    def gs_stop(self, order):
+        # GreenScreens stop; only "order" changes between lanes
+        base = self._view("gs_stop", lambda: {
+            "city": self.city,
+            "state": self.state,
+            "country": "US",
+            "zip": self.postal_code or ""
+        })
+        return {"order": order, **base}
+
+
+def parse_location_string_spots(loc_str):
+    return dict(Location.parse(loc_str).dat_spot)
 
 
 def parse_location_string_contract(loc_str):
+    return dict(Location.parse(loc_str).dat_contract)
 
-        parts = [p.strip() for p in loc_str.split(",")]
 
-        if len(parts) >= 3 and re.match(r"^\d{5}$", parts[0]):
-            # Tiene ZIP válido + ciudad + estado
-            return {
-                "postalCode": parts[0],
-                "city": parts[1],
-                "stateProv": parts[2]
-            }
-        elif len(parts) >= 2:
-            # Solo ciudad + estado
-            city = parts[-2]
-            state = parts[-1]
-            if city and state:
-                return {
-                    "city": city,
-                    "stateProv": state
-                }
-        raise ValueError(f"Formato de ubicación inválido: {loc_str}")
+# -----------------------------
+# VOOMA PASTE TOKENIZER
+# -----------------------------
+US_STATES = frozenset("""
+    AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ NM NY
+    NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY
+""".split())
+# Cross-border stops are kept so the lane is not silently shortened: the
+# providers (or the gazetteer check) reject them if they cannot be priced
+CA_MX_REGIONS = frozenset("""
+    AB BC MB NB NL NS NT NU ON PE QC SK YT
+    AG BS CH CL CM CO CS DF DG EM GR GT HG JA MI MO NA OA PU QR QT SI SL SO TB TL TM VE YU ZA
+""".split())
+_STOP_REGIONS = US_STATES | CA_MX_REGIONS
+
+# "[ZIP ]City, ST[ ZIP]", optionally after a time ("8:00 AM Dallas, TX"). The
+# city stays on one line so a stop never swallows the line above it.
+_VOOMA_STOP_RE = re.compile(
+    r"(?P<blank>\n[ \t]*(?:\n[ \t]*)+)|"  # blank line(s): end of a load
+    r"(?:(?:Add time|AM|PM)\s+)?"
+    r"(?:(?P<zip_before>\d{5})[ \t]+)?"
+    r"(?P<city>[A-Z][A-Za-z .'\-]*),[ \t]*"
+    r"(?P<state>[A-Z]{2})\b"
+    r"(?:[ \t]*(?P<zip_after>\d{5})(?!\d))?"
+)
+_LOAD_BREAK = None
+
+
+def _iter_vooma_tokens(text):
+    # One pass over the paste: a Location per stop, _LOAD_BREAK per blank-line gap
+    for match in _VOOMA_STOP_RE.finditer(text):
+        if match.lastgroup == "blank":
+            yield _LOAD_BREAK
+            continue
+        state = match.group("state")
+        if state not in _STOP_REGIONS:
+            continue
+        yield Location.of(
+            match.group("zip_before") or match.group("zip_after"),
+            match.group("city").strip(),
+            state
+        )
+
+
+def iter_vooma_stops(text):
+    """Yield a Location for every stop in a Vooma paste, in order."""
+    for token in _iter_vooma_tokens(text):
+        if token is not _LOAD_BREAK:
+            yield token
+
+
+def iter_vooma_loads(text):
+    """Yield the stops of each load in a multi-load paste.
+
+    Loads are separated by one or more blank lines; blocks with fewer than
+    two stops (headers, notes) are skipped.
+    """
+    stops = []
+    for token in _iter_vooma_tokens(text):
+        if token is not _LOAD_BREAK:
+            stops.append(token)
+            continue
+        if len(stops) >= 2:
+            yield stops
+        stops = []
+
+    if len(stops) >= 2:
+        yield stops
 
 
 # Fuction to process the input into the code
 def parse_locations():
+    import streamlit as st  # UI only: the parsers above are used headless too
+
     st.subheader("Input Locations")
 
     
     # Key used only for the text area field
     text_key = "input_locations_text"
 
-    # Initialize only that specific key if it doesn't exist
-    if "clear_text_triggered" in st.session_state and st.session_state["clear_text_triggered"]:
+    def _clear_text():
+        # Runs before the rerun the click triggers, so no extra st.rerun() is needed
         st.session_state[text_key] = ""
-        st.session_state["clear_text_triggered"] = False  
-
 
     col1, col2 = st.columns([10, 1])  
 
     with col1:
          input_text = st.text_area(
             "PUT THE LANE (Copy and paste directly from Vooma):",
-            value=st.session_state.get(text_key, ""),
             key=text_key
         )
 
     with col2:
         st.markdown("###")  # Align vertically
-        if st.button("🧼"):
-            st.session_state["clear_text_triggered"] = True 
-            st.rerun()  
+        st.button("🧼", on_click=_clear_text)
 
 
     if input_text:
-        pattern = re.compile(r"(?:(?:Add time|AM|PM)\s+)?([A-Z][a-zA-Z\s]+),\s*([A-Z]{2})(?:\s*(\d{5}))?")
-        matches = pattern.findall(input_text)
+        return list(iter_vooma_stops(input_text))
 
-        locations_list = [f"{zip_code if zip_code else ''}, {city.strip()}, {state}" for city, state, zip_code in matches]
-        return locations_list
-    
-    
-     
-    
-  
     return []
+
+
+# -----------------------------
+# BULK RFP LANES (CSV / Excel rows)
+# -----------------------------
+BULK_EQUIPMENT = ["VAN", "FLATBED", "REEFER", "STEPDECK", "CONESTOGA", "HOTSHOT"]
+
+
+def _cell(value):
+    # Empty Excel/CSV cells come through pandas as NaN
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value):
+    # Spreadsheet-style numbers: "8,000", "8k", "8000 lbs", "15%", "$1,200"
+    text = value.lower().replace(",", "").replace("$", "").replace("%", "").replace("lbs", "").strip()
+    scale = 1
+    if text.endswith("k"):
+        text, scale = text[:-1].strip(), 1000
+    return float(text) * scale
+
+
+def _markup(value):
+    # "15" and "15%" are percents; 0.15 is a fraction, e.g. an Excel percent-formatted cell
+    number = _number(value)
+    return number / 100 if "%" in value or number > 1 else number
+
+
+def parse_bulk_lanes(rows, default_customer="Other", default_hotshot_weight=8000):
+    """Turn uploaded rows into lanes for bulk pricing.
+
+    Each row needs either a `stops` column (locations separated by ";", or a
+    list of stops e.g. from iter_vooma_loads) or
+    `origin` + `destination`; `equipment`, `hotshot_weight_lbs`, `customer`
+    and `markup` (percent, e.g. 15 or "15%", or a fraction up to 1, e.g. 0.15
+    from a percent-formatted Excel cell) are optional; "8k" and "8,000 lbs" are read
+    as numbers. Column names are case-insensitive. Rows that cannot be priced
+    keep an `error` so they still show up in the output.
+    """
+    lanes = []
+    for idx, raw in enumerate(rows, start=1):
+        row = {str(k).strip().lower(): v if isinstance(v, list) else _cell(v) for k, v in raw.items()}
+
+        if isinstance(row.get("stops"), list):
+            locations = row["stops"]
+        elif row.get("stops"):
+            locations = [loc.strip() for loc in row["stops"].split(";") if loc.strip()]
+        else:
+            locations = [row[k] for k in ("origin", "destination") if row.get(k)]
+
+        equipment = (row.get("equipment") or "VAN").upper()
+        weight = row.get("hotshot_weight_lbs")
+
+        lane = {
+            "row": idx,
+            "locations": locations,
+            "equipment": equipment,
+            "hotshot_weight_lbs": default_hotshot_weight,
+            "customer": row.get("customer") or default_customer,
+        }
+
+        # A value that is not a number flags this row only, like a bad stop
+        number_error = None
+        try:
+            if weight:
+                lane["hotshot_weight_lbs"] = int(_number(weight))
+        except (ValueError, OverflowError):
+            number_error = f"Invalid hotshot_weight_lbs: {weight}"
+        try:
+            if row.get("markup"):
+                lane["markup"] = _markup(row["markup"])
+        except ValueError:
+            number_error = number_error or f"Invalid markup: {row['markup']}"
+
+        if number_error:
+            lane["error"] = number_error
+        elif len(locations) < 2:
+            lane["error"] = "At least two locations are required."
+        elif equipment not in BULK_EQUIPMENT:
+            lane["error"] = f"Unknown equipment type: {equipment}"
+        else:
+            try:
+                for loc in locations:
+                    Location.parse(loc)
+            except ValueError as e:
+                lane["error"] = str(e)
+
+        lanes.append(lane)
+    return lanes
@@ -0,0 +1,233 @@
+import bisect
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils_cache import cache_stats
+
+
+# -----------------------------
+# QUOTE TRACES (per-quote spans with a correlation ID)
+# -----------------------------
+class Trace:
+    """Spans of one quote, tagged with a short correlation ID.
+
+    Spans are (stage, start offset s, duration s, error, detail) and can be
+    added from any thread that runs under the trace (see utils_http.bind_context).
+    """
+
+    def __init__(self, trace_id=None, max_spans=500):
+        self.trace_id = trace_id or uuid.uuid4().hex[:8]
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, duration, error=None, detail=None):
+        with self._lock:
+            self._spans.append((stage, start - self._t0, duration, error, detail or {}))
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self):
+        """Per stage: calls, total ms, max ms and errors, in first-seen order."""
+        stages = {}
+        for stage, _, duration, error, _ in self.spans:
+            row = stages.setdefault(stage, {"stage": stage, "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            row["calls"] += 1
+            row["total_ms"] += duration * 1000
+            row["max_ms"] = max(row["max_ms"], duration * 1000)
+            row["errors"] += error is not None
+        for row in stages.values():
+            row["total_ms"] = round(row["total_ms"], 1)
+            row["max_ms"] = round(row["max_ms"], 1)
+        return list(stages.values())
+
+
+_current_trace = ContextVar("perf_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(trace=None):
+    """Run the block under `trace` (a new one when None) and yield it."""
+    trace = trace if isinstance(trace, Trace) else Trace(trace)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(stage, **detail):
+    """Time the block as `stage`: into the current trace (if any) and the process metrics."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield detail
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(stage, duration, error is not None)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, duration, error, detail)
+
+
+# -----------------------------
+# PROCESS METRICS (Prometheus text format)
+# -----------------------------
+# Module state survives Streamlit reruns, so the counters cover the whole process.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = _Histogram()
+            idx = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if idx < len(LATENCY_BUCKETS):
+                hist.buckets[idx] += 1
+            hist.count += 1
+            hist.sum += seconds
+            hist.errors += error
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, caches=None):
+        """Everything in Prometheus text exposition format.
+
+        `caches` maps a cache name to (hits, misses, entries or None).
+        """
+        with self._lock:
+            stages = {name: (list(h.buckets), h.count, h.sum, h.errors) for name, h in self._stages.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP spots_stage_seconds Time spent per quote stage.",
+            "# TYPE spots_stage_seconds histogram",
+        ]
+        for stage, (buckets, count, total, _) in sorted(stages.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'spots_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'spots_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'spots_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'spots_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            "# HELP spots_stage_calls_total Stage calls by outcome.",
+            "# TYPE spots_stage_calls_total counter",
+        ]
+        for stage, (_, count, _, errors) in sorted(stages.items()):
+            lines.append(f'spots_stage_calls_total{{stage="{stage}",outcome="ok"}} {count - errors}')
+            lines.append(f'spots_stage_calls_total{{stage="{stage}",outcome="error"}} {errors}')
+
+        for name in sorted({name for name, _ in counters}):
+            lines += [f"# TYPE spots_{name}_total counter"]
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"spots_{name}_total{{{label_text}}} {value}")
+
+        if caches:
+            lines += [
+                "# HELP spots_cache_hits_total Cache lookups answered from the cache.",
+                "# TYPE spots_cache_hits_total counter",
+            ]
+            lines += [f'spots_cache_hits_total{{cache="{n}"}} {h}' for n, (h, _, _) in sorted(caches.items())]
+            lines += ["# TYPE spots_cache_misses_total counter"]
+            lines += [f'spots_cache_misses_total{{cache="{n}"}} {m}' for n, (_, m, _) in sorted(caches.items())]
+            lines += ["# TYPE spots_cache_hit_ratio gauge"]
+            lines += [
+                f'spots_cache_hit_ratio{{cache="{n}"}} {h / (h + m) if h + m else 0:.4f}'
+                for n, (h, m, _) in sorted(caches.items())
+            ]
+            lines += ["# TYPE spots_cache_entries gauge"]
+            lines += [
+                f'spots_cache_entries{{cache="{n}"}} {size}'
+                for n, (_, _, size) in sorted(caches.items()) if size is not None
+            ]
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def render_prometheus():
+    return metrics.render(cache_stats())
+
+
+def write_metrics_file(path):
+    """Write the metrics atomically (e.g. for node_exporter's textfile collector)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics on host:port from a daemon thread (once per process and port)."""
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            _servers[(host, port)] = server
+    return server
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from utils_parse import Location
+
+
+# -----------------------------
+# QUOTE STORE (append-only, SQLite)
+# -----------------------------
+def lane_point(location):
+    # Location / "ZIP, City, ST" -> "CITY, ST": a lane is the same with or without the ZIP
+    location = Location.parse(location)
+    return f"{location.city.upper()}, {location.state.upper()}"
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8")) if blob is not None else None
+
+
+class QuoteStore:
+    """Every quote priced, kept on disk with its inputs and provider snapshot.
+
+    Rows are only ever inserted. Listing columns (lane, equipment, mode,
+    rates) are plain columns; inputs and the provider snapshot are compressed
+    JSON, read back only by get(). Indexed by time, by (owner, id) for each
+    user's history and by (origin, destination, equipment, time) for the lane
+    lookups.
+    """
+
+    _COLUMNS = (
+        "id, created_at, owner, origin, destination, equipment, pricing_mode, selected_months, customer,"
+        " lane, stops, total_cost, final_rate, markup, markup_source"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            # WAL: several app processes can append while the sidebar reads
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " created_at REAL NOT NULL,"
+                " owner TEXT,"
+                " origin TEXT NOT NULL,"
+                " destination TEXT NOT NULL,"
+                " equipment TEXT NOT NULL,"
+                " pricing_mode TEXT NOT NULL,"
+                " selected_months INTEGER,"
+                " customer TEXT,"
+                " lane TEXT,"
+                " stops INTEGER,"
+                " total_cost REAL,"
+                " final_rate REAL,"
+                " markup REAL,"
+                " markup_source TEXT,"
+                " inputs BLOB,"
+                " snapshot BLOB)"
+            )
+            # Stores created before quotes had an owner: their rows stay unowned
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(quotes)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE quotes ADD COLUMN owner TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS quotes_owner ON quotes (owner, id DESC)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS quotes_lane"
+                " ON quotes (origin, destination, equipment, created_at DESC)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS quotes_created ON quotes (created_at DESC)")
+
+    def add(self, locations, equipment_type, pricing_mode, selected_months, customer, result, snapshot=None,
+            user_markup=None, hotshot_weight_lbs=None, owner=None):
+        """Store one priced quote (a price_lane result without "error") for `owner`; returns its id."""
+        route_data = result["route_data"]
+        inputs = {
+            "locations": [str(location) for location in locations],
+            "equipment_type": equipment_type,
+            "pricing_mode": pricing_mode,
+            "selected_months": selected_months,
+            "customer": customer,
+            "user_markup": user_markup,
+            "hotshot_weight_lbs": hotshot_weight_lbs,
+        }
+        row = (
+            time.time(), owner, lane_point(locations[0]), lane_point(locations[-1]), equipment_type, pricing_mode,
+            selected_months, customer, result["lane_display"], len(locations) - 2,
+            route_data["total_cost"], route_data["final_rate"], result["Mark_up"], result["markup_source"],
+            _pack(inputs), _pack(snapshot) if snapshot is not None else None,
+        )
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO quotes (created_at, owner, origin, destination, equipment, pricing_mode,"
+                " selected_months, customer, lane, stops, total_cost, final_rate, markup, markup_source,"
+                " inputs, snapshot)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+        return cursor.lastrowid
+
+    def recent(self, limit=10, before_id=None, owner=None):
+        """Newest quotes first (only `owner`'s when given), one page at a time.
+
+        Pass the last id of a page as `before_id` to get the next.
+        """
+        query = f"SELECT {self._COLUMNS} FROM quotes"
+        conditions, params = [], []
+        if owner is not None:
+            conditions.append("owner = ?")
+            params.append(owner)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params)]
+
+    def for_lane(self, origin, destination, equipment_type=None, limit=5):
+        """Latest quotes for origin -> destination (any stops in between), optionally one equipment."""
+        query = f"SELECT {self._COLUMNS} FROM quotes WHERE origin = ? AND destination = ?"
+        params = [lane_point(origin), lane_point(destination)]
+        if equipment_type is not None:
+            query += " AND equipment = ?"
+            params.append(equipment_type)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params)]
+
+    def get(self, quote_id):
+        """One quote with its inputs and provider snapshot, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS}, inputs, snapshot FROM quotes WHERE id = ?", (quote_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        quote = dict(row)
+        quote["inputs"] = _unpack(quote["inputs"])
+        quote["snapshot"] = _unpack(quote["snapshot"])
+        return quote
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+
+
+_quote_stores = {}
+_quote_stores_lock = threading.Lock()
+
+
+def get_quote_store(path):
+    store = _quote_stores.get(path)
+    if store is None:
+        with _quote_stores_lock:
+            store = _quote_stores.get(path)
+            if store is None:
+                store = QuoteStore(path)
+                _quote_stores[path] = store
+    return store